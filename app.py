@@ -1,23 +1,53 @@
+import time
+
+_import_started = time.perf_counter()
+
 from flask import Flask, render_template
 from flask_login import LoginManager
 from flask_wtf import CSRFProtect
+from werkzeug.middleware.proxy_fix import ProxyFix
 from views.auth.routes import auth_bp
 from views.main.routes import main_bp
 from views.admin.routes import admin_bp
-from models import User
-from models import db
-from flask_migrate import Migrate, upgrade
 from forms import CSRFProtectForm
+from services.mailer import init_mailer
+from services.identity import init_identity_cache
+from services.sessions import init_sessions
+from services.tokens import init_tokens
+from services.basket import init_basket
+from services.metrics import init_metrics, StartupTimer
+from services.fragments import init_fragment_cache
+from services.http_cache import init_static_caching
+from services.images import init_images
+from services.bulk import init_bulk
+from services.analytics import init_analytics
+from services.ratelimit import init_ratelimit
+from services.idempotency import init_idempotency
+from services.passwords import init_passwords
+from services.database import init_database, init_migrations
+from services.events import init_events
+from services.search import init_search
 
 
 csrf = CSRFProtect()
 
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
 
 
 
-def create_app():
+def create_app(config_overrides=None):
+    startup = StartupTimer(IMPORT_SECONDS)
     app = Flask(__name__)
     app.config.from_object('config.Config')
+    if config_overrides:
+        app.config.update(config_overrides)
+    startup.mark('config')
+
+    # Client IP and scheme from the reverse proxy's X-Forwarded-* headers
+    if app.config.get('PROXY_FIX_X_FOR') or app.config.get('PROXY_FIX_X_PROTO'):
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config.get('PROXY_FIX_X_FOR', 0),
+                                x_proto=app.config.get('PROXY_FIX_X_PROTO', 0))
 
     csrf.init_app(app)
 
@@ -28,26 +58,70 @@ def create_app():
 
 
 
-    # Initialize database
-    db.init_app(app)
-    with app.app_context():
-        # Create tables if not exist
-        db.create_all()
+    # Initialize database (pool sizing and SQLite pragmas from DB_POOL_* / SQLITE_*)
+    # Tables are managed by migrations only: `flask db upgrade`, or `flask init-db` for a new database
+    init_database(app)
+    startup.mark('database')
+
+    # Request latency / SQL query instrumentation, reported at /admin/metrics
+    init_metrics(app)
 
-    # Initialize migrations
-    migrate = Migrate(app, db)
+    # `flask init-db`, plus `flask db` when running from the command line
+    init_migrations(app)
+    startup.mark('migrations')
 
     # Initialize Login Manager
     login_manager = LoginManager()
     login_manager.login_view = 'auth.login'
     login_manager.init_app(app)
 
-    # Load user for Flask-Login
-    @login_manager.user_loader
-    def load_user(user_id):
-        return User.query.get(int(user_id))
+    # Load user for Flask-Login, served from the identity cache when possible
+    init_identity_cache(app)
+
+    # Revocable server-side sessions resolve the Flask-Login id; expired ones are swept
+    init_sessions(app, login_manager)
+
+    # Per-endpoint/blueprint request throttling (429 + Retry-After)
+    init_ratelimit(app)
+
+    # Stored responses replayed to retries carrying the same Idempotency-Key
+    init_idempotency(app)
+
+    # Password hashing on a bounded process pool
+    init_passwords(app)
+    startup.mark('auth')
+
+
+    # Outbound email outbox workers and `flask mail` commands
+    init_mailer(app)
+
+    # Expired invite token sweeper and `flask tokens` commands
+    init_tokens(app)
+
+    # Expired basket seat-hold release worker and `flask basket` commands
+    init_basket(app)
+
+    # Cached dashboard group cards (`group_card` in templates)
+    init_fragment_cache(app)
+
+    # Content-versioned static URLs served with immutable cache headers
+    init_static_caching(app)
+
+    # Group picture thumbnails rendered in a process pool
+    init_images(app)
+
+    # `flask bulk` ban/unban, group import and member recount
+    init_bulk(app)
+
+    # Activity event buffer, hourly/daily rollup worker and `flask analytics` commands
+    init_analytics(app)
 
+    # Live catalog/basket deltas published from change signals, streamed at /events
+    init_events(app)
 
+    # Group search index kept current from group changes, and `flask search reindex`
+    init_search(app)
+    startup.mark('services')
 
     # Register blueprints
     app.register_blueprint(auth_bp)
@@ -59,6 +133,8 @@ def create_app():
     def page_not_found(e):
         return render_template('404.html'), 404
 
+    startup.mark('blueprints')
+    startup.report(app)
     return app
 
 
@@ -66,5 +142,6 @@ def create_app():
 
 
 if __name__ == '__main__':
+    # Development server only; production runs wsgi.py (gunicorn) or asgi.py (uvicorn)
     app = create_app()
     app.run(debug=True, port=8003)
\ No newline at end of file
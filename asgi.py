@@ -0,0 +1,355 @@
+"""
+ASGI entry point.
+
+    uvicorn --factory asgi:create_asgi_app --workers 4
+
+Needs ``asgiref``, an ASGI server such as ``uvicorn`` and an async driver for
+the database (``aiosqlite`` for SQLite, ``asyncpg`` for PostgreSQL; see
+``services/async_db.py``).
+
+The I/O-bound hot paths are served natively on the event loop, so a slow
+database does not pin a thread per waiting client:
+
+    GET  /join/<token>        invite redemption
+    GET  /groups              catalog pages, with conditional GET
+    POST /send_group_links    queue the invite-links email
+    GET  /events              live-update stream, one coroutine per open stream
+
+They still run inside a Flask request context built from the ASGI scope, so the
+session cookie, CSRF check, rate limits, ``url_for`` and templates behave as in
+the WSGI app. Whatever they do not fully handle (anonymous or remember-cookie
+sessions, inactive users, expired or unknown invites, requests with an
+``Idempotency-Key``) and every other route is handed to the regular Flask app
+through asgiref's thread pool.
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+
+from flask import current_app, jsonify, redirect, request, session
+from sqlalchemy import insert
+from werkzeug.exceptions import HTTPException
+
+from app import create_app
+from models import Group, OutboundEmail
+from services.analytics import record_event
+from services.async_db import AsyncDatabase
+from services.background import start_workers
+from services.catalog import catalog_query, serialize_card, split_page
+from services.events import GROUPS_CHANNEL, format_event, get_event_broker, user_channel
+from services.http_cache import validator_from_row, validator_query
+from services.idempotency import HEADER as IDEMPOTENCY_HEADER
+from services.mailer import render_invite_email
+from services.sessions import session_user_query
+from services.tokens import (
+    InviteExpired,
+    build_invite_links,
+    decode_signed_invite,
+    group_url_query,
+    invite_from_row,
+    invite_links_query,
+    invite_query,
+    with_group_url,
+)
+from utililties.decorators import conditional_etag, is_not_modified, set_validators
+
+# Returned by a native handler to pass the request on to the Flask app
+FALLBACK = object()
+
+
+def _environ(scope, body: bytes) -> dict:
+    """Build a WSGI environ from an ASGI HTTP scope and its body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _replay(body: bytes):
+    """``receive`` callable that hands an already-read body to the fallback app."""
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {'type': 'http.disconnect'}
+        sent = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    return receive
+
+
+class AsyncSubscription:
+    """Event subscription feeding an asyncio queue; publishers may push from any thread."""
+
+    def __init__(self, channels, maxsize: int, loop):
+        self.channels = frozenset(channels)
+        self.overflowed = False
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize)
+
+    def push(self, event: str, data: str):
+        self._loop.call_soon_threadsafe(self._put, (event, data))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class AsgiApp:
+    """
+    ASGI application serving a few routes natively and the rest through Flask.
+
+    Args:
+        flask_app (Flask): Application from :func:`app.create_app`.
+    """
+
+    def __init__(self, flask_app):
+        from asgiref.wsgi import WsgiToAsgi
+
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.db = AsyncDatabase(flask_app)
+        self.routes = (
+            ('GET', re.compile(r'^/join/(?P<token>[^/]+)$'), self.join_group),
+            ('GET', re.compile(r'^/groups$'), self.group_catalog),
+            ('POST', re.compile(r'^/send_group_links$'), self.send_group_links),
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] == 'http':
+            if scope['path'] == '/events' and scope['method'] == 'GET':
+                if await self.events(scope, receive, send):
+                    return
+            for method, pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    body = await self._read_body(receive)
+                    response = await self._dispatch(scope, body, handler, match.groupdict())
+                    if response is not FALLBACK:
+                        return await self._send(send, response)
+                    receive = _replay(body)
+                    break
+        await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                start_workers(self.flask_app)
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        return b''.join(chunks)
+
+    async def _dispatch(self, scope, body, handler, params):
+        # before_request hooks (CSRF, rate limits, metrics) run as they would in Flask
+        app = self.flask_app
+        with app.request_context(_environ(scope, body)):
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await handler(**params)
+                    if rv is FALLBACK:
+                        return FALLBACK
+            except HTTPException as e:
+                rv = app.handle_user_exception(e)
+            return app.process_response(app.make_response(rv))
+
+    @staticmethod
+    async def _send(send, response):
+        headers = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.items()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def _session_user(self, conn):
+        """Unbanned user of the session cookie, or None to let Flask-Login decide."""
+        session_id = session.get('_user_id')
+        stmt = session_user_query(session_id) if session_id else None
+        if stmt is None:
+            return None
+        return (await conn.execute(stmt)).first()
+
+    async def events(self, scope, receive, send) -> bool:
+        """
+        Native ``main.events``: stream live updates without holding a thread.
+
+        Returns:
+            bool: False if the request was not handled (no active session user).
+        """
+        app = self.flask_app
+        if not app.config.get('EVENTS_ENABLED', False):
+            return False
+        with app.request_context(_environ(scope, b'')):
+            async with self.db.connect() as conn:
+                user = await self._session_user(conn)
+            if user is None:
+                return False
+            broker = get_event_broker()
+            heartbeat = app.config.get('EVENTS_HEARTBEAT_SECONDS', 15)
+            max_seconds = app.config.get('EVENTS_MAX_STREAM_SECONDS', 300)
+
+        loop = asyncio.get_running_loop()
+        subscription = broker.add(
+            AsyncSubscription((GROUPS_CHANNEL, user_channel(user.id)), broker.queue_size, loop))
+        disconnected = asyncio.ensure_future(self._wait_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+            deadline = loop.time() + max_seconds
+            while not disconnected.done() and loop.time() < deadline:
+                if subscription.overflowed:
+                    chunk = format_event('reset', '{}')
+                    deadline = 0
+                else:
+                    getter = asyncio.ensure_future(subscription.get())
+                    await asyncio.wait({getter, disconnected}, timeout=min(heartbeat, deadline - loop.time()),
+                                       return_when=asyncio.FIRST_COMPLETED)
+                    if disconnected.done():
+                        getter.cancel()
+                        break
+                    if getter.done():
+                        chunk = format_event(*getter.result())
+                    else:
+                        getter.cancel()
+                        chunk = ': keep-alive\n\n'
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            if not disconnected.done():
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            broker.unsubscribe(subscription)
+            disconnected.cancel()
+        return True
+
+    @staticmethod
+    async def _wait_disconnect(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def join_group(self, token):
+        """Native ``main.join_group``: redirect valid invites, fall back otherwise."""
+        try:
+            if '.' in token:
+                invite = decode_signed_invite(token)
+                if invite is not None and invite.url is None:
+                    async with self.db.connect() as conn:
+                        url = (await conn.execute(group_url_query(invite.group_id))).scalar()
+                    invite = with_group_url(invite, url)
+            else:
+                async with self.db.connect() as conn:
+                    invite = invite_from_row((await conn.execute(invite_query(token))).first())
+        except InviteExpired:
+            return FALLBACK
+        if invite is None:
+            return FALLBACK
+        record_event('join', invite.user_id, invite.group_id, flush=False)
+        return redirect(invite.url)
+
+    async def group_catalog(self):
+        """Native ``main.group_catalog``: one catalog page, or 304 if unchanged."""
+        page_size = current_app.config.get('CATALOG_PAGE_SIZE', 24)
+        max_size = current_app.config.get('CATALOG_MAX_PAGE_SIZE', 100)
+        limit = min(max(request.args.get('limit', page_size, type=int), 1), max_size)
+        try:
+            stmt = catalog_query(after=request.args.get('after'), limit=limit)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        async with self.db.connect() as conn:
+            user = await self._session_user(conn)
+            if user is None:
+                return FALLBACK
+            data_tag, last_modified = validator_from_row(Group, (await conn.execute(validator_query(Group))).one())
+            etag = conditional_etag(data_tag, str(user.id))
+            if is_not_modified(etag, last_modified):
+                return set_validators(current_app.response_class(status=304), etag, last_modified)
+            rows = (await conn.execute(stmt)).all()
+
+        rows, next_cursor = split_page(rows, limit)
+        response = jsonify({
+            'success': True,
+            'groups': [serialize_card(row) for row in rows],
+            'next_cursor': next_cursor,
+        })
+        return set_validators(response, etag, last_modified)
+
+    async def send_group_links(self):
+        """Native ``main.send_group_links``: render and queue the email in one transaction."""
+        if request.headers.get(IDEMPOTENCY_HEADER) is not None:
+            # Keyed requests need the stored-response handling of the Flask view
+            return FALLBACK
+        async with self.db.connect() as conn:
+            user = await self._session_user(conn)
+            if user is None:
+                return FALLBACK
+            rows = (await conn.execute(invite_links_query(user.id))).all()
+        links = build_invite_links(user.id, rows)
+        if not links:
+            return FALLBACK
+
+        message = render_invite_email(user, links)
+        async with self.db.begin() as conn:
+            await conn.execute(insert(OutboundEmail).values(**message))
+        return jsonify({'success': True, 'queued': True}), 200
+
+
+def create_asgi_app(config_overrides: dict = None) -> AsgiApp:
+    """
+    Create the Flask app and wrap it for an ASGI server.
+
+    Live updates (``EVENTS_ENABLED``) are on unless the environment turns them off,
+    since streams here cost a coroutine rather than a thread.
+
+    Args:
+        config_overrides (dict): Passed to :func:`app.create_app`.
+
+    Returns:
+        AsgiApp: The ASGI application.
+    """
+    overrides = {'EVENTS_ENABLED': os.environ.get('EVENTS_ENABLED', '1') == '1', **(config_overrides or {})}
+    return AsgiApp(create_app(overrides))
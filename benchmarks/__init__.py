@@ -0,0 +1,5 @@
+"""
+Reproducible benchmarks for the portal's hot endpoints.
+
+Run ``python -m benchmarks.run --help`` for options.
+"""
@@ -0,0 +1,331 @@
+"""
+Benchmark the portal's hot endpoints and print throughput/latency tables.
+
+In-process mode drives the Flask test client against a freshly seeded database:
+
+    python -m benchmarks.run --users 2000 --groups 5000 --tokens 10000 --requests 300
+
+HTTP mode drives an already running server (seeded with ``--seed-only`` against the
+same DATABASE_URL, with the same --users/--groups/--tokens) with concurrent clients.
+Every client logs in, so the server must run without rate limits, and checkouts
+need a checkout limit they cannot reach. Checkouts consume the seeded users'
+baskets, so seed a fresh database for each run:
+
+    python -m benchmarks.run --db sqlite:////tmp/bench.db --seed-only
+    DATABASE_URL=sqlite:////tmp/bench.db RATELIMIT_ENABLED=0 GROUP_CHECKOUT_LIMIT=1000000 \
+        gunicorn -c gunicorn.conf.py wsgi:app &   # or any server
+    python -m benchmarks.run --http http://127.0.0.1:8003 --concurrency 16 --requests 2000
+
+``--json`` writes the results (with the current git commit) and ``--compare`` prints
+the change against a previous results file, so runs can be compared across commits.
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.seed import seed, bench_token, user_email, ADMIN_EMAIL, BENCH_PASSWORD  # noqa: E402
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(name, latencies, wall_seconds, errors=0):
+    """Reduce raw latencies (seconds) to a result row."""
+    values = sorted(latencies)
+    return {
+        'endpoint': name,
+        'requests': len(values),
+        'errors': errors,
+        'throughput_rps': round(len(values) / wall_seconds, 1) if wall_seconds else 0.0,
+        'mean_ms': round(statistics.fmean(values) * 1000, 2) if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+    }
+
+
+def print_table(rows, baseline=None):
+    """Print result rows, with the change against a baseline when given."""
+    base = {row['endpoint']: row for row in (baseline or [])}
+    header = f"{'endpoint':<22}{'reqs':>7}{'err':>5}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if base:
+        header += f"{'Δ p50':>9}{'Δ p95':>9}{'Δ req/s':>9}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        line = (f"{row['endpoint']:<22}{row['requests']:>7}{row['errors']:>5}{row['throughput_rps']:>10}"
+                f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+        old = base.get(row['endpoint'])
+        if old:
+            def delta(key):
+                return f"{(row[key] - old[key]) / old[key] * 100:+.0f}%" if old[key] else 'n/a'
+            line += f"{delta('p50_ms'):>9}{delta('p95_ms'):>9}{delta('throughput_rps'):>9}"
+        print(line)
+
+
+# -- In-process benchmark (Flask test client) --
+
+def _login(client, email):
+    response = client.post('/login', data={'email': email, 'password': BENCH_PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f'Login failed for {email}: {response.status_code}')
+
+
+def _timed(fn, n):
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(n):
+        t0 = time.perf_counter()
+        ok = fn(i)
+        latencies.append(time.perf_counter() - t0)
+        errors += 0 if ok else 1
+    return latencies, time.perf_counter() - started, errors
+
+
+def run_in_process(args):
+    from app import create_app
+    from models import db
+
+    db_url = args.db or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': db_url,
+        'WTF_CSRF_ENABLED': False,
+        'MAIL_WORKER_THREADS': 0,
+        'TOKEN_SWEEP_INTERVAL': 0,
+        # The limit would stop repeated checkouts of the same seeded users
+        'GROUP_CHECKOUT_LIMIT': 10 ** 6,
+        # Every simulated user shares one client IP
+        'RATELIMIT_ENABLED': False,
+    })
+    with app.app_context():
+        seeded = seed(args.users, args.groups, args.tokens)
+    rng = random.Random(args.seed)
+    n = args.requests
+    results = []
+
+    user_client = app.test_client()
+    _login(user_client, user_email(0))
+    admin_client = app.test_client()
+    _login(admin_client, ADMIN_EMAIL)
+
+    # Warm-up so template compilation and connection setup are not measured
+    user_client.get('/dashboard')
+    admin_client.get('/admin/users')
+
+    latencies, wall, errors = _timed(lambda i: user_client.get('/dashboard').status_code == 200, n)
+    results.append(summarize('GET /dashboard', latencies, wall, errors))
+
+    # add_to_basket: add a random group, then remove it untimed so the basket stays small
+    latencies, errors = [], 0
+    for i in range(n):
+        gid = rng.randint(1, args.groups)
+        t0 = time.perf_counter()
+        ok = user_client.post('/add_to_basket', json={'group_id': gid}).status_code == 200
+        latencies.append(time.perf_counter() - t0)
+        errors += 0 if ok else 1
+        user_client.post('/remove_from_basket', json={'group_id': gid})
+    results.append(summarize('POST /add_to_basket', latencies, sum(latencies), errors))
+
+    # checkout: each iteration fills a basket (untimed) for a fresh user and checks it out
+    latencies, errors = [], 0
+    checkout_runs = min(n, args.users - 1)
+    for i in range(checkout_runs):
+        client = app.test_client()
+        _login(client, user_email(i + 1))
+        for gid in rng.sample(range(1, args.groups + 1), k=min(args.basket_size, args.groups)):
+            client.post('/add_to_basket', json={'group_id': gid})
+        t0 = time.perf_counter()
+        ok = client.post('/checkout', json={}).status_code == 200
+        latencies.append(time.perf_counter() - t0)
+        errors += 0 if ok else 1
+    results.append(summarize('POST /checkout', latencies, sum(latencies), errors))
+
+    anon = app.test_client()
+    tokens = seeded['tokens']
+    if tokens:
+        latencies, wall, errors = _timed(
+            lambda i: anon.get(f'/join/{tokens[i % len(tokens)]}').status_code == 302, n)
+        results.append(summarize('GET /join/<token>', latencies, wall, errors))
+
+    latencies, wall, errors = _timed(lambda i: admin_client.get('/admin/users').status_code == 200, n)
+    results.append(summarize('GET /admin/users', latencies, wall, errors))
+    return results
+
+
+# -- HTTP load generator (running server) --
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpSession:
+    """Cookie-keeping urllib client that logs in through the real login form."""
+
+    def __init__(self, base_url, follow_redirects=True):
+        self.base_url = base_url.rstrip('/')
+        handlers = [urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())]
+        if not follow_redirects:
+            handlers.append(_NoRedirect())
+        self.opener = urllib.request.build_opener(*handlers)
+        self.csrf_token = None
+        self.url = None
+
+    def request(self, method, path, data=None, json_body=None):
+        headers = {}
+        body = None
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+            if self.csrf_token:
+                headers['X-CSRFToken'] = self.csrf_token
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode()
+        req = urllib.request.Request(self.base_url + path, data=body, method=method, headers=headers)
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                self.url = response.geturl()
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            self.url = e.geturl()
+            return e.code, e.read()
+
+    def login(self, email):
+        status, page = self.request('GET', '/login')
+        match = re.search(rb'name="csrf_token"[^>]*value="([^"]+)"', page)
+        self.csrf_token = match.group(1).decode() if match else None
+        data = {'email': email, 'password': BENCH_PASSWORD}
+        if self.csrf_token:
+            data['csrf_token'] = self.csrf_token
+        status, _ = self.request('POST', '/login', data=data)
+        # A failed login re-renders or redirects back to /login instead of leaving it
+        if status != 200 or urllib.parse.urlsplit(self.url).path.rstrip('/') == '/login':
+            hint = ' (rate limited: run the server with RATELIMIT_ENABLED=0)' if status == 429 else ''
+            raise RuntimeError(f'Login failed for {email}: {status} at {self.url}{hint}')
+
+
+def _http_checkout(args, session, rng, i):
+    # Fill the basket untimed with groups this user has not bought yet, then time the checkout
+    for j in range(args.basket_size):
+        gid = (i * args.basket_size + j) % args.groups + 1
+        session.request('POST', '/add_to_basket', json_body={'group_id': gid})
+    t0 = time.perf_counter()
+    ok = session.request('POST', '/checkout', json_body={})[0] == 200
+    return ok, time.perf_counter() - t0
+
+
+def run_http(args):
+    scenarios = {
+        'GET /dashboard': lambda s, rng, i: s.request('GET', '/dashboard')[0] == 200,
+        'POST /add_to_basket': lambda s, rng, i: s.request(
+            'POST', '/add_to_basket', json_body={'group_id': rng.randint(1, args.groups)})[0] in (200, 400),
+        'POST /checkout': lambda s, rng, i: _http_checkout(args, s, rng, i),
+        'GET /join/<token>': lambda s, rng, i: s.request(
+            'GET', f'/join/{bench_token(rng.randrange(args.tokens))}')[0] == 302,
+        'GET /admin/users': lambda s, rng, i: s.request('GET', '/admin/users')[0] == 200,
+    }
+    if not args.tokens:
+        del scenarios['GET /join/<token>']
+    results = []
+    for name, scenario in scenarios.items():
+        def worker(index):
+            rng = random.Random(args.seed + index)
+            if 'join' in name:
+                # Anonymous, and the 302 to the group URL is the response being measured
+                session = HttpSession(args.http, follow_redirects=False)
+            else:
+                session = HttpSession(args.http)
+                session.login(ADMIN_EMAIL if 'admin' in name else user_email(index % max(args.users, 1)))
+            latencies, errors = [], 0
+            for i in range(args.requests // args.concurrency):
+                t0 = time.perf_counter()
+                outcome = scenario(session, rng, i)
+                elapsed = time.perf_counter() - t0
+                # Scenarios with untimed setup report their own timing
+                ok, elapsed = outcome if isinstance(outcome, tuple) else (outcome, elapsed)
+                latencies.append(elapsed)
+                errors += 0 if ok else 1
+            return latencies, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            outcomes = list(pool.map(worker, range(args.concurrency)))
+        wall = time.perf_counter() - started
+        latencies = [lat for lats, _ in outcomes for lat in lats]
+        results.append(summarize(name, latencies, wall, sum(err for _, err in outcomes)))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--groups', type=int, default=2000)
+    parser.add_argument('--tokens', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+    parser.add_argument('--basket-size', type=int, default=3, help='Groups per checkout.')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed.')
+    parser.add_argument('--db', help='Database URL (default: a temporary SQLite file).')
+    parser.add_argument('--seed-only', action='store_true', help='Seed --db and exit.')
+    parser.add_argument('--http', help='Base URL of a running server to load-test instead.')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients in HTTP mode.')
+    parser.add_argument('--json', help='Write results to this file.')
+    parser.add_argument('--compare', help='Previous --json output to compare against.')
+    args = parser.parse_args(argv)
+    if args.seed_only and not args.db:
+        parser.error('--seed-only needs --db (the database the server will use)')
+
+    if args.seed_only:
+        from app import create_app
+        from models import db
+        app = create_app({'SQLALCHEMY_DATABASE_URI': args.db, 'MAIL_WORKER_THREADS': 0})
+        with app.app_context():
+            seed(args.users, args.groups, args.tokens)
+        print(f'Seeded {args.db}')
+        return 0
+
+    results = run_http(args) if args.http else run_in_process(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fh:
+            baseline = json.load(fh)['results']
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({
+                'commit': git_commit(),
+                'mode': 'http' if args.http else 'in-process',
+                'params': {k: v for k, v in vars(args).items() if k not in ('json', 'compare')},
+                'results': results,
+            }, fh, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Seed a database with synthetic users, groups and invite tokens for benchmarking.
+"""
+import hashlib
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from models import db, User, Group, InviteToken
+from utils import hash_password
+
+BENCH_PASSWORD = 'benchpass123'
+ADMIN_EMAIL = 'admin@bench.zimbos.org'
+
+
+def user_email(i: int) -> str:
+    """Email address of the i-th seeded (non-admin) user."""
+    return f'user{i}@bench.zimbos.org'
+
+
+def bench_token(i: int) -> str:
+    """Invite token of the i-th seeded token, so HTTP runs can redeem them without the database."""
+    return hashlib.sha256(f'bench-token-{i}'.encode()).hexdigest()[:22]
+
+
+def _insert_batches(model, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(insert(model), rows[start:start + batch_size])
+    db.session.commit()
+
+
+def seed(users: int, groups: int, tokens: int, batch_size: int = 1000, rng_seed: int = 42) -> dict:
+    """
+    Create the schema and insert synthetic data.
+
+    Args:
+        users (int): Number of regular users (one admin is always added).
+        groups (int): Number of groups.
+        tokens (int): Number of unexpired invite tokens.
+        batch_size (int): Rows per bulk insert.
+        rng_seed (int): Seed for reproducible data.
+
+    Returns:
+        dict: ``{'tokens': [...]}`` with the seeded token strings.
+    """
+    rng = random.Random(rng_seed)
+    db.create_all()
+
+    # Hash once: the benchmark measures endpoints, not seeding
+    password = hash_password(BENCH_PASSWORD)
+    user_rows = [{'email': ADMIN_EMAIL, 'password': password, 'name': 'Bench Admin',
+                  'is_active': True, 'role': 'Admin'}]
+    user_rows += [{'email': user_email(i), 'password': password, 'name': f'Bench User {i}',
+                   'is_active': True, 'role': 'User'} for i in range(users)]
+    _insert_batches(User, user_rows, batch_size)
+
+    group_rows = [{'name': f'Bench group {i:06d}', 'url': f'https://chat.example/bench/{i}',
+                   'description': f'Synthetic group number {i}', 'member_count': rng.randint(0, 500)}
+                  for i in range(groups)]
+    _insert_batches(Group, group_rows, batch_size)
+
+    expires = datetime.utcnow() + timedelta(days=1)
+    token_strings = [bench_token(i) for i in range(tokens)]
+    token_rows = [{'user_id': rng.randint(2, users + 1), 'group_id': rng.randint(1, groups),
+                   'token': token, 'expires_at': expires} for token in token_strings]
+    if token_rows:
+        _insert_batches(InviteToken, token_rows, batch_size)
+    return {'tokens': token_strings}
@@ -1,12 +1,152 @@
+import json
 import os
-from mailgun.client import Client
 
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///zimbos_app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Async-driver URL for the ASGI entry point; derived from the URI above when unset
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL')
+    # Connection pool per process (see services/database.py); size it to at least the
+    # server's threads per worker. Recycle/pre-ping only apply to database servers.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') == '1'
+    # SQLite: WAL journaling with synchronous=NORMAL, and how long writers wait on a lock
+    SQLITE_WAL = os.environ.get('SQLITE_WAL', '1') == '1'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
     MAILGUN_API_KEY = os.environ.get('MAILGUN_API_KEY')
     MAILGUN_DOMAIN = os.environ.get('MAILGUN_DOMAIN')
     # Maximum number of groups a user can checkout in one go
     GROUP_CHECKOUT_LIMIT = int(os.environ.get('GROUP_CHECKOUT_LIMIT', 3))
+    # Number of group cards loaded per catalog page on the dashboard
+    CATALOG_PAGE_SIZE = int(os.environ.get('CATALOG_PAGE_SIZE', 24))
+    CATALOG_MAX_PAGE_SIZE = int(os.environ.get('CATALOG_MAX_PAGE_SIZE', 100))
+    # Group search: 'auto' (FTS5 on SQLite when indexed, else LIKE), 'fts5' or 'like'
+    SEARCH_ENGINE = os.environ.get('SEARCH_ENGINE', 'auto')
+    SEARCH_MAX_RESULTS = int(os.environ.get('SEARCH_MAX_RESULTS', 50))
+    SEARCH_RANK_LIMIT = int(os.environ.get('SEARCH_RANK_LIMIT', 1000))
+    # Rows per page in the admin user and group lists
+    ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 50))
+    # Password hashing: werkzeug method string (hashes made with other parameters are
+    # upgraded at login), pool processes (0 = inline), queue bound and wait timeout
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+    # Rate limits per endpoint or blueprint ("<count>/<period>[@ip|@user]"), see
+    # services/ratelimit.py. RATELIMITS_JSON replaces the defaults entirely.
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', '1') != '0'
+    # Number of trusted reverse proxies in front of the app. When set, ProxyFix takes
+    # the client IP (rate limit keys, logs) and scheme from X-Forwarded-For/-Proto;
+    # leave at 0 when clients connect directly, or they can spoof their IP. asgi.py's
+    # native handlers take the client from the server instead (uvicorn --proxy-headers)
+    PROXY_FIX_X_FOR = int(os.environ.get('PROXY_FIX_X_FOR', 0))
+    PROXY_FIX_X_PROTO = int(os.environ.get('PROXY_FIX_X_PROTO', 0))
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
+    RATELIMITS = json.loads(os.environ['RATELIMITS_JSON']) if os.environ.get('RATELIMITS_JSON') else {
+        'auth.login': ['POST 10/minute@ip', 'POST 50/hour@ip'],
+        'auth.register': 'POST 5/minute@ip',
+        'main.add_to_basket': '60/minute',
+        'main.basket': '60/minute',
+        'main.join_group': '30/minute@ip',
+    }
+    # Analytics rollups: worker interval (0 disables), rows per pass, and how long
+    # to wait before counting a row so in-flight transactions are not skipped
+    ANALYTICS_ROLLUP_INTERVAL = int(os.environ.get('ANALYTICS_ROLLUP_INTERVAL', 60))
+    ANALYTICS_BATCH_SIZE = int(os.environ.get('ANALYTICS_BATCH_SIZE', 5000))
+    ANALYTICS_LAG_SECONDS = int(os.environ.get('ANALYTICS_LAG_SECONDS', 5))
+    ANALYTICS_BUFFER_SIZE = int(os.environ.get('ANALYTICS_BUFFER_SIZE', 500))
+    ANALYTICS_EVENT_RETENTION_DAYS = int(os.environ.get('ANALYTICS_EVENT_RETENTION_DAYS', 30))
+    ANALYTICS_HOURLY_RETENTION_DAYS = int(os.environ.get('ANALYTICS_HOURLY_RETENTION_DAYS', 14))
+    # Lifetime of the invite links handed out at checkout
+    INVITE_TOKEN_TTL_MINUTES = int(os.environ.get('INVITE_TOKEN_TTL_MINUTES', 15))
+    # 'db' stores tokens in invite_token; 'signed' issues stateless HMAC-signed tokens
+    INVITE_TOKEN_MODE = os.environ.get('INVITE_TOKEN_MODE', 'db')
+    # Group id -> URL cache used to redeem signed invites (the URL is never in the token)
+    GROUP_URL_CACHE_SIZE = int(os.environ.get('GROUP_URL_CACHE_SIZE', 10000))
+    GROUP_URL_CACHE_TTL = float(os.environ.get('GROUP_URL_CACHE_TTL', 300))
+    # Seat holds on capacity-limited groups: lifetime of a basket hold, and the
+    # background release of expired holds (interval in seconds, 0 disables)
+    BASKET_HOLD_MINUTES = int(os.environ.get('BASKET_HOLD_MINUTES', 10))
+    HOLD_RELEASE_INTERVAL = int(os.environ.get('HOLD_RELEASE_INTERVAL', 30))
+    HOLD_RELEASE_BATCH_SIZE = int(os.environ.get('HOLD_RELEASE_BATCH_SIZE', 500))
+    # Background deletion of expired tokens (interval in seconds, 0 disables)
+    TOKEN_SWEEP_INTERVAL = int(os.environ.get('TOKEN_SWEEP_INTERVAL', 300))
+    TOKEN_SWEEP_BATCH_SIZE = int(os.environ.get('TOKEN_SWEEP_BATCH_SIZE', 1000))
+
+    # Outbound email: transport is one of 'file', 'smtp', 'sendgrid', 'mailgun'
+    SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
+    SENDGRID_DATA_RESIDENCY = os.environ.get('SENDGRID_DATA_RESIDENCY', 'eu')
+    MAIL_TRANSPORT = os.environ.get('MAIL_TRANSPORT', 'sendgrid' if SENDGRID_API_KEY else 'file')
+    MAIL_DEFAULT_SENDER = os.environ.get('MAIL_DEFAULT_SENDER', 'Zimbos Portal <no-reply@zimbos.org>')
+    MAIL_FILE_DIR = os.environ.get('MAIL_FILE_DIR', 'outbox')  # relative to the instance folder
+    SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+    SMTP_PORT = int(os.environ.get('SMTP_PORT', 25))
+    SMTP_USERNAME = os.environ.get('SMTP_USERNAME')
+    SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+    SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', '0') == '1'
+    # Outbox worker pool and retry policy
+    MAIL_WORKER_THREADS = int(os.environ.get('MAIL_WORKER_THREADS', 2))
+    MAIL_POLL_INTERVAL = float(os.environ.get('MAIL_POLL_INTERVAL', 2))
+    MAIL_BATCH_SIZE = int(os.environ.get('MAIL_BATCH_SIZE', 20))
+    MAIL_MAX_ATTEMPTS = int(os.environ.get('MAIL_MAX_ATTEMPTS', 6))
+    MAIL_RETRY_BASE_SECONDS = float(os.environ.get('MAIL_RETRY_BASE_SECONDS', 30))
+    MAIL_RETRY_MAX_SECONDS = float(os.environ.get('MAIL_RETRY_MAX_SECONDS', 3600))
+    # Per-connection timeout of the SMTP transport
+    MAIL_SEND_TIMEOUT = float(os.environ.get('MAIL_SEND_TIMEOUT', 30))
+    # How long a claimed batch stays claimed; never shorter than
+    # MAIL_BATCH_SIZE * MAIL_SEND_TIMEOUT + 60 seconds, which is the default
+    MAIL_LEASE_SECONDS = int(os.environ['MAIL_LEASE_SECONDS']) if os.environ.get('MAIL_LEASE_SECONDS') else None
+
+    # Identity cache for Flask-Login (local LRU + optional shared tier)
+    IDENTITY_CACHE_SIZE = int(os.environ.get('IDENTITY_CACHE_SIZE', 4096))
+    IDENTITY_CACHE_TTL = float(os.environ.get('IDENTITY_CACHE_TTL', 60))
+    # Shared cache backend, e.g. 'memory://' (local stand-in) or 'redis://localhost:6379/0'
+    CACHE_BACKEND_URL = os.environ.get('CACHE_BACKEND_URL')
+    # Login sessions: 'database' (revocable user_session rows behind an LRU) or 'cookie'.
+    # Sessions without "remember me" last SESSION_LIFETIME_HOURS; expired rows are swept
+    SESSION_STORE = os.environ.get('SESSION_STORE', 'database')
+    SESSION_LIFETIME_HOURS = int(os.environ.get('SESSION_LIFETIME_HOURS', 24))
+    SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+    SESSION_CACHE_TTL = float(os.environ.get('SESSION_CACHE_TTL', 30))
+    SESSION_SWEEP_INTERVAL = int(os.environ.get('SESSION_SWEEP_INTERVAL', 3600))
+    SESSION_SWEEP_BATCH_SIZE = int(os.environ.get('SESSION_SWEEP_BATCH_SIZE', 1000))
+    # Responses kept for replay to retries with the same Idempotency-Key (checkout, emails).
+    # Without CACHE_BACKEND_URL they live in each process, so with several gunicorn
+    # workers (WEB_CONCURRENCY > 1) a retry that lands on another worker runs again
+    IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 600))
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 10000))
+    # Live updates over /events (server-sent events). Off by default because under the
+    # sync gunicorn workers every open page holds a request thread for up to
+    # EVENTS_MAX_STREAM_SECONDS; asgi.py turns it on and streams on the event loop
+    EVENTS_ENABLED = os.environ.get('EVENTS_ENABLED', '0') == '1'
+    # The backend fans deltas out to every worker process: unset (this process only),
+    # 'memory://' or 'redis://...'
+    EVENTS_BACKEND_URL = os.environ.get('EVENTS_BACKEND_URL')
+    EVENTS_QUEUE_SIZE = int(os.environ.get('EVENTS_QUEUE_SIZE', 100))
+    EVENTS_HEARTBEAT_SECONDS = float(os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+    # Streams are closed after this long and the browser reconnects
+    EVENTS_MAX_STREAM_SECONDS = float(os.environ.get('EVENTS_MAX_STREAM_SECONDS', 300))
+
+    # Request/SQL instrumentation exposed at /admin/metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    # Same statement repeated this many times in one request is flagged as N+1
+    METRICS_N_PLUS_ONE_THRESHOLD = int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', 5))
+
+    # Rendered dashboard group cards (entries, seconds)
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))
+    FRAGMENT_CACHE_TTL = float(os.environ.get('FRAGMENT_CACHE_TTL', 300))
+
+    # Group picture pipeline (thumbnails with the group name drawn on)
+    IMAGE_SIZES = tuple(int(w) for w in os.environ.get('IMAGE_SIZES', '320,640').split(','))
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', 'cache/images')  # relative to static/
+    IMAGE_FONT_PATH = os.environ.get('IMAGE_FONT_PATH')
+    # Picture shared by groups without their own (relative to static/)
+    GROUP_DEFAULT_PICTURE = os.environ.get('GROUP_DEFAULT_PICTURE', 'uploads/default-group.jpg')
+    # Local directory standing in for S3: s3://bucket/key -> <dir>/bucket/key
+    S3_STAND_IN_DIR = os.environ.get('S3_STAND_IN_DIR')
@@ -2,8 +2,9 @@
 WTForms definitions for user authentication, settings, and admin group management.
 """
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, URLField, IntegerField
-from wtforms.validators import DataRequired, Email, EqualTo, Length, URL, Optional, NumberRange
+from wtforms.validators import DataRequired, Email, EqualTo, Length, URL, Optional, NumberRange, Regexp
 
 class RegistrationForm(FlaskForm):
     """
@@ -39,8 +40,14 @@ class GroupForm(FlaskForm):
     name = StringField('Group Name', validators=[DataRequired(), Length(max=120)])
     url = URLField('Group URL', validators=[DataRequired(), URL(), Length(max=255)])
     description = TextAreaField('Description', validators=[Optional(), Length(max=2000)])
+    tags = StringField('Tags (comma-separated)', validators=[Optional(), Length(max=255)])
     picture_filename = StringField('Picture Filename', validators=[Optional(), Length(max=255)])
+    picture = FileField('Upload Picture', validators=[Optional(), FileAllowed(['jpg', 'jpeg', 'png', 'webp', 'gif'], 'Images only.')])
+    picture_url = StringField('Picture URL (S3 or HTTP)', validators=[
+        Optional(), Length(max=512), Regexp(r'^(s3|https?)://\S+$', message='Use an s3:// or http(s):// URL.')
+    ])
     member_count = IntegerField('Member Count', validators=[Optional(), NumberRange(min=0)])
+    capacity = IntegerField('Capacity (blank for unlimited)', validators=[Optional(), NumberRange(min=0)])
     submit = SubmitField('Save Group')
 
 
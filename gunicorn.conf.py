@@ -0,0 +1,42 @@
+"""
+Gunicorn settings for ``gunicorn -c gunicorn.conf.py wsgi:app``.
+
+The app is preloaded in the master, which then freezes its objects out of the
+garbage collector so forked workers keep sharing those pages. Each worker drops
+the database connections and process pools it inherited (``post_fork``).
+Everything can be overridden with ``GUNICORN_*`` environment variables or on the
+command line.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8003')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+# Keep DB_POOL_SIZE >= threads so request threads never wait for a connection.
+# With EVENTS_ENABLED=1 every open /events stream holds one of these threads for up
+# to EVENTS_MAX_STREAM_SECONDS, so a worker with 4 threads stalls at 4 open tabs;
+# serve live updates from asgi.py instead, or size threads for the open pages
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+# Recycle workers now and then to bound slow leaks; jitter avoids restarting them together
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-')
+
+
+def pre_fork(server, worker):
+    # Objects allocated while preloading are never collected, so the collector
+    # does not touch (and copy) their pages in every worker
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    from wsgi import app
+    from services.database import after_fork
+
+    after_fork(app)
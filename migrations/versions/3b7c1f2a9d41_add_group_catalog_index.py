@@ -0,0 +1,26 @@
+"""Add (name, id) index on group for keyset-paginated catalog
+
+Revision ID: 3b7c1f2a9d41
+Revises: 9e8036c1a411
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7c1f2a9d41'
+down_revision = '9e8036c1a411'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.create_index('ix_group_name_id', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_index('ix_group_name_id')
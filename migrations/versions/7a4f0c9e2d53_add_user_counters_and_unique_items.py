@@ -0,0 +1,54 @@
+"""Add basket/purchase counters on user and unique (user_id, group_id) item constraints
+
+Revision ID: 7a4f0c9e2d53
+Revises: 5d2e8a7c4b10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4f0c9e2d53'
+down_revision = '5d2e8a7c4b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop duplicate rows left by the old check-then-insert code so the
+    # unique constraints can be created; the oldest row of each pair is kept
+    for table in ('basket_item', 'purchased_item'):
+        op.execute(
+            f'DELETE FROM {table} WHERE id NOT IN '
+            f'(SELECT MIN(id) FROM {table} GROUP BY user_id, group_id)'
+        )
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('basket_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('purchase_count', sa.Integer(), nullable=False, server_default='0'))
+
+    op.execute(
+        'UPDATE "user" SET '
+        'basket_count = (SELECT COUNT(*) FROM basket_item WHERE basket_item.user_id = "user".id), '
+        'purchase_count = (SELECT COUNT(*) FROM purchased_item WHERE purchased_item.user_id = "user".id)'
+    )
+
+    with op.batch_alter_table('basket_item', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_basket_item_user_group', ['user_id', 'group_id'])
+
+    with op.batch_alter_table('purchased_item', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_purchased_item_user_group', ['user_id', 'group_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('purchased_item', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_purchased_item_user_group', type_='unique')
+
+    with op.batch_alter_table('basket_item', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_basket_item_user_group', type_='unique')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('purchase_count')
+        batch_op.drop_column('basket_count')
@@ -0,0 +1,28 @@
+"""Add invite_token indexes for active-link lookups and the expiry sweeper
+
+Revision ID: 8c1d3e5f7a20
+Revises: 7a4f0c9e2d53
+Create Date: 2026-10-18 10:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d3e5f7a20'
+down_revision = '7a4f0c9e2d53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('invite_token', schema=None) as batch_op:
+        batch_op.create_index('ix_invite_token_user_expires', ['user_id', 'expires_at'], unique=False)
+        batch_op.create_index('ix_invite_token_expires_at', ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('invite_token', schema=None) as batch_op:
+        batch_op.drop_index('ix_invite_token_expires_at')
+        batch_op.drop_index('ix_invite_token_user_expires')
@@ -0,0 +1,28 @@
+"""Add picture_url and image_key to group for the picture pipeline
+
+Revision ID: a3e5c7d9f1b2
+Revises: 9f2b6d8e1c34
+Create Date: 2026-10-18 11:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3e5c7d9f1b2'
+down_revision = '9f2b6d8e1c34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('picture_url', sa.String(length=512), nullable=True))
+        batch_op.add_column(sa.Column('image_key', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_column('image_key')
+        batch_op.drop_column('picture_url')
@@ -0,0 +1,44 @@
+"""Add group capacity and seat counters, and basket item holds
+
+Revision ID: a9e1c3d5f7b8
+Revises: f8d0b2c4e6a7
+Create Date: 2026-10-18 18:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e1c3d5f7b8'
+down_revision = 'f8d0b2c4e6a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('capacity', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('seats_held', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('seats_sold', sa.Integer(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('basket_item', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hold_expires_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_basket_item_hold_expires_at', ['hold_expires_at'], unique=False)
+
+    # Existing purchases count as sold seats; no group has a capacity yet, so nothing is held
+    op.execute(
+        'UPDATE "group" SET seats_sold = '
+        '(SELECT count(*) FROM purchased_item WHERE purchased_item.group_id = "group".id)'
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('basket_item', schema=None) as batch_op:
+        batch_op.drop_index('ix_basket_item_hold_expires_at')
+        batch_op.drop_column('hold_expires_at')
+
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_column('seats_sold')
+        batch_op.drop_column('seats_held')
+        batch_op.drop_column('capacity')
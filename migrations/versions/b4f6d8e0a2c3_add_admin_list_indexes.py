@@ -0,0 +1,34 @@
+"""Add indexes for admin list search and sorting
+
+Revision ID: b4f6d8e0a2c3
+Revises: a3e5c7d9f1b2
+Create Date: 2026-10-18 12:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4f6d8e0a2c3'
+down_revision = 'a3e5c7d9f1b2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_name', ['name'], unique=False)
+        batch_op.create_index('ix_user_role', ['role'], unique=False)
+
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.create_index('ix_group_member_count', ['member_count'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_index('ix_group_member_count')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_role')
+        batch_op.drop_index('ix_user_name')
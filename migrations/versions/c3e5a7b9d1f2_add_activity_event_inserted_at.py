@@ -0,0 +1,32 @@
+"""Add activity_event.inserted_at for the rollup lag
+
+Revision ID: c3e5a7b9d1f2
+Revises: b2d4f6a8c0e1
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e5a7b9d1f2'
+down_revision = 'b2d4f6a8c0e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('activity_event', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('inserted_at', sa.DateTime(), nullable=True))
+
+    # Existing rows were flushed long ago; their event time is close enough
+    op.execute('UPDATE activity_event SET inserted_at = created_at')
+
+    with op.batch_alter_table('activity_event', schema=None) as batch_op:
+        batch_op.alter_column('inserted_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('activity_event', schema=None) as batch_op:
+        batch_op.drop_column('inserted_at')
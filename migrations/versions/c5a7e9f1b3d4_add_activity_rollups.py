@@ -0,0 +1,64 @@
+"""Add activity events, hourly/daily rollups and rollup watermarks
+
+Revision ID: c5a7e9f1b3d4
+Revises: b4f6d8e0a2c3
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a7e9f1b3d4'
+down_revision = 'b4f6d8e0a2c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'activity_event',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('kind', sa.String(length=16), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    with op.batch_alter_table('activity_event', schema=None) as batch_op:
+        batch_op.create_index('ix_activity_event_created_at', ['created_at'], unique=False)
+
+    op.create_table(
+        'activity_rollup',
+        sa.Column('granularity', sa.String(length=5), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('group_id', sa.Integer(), nullable=False),
+        sa.Column('basket_adds', sa.Integer(), nullable=False),
+        sa.Column('checkouts', sa.Integer(), nullable=False),
+        sa.Column('joins', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('granularity', 'bucket', 'group_id'),
+    )
+    op.create_table(
+        'active_user_rollup',
+        sa.Column('granularity', sa.String(length=5), nullable=False),
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('granularity', 'bucket', 'user_id'),
+    )
+    op.create_table(
+        'rollup_watermark',
+        sa.Column('source', sa.String(length=32), nullable=False),
+        sa.Column('last_id', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('source'),
+    )
+
+
+def downgrade():
+    op.drop_table('rollup_watermark')
+    op.drop_table('active_user_rollup')
+    op.drop_table('activity_rollup')
+    with op.batch_alter_table('activity_event', schema=None) as batch_op:
+        batch_op.drop_index('ix_activity_event_created_at')
+
+    op.drop_table('activity_event')
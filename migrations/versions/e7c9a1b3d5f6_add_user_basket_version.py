@@ -0,0 +1,26 @@
+"""Add basket_version to user for batched basket updates
+
+Revision ID: e7c9a1b3d5f6
+Revises: d6b8f0a2c4e5
+Create Date: 2026-10-18 13:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c9a1b3d5f6'
+down_revision = 'd6b8f0a2c4e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('basket_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('basket_version')
@@ -0,0 +1,41 @@
+"""Add group tags and the group_search FTS5 index (SQLite)
+
+Revision ID: f8d0b2c4e6a7
+Revises: e7c9a1b3d5f6
+Create Date: 2026-10-18 16:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f8d0b2c4e6a7'
+down_revision = 'e7c9a1b3d5f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tags', sa.String(length=255), nullable=True))
+
+    # Other databases search with LIKE and need no index
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS group_search USING fts5("
+        "name, description, tags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    op.execute(
+        "INSERT INTO group_search (rowid, name, description, tags) "
+        "SELECT id, name, coalesce(description, ''), '' FROM \"group\""
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS group_search')
+
+    with op.batch_alter_table('group', schema=None) as batch_op:
+        batch_op.drop_column('tags')
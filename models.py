@@ -1,6 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+from sqlalchemy import or_
+from sqlalchemy.ext.hybrid import hybrid_property
 
 db = SQLAlchemy()
 
@@ -18,18 +20,32 @@ class User(UserMixin, db.Model):
         name (str): Display name of the user.
         phone (str): Contact phone number.
         is_active (bool): Whether the user has confirmed email.
+        is_blacklisted (bool): Set when the user is banned.
+        is_banned (bool): Banned or deactivated; the single check used to refuse logins and sessions.
         is_admin (bool): Whether the user has admin privileges.
+        basket_count (int): Number of BasketItem rows, maintained with each basket change.
+        purchase_count (int): Number of PurchasedItem rows, maintained at checkout.
+        basket_version (int): Incremented on every basket change; returned to clients.
+        updated_at (datetime): Last modification time.
         basket_items (list): Relationship to BasketItem entries.
         purchased_items (list): Relationship to PurchasedItem entries.
     """
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password = db.Column(db.String(128), nullable=False)
+    # werkzeug scrypt hashes are ~160 characters
+    password = db.Column(db.String(255), nullable=False)
     name = db.Column(db.String(100))
     phone = db.Column(db.String(20))
     is_active = db.Column(db.Boolean, default=False)
     is_blacklisted = db.Column(db.Boolean, default=False)
     role = db.Column(db.String(20), default='User')
+    # Denormalised counters so the checkout limit is a single conditional UPDATE
+    basket_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    purchase_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Optimistic concurrency token for batched basket updates
+    basket_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped on every change; drives ETag/Last-Modified of the admin user list
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Items currently in the user's basket
     basket_items = db.relationship('BasketItem', backref='user', lazy=True)
@@ -37,6 +53,26 @@ class User(UserMixin, db.Model):
     # Items the user has already purchased
     purchased_items = db.relationship('PurchasedItem', backref='user', lazy=True)
 
+    # Prefix search and sorting in the admin user list
+    __table_args__ = (
+        db.Index('ix_user_name', 'name'),
+        db.Index('ix_user_role', 'role'),
+    )
+
+    @hybrid_property
+    def is_banned(self):
+        return bool(self.is_blacklisted) or not self.is_active
+
+    @is_banned.inplace.expression
+    @classmethod
+    def _is_banned_expression(cls):
+        return or_(cls.is_blacklisted.is_(True), cls.is_active.isnot(True))
+
+    def get_id(self):
+        # With server-side sessions Flask-Login keeps the session id, not the user id
+        # (services/sessions.py); both cookies then stop working once it is revoked
+        return getattr(self, 'session_id', None) or str(self.id)
+
     def __repr__(self):
         return f"<User {self.id} {self.email}>"
 
@@ -49,8 +85,15 @@ class Group(db.Model):
         name (str): Name of the group.
         url (str): URL link for the group.
         description (str): Text description of the group.
+        tags (str): Normalised comma-separated tags ("music,study group"), used by search.
         picture_filename (str): Filename for the group's image.
+        picture_url (str): S3 or HTTP link used instead of an uploaded picture.
+        image_key (str): Content key of the rendered thumbnails with the name overlay.
         member_count (int): Number of times the group URL has been used.
+        capacity (int): Maximum number of seats, or None for an unlimited group.
+        seats_held (int): Seats reserved by unexpired basket holds.
+        seats_sold (int): Seats taken by purchases.
+        updated_at (datetime): Last modification time.
         basket_items (list): Relationship to BasketItem entries.
         purchased_items (list): Relationship to PurchasedItem entries.
     """
@@ -58,14 +101,40 @@ class Group(db.Model):
     name = db.Column(db.String(120), nullable=False)
     url = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text)
+    tags = db.Column(db.String(255))
     picture_filename = db.Column(db.String(255))
+    picture_url = db.Column(db.String(512))
+    # Content key of the pre-rendered thumbnails (services/images.py), None until built
+    image_key = db.Column(db.String(64))
     member_count = db.Column(db.Integer, default=0)
+    # Seat counters, moved only by conditional UPDATEs in services/basket.py and
+    # services/checkout.py so that seats_held + seats_sold never exceeds capacity
+    capacity = db.Column(db.Integer)
+    seats_held = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    seats_sold = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped on every change; drives ETag/Last-Modified of catalog responses
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Keyset pagination on the dashboard walks groups in (name, id) order
+    __table_args__ = (
+        db.Index('ix_group_name_id', 'name', 'id'),
+        # Sorting by popularity in the admin group list
+        db.Index('ix_group_member_count', 'member_count'),
+    )
+
     # Items currently in baskets
     basket_items = db.relationship('BasketItem', backref='group', lazy=True)
 
     # Items that have been purchased
     purchased_items = db.relationship('PurchasedItem', backref='group', lazy=True)
 
+    @property
+    def seats_left(self):
+        """Seats still available, or None if the group has no capacity."""
+        if self.capacity is None:
+            return None
+        return max(self.capacity - (self.seats_held or 0) - (self.seats_sold or 0), 0)
+
     def __repr__(self):
         return f"<Group {self.id} {self.name}>"
 
@@ -78,10 +147,19 @@ class BasketItem(db.Model):
         id (int): Primary key.
         user_id (int): Foreign key to the User model.
         group_id (int): Foreign key to the Group model.
+        hold_expires_at (datetime): When the seat held for this item is released,
+            or None if the group has no capacity (nothing is held).
     """
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'), nullable=False)
+    hold_expires_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'group_id', name='uq_basket_item_user_group'),
+        # The hold release worker scans for expired holds
+        db.Index('ix_basket_item_hold_expires_at', 'hold_expires_at'),
+    )
 
     def __repr__(self):
         return f"<BasketItem {self.id} User:{self.user_id} Group:{self.group_id}>"
@@ -101,6 +179,10 @@ class PurchasedItem(db.Model):
     group_id = db.Column(db.Integer, db.ForeignKey('group.id'))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'group_id', name='uq_purchased_item_user_group'),
+    )
+
     def __repr__(self):
         return f"<PurchasedItem {self.id} User:{self.user_id} Group:{self.group_id}>"
 
@@ -114,8 +196,164 @@ class InviteToken(db.Model):
     token = db.Column(db.String(64), unique=True, nullable=False)
     expires_at = db.Column(db.DateTime, nullable=False)
 
+    __table_args__ = (
+        # Active links of a user, and the expiry sweeper's range scan
+        db.Index('ix_invite_token_user_expires', 'user_id', 'expires_at'),
+        db.Index('ix_invite_token_expires_at', 'expires_at'),
+    )
+
     user = db.relationship('User', backref='invite_tokens', lazy=True)
     group = db.relationship('Group', backref='invite_tokens', lazy=True)
 
     def __repr__(self):
         return f"<InviteToken {self.token} User:{self.user_id} Group:{self.group_id}>"
+
+
+class OutboundEmail(db.Model):
+    """
+    Durable outbox entry for an email waiting to be delivered by the mail workers.
+
+    Attributes:
+        id (int): Primary key.
+        to_email (str): Recipient address.
+        subject (str): Subject line.
+        text_body (str): Plain-text body.
+        html_body (str): HTML body.
+        status (str): One of 'pending', 'sending', 'sent' or 'dead'.
+        attempts (int): Number of delivery attempts made so far.
+        next_attempt_at (datetime): Earliest time the message may be (re)claimed.
+        claimed_by (str): Token of the worker batch currently holding the message.
+        last_error (str): Error from the most recent failed attempt.
+        created_at (datetime): When the message was enqueued.
+        sent_at (datetime): When the message was delivered.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    to_email = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    text_body = db.Column(db.Text)
+    html_body = db.Column(db.Text)
+    status = db.Column(db.String(10), nullable=False, default='pending')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_by = db.Column(db.String(32))
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    # Workers poll for due messages by (status, next_attempt_at)
+    __table_args__ = (
+        db.Index('ix_outbound_email_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f"<OutboundEmail {self.id} {self.to_email} {self.status}>"
+
+
+class ActivityEvent(db.Model):
+    """
+    Raw activity not otherwise recorded: basket adds, invite joins and logins.
+
+    Written in batches from an in-process buffer (services/analytics.py) and
+    folded into the rollup tables; processed rows are pruned after a retention period.
+
+    Attributes:
+        id (int): Primary key, used as the rollup watermark.
+        kind (str): One of 'basket_add', 'join' or 'login'.
+        user_id (int): Acting user, if known.
+        group_id (int): Group involved, if any.
+        created_at (datetime): When the event happened.
+        inserted_at (datetime): When the buffer flush wrote the row; the rollup lag
+            applies to this, since buffered events can be much older than their row.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(16), nullable=False)
+    user_id = db.Column(db.Integer)
+    group_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    inserted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_activity_event_created_at', 'created_at'),
+    )
+
+    def __repr__(self):
+        return f"<ActivityEvent {self.id} {self.kind} User:{self.user_id} Group:{self.group_id}>"
+
+
+class ActivityRollup(db.Model):
+    """
+    Per-group activity counts for one hour or one day.
+
+    Attributes:
+        granularity (str): 'hour' or 'day'.
+        bucket (datetime): Start of the hour or day (UTC).
+        group_id (int): The group.
+        basket_adds (int): Times the group was added to a basket.
+        checkouts (int): Purchases of the group.
+        joins (int): Invite links redeemed for the group.
+    """
+    granularity = db.Column(db.String(5), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    group_id = db.Column(db.Integer, primary_key=True)
+    basket_adds = db.Column(db.Integer, nullable=False, default=0)
+    checkouts = db.Column(db.Integer, nullable=False, default=0)
+    joins = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ActivityRollup {self.granularity} {self.bucket} Group:{self.group_id}>"
+
+
+class ActiveUserRollup(db.Model):
+    """
+    One row per user active in an hour or day; counting rows gives active users.
+
+    Attributes:
+        granularity (str): 'hour' or 'day'.
+        bucket (datetime): Start of the hour or day (UTC).
+        user_id (int): The active user.
+    """
+    granularity = db.Column(db.String(5), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+
+    def __repr__(self):
+        return f"<ActiveUserRollup {self.granularity} {self.bucket} User:{self.user_id}>"
+
+
+class RollupWatermark(db.Model):
+    """
+    Highest source row id already folded into the rollups, per source table.
+
+    Attributes:
+        source (str): 'purchase' or 'event'.
+        last_id (int): Rows with a greater id are still to be processed.
+    """
+    source = db.Column(db.String(32), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<RollupWatermark {self.source} {self.last_id}>"
+
+
+class UserSession(db.Model):
+    """
+    Server-side login session, referenced from the signed session and remember cookies.
+
+    Attributes:
+        id (str): Random session id.
+        user_id (int): The logged-in user.
+        expires_at (datetime): When the session ends; swept afterwards.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        # Revoking every session of banned users
+        db.Index('ix_user_session_user_id', 'user_id'),
+        # The expired-session sweeper
+        db.Index('ix_user_session_expires_at', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f"<UserSession {self.id[:8]} User:{self.user_id}>"
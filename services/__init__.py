@@ -0,0 +1,3 @@
+"""
+Service layer shared by the blueprints (queries, transactions and background work).
+"""
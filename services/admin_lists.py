@@ -0,0 +1,133 @@
+"""
+Queries behind the admin user and group lists: search, sorting and streaming exports.
+
+Searches are case-sensitive prefix matches written as ranges
+(``col >= 'term' AND col < 'tern'``), which every backend can answer from the
+plain indexes on ``user.email``, ``user.name``, ``user.role`` and
+``group.name``. ``LIKE 'term%'`` would not: SQLite only uses an index for it
+without ESCAPE and with a collation matching ``case_sensitive_like``, and
+PostgreSQL needs ``text_pattern_ops`` outside the C locale. Exports iterate
+with ``yield_per`` and are written out row by row, so memory use does not grow
+with the number of rows exported.
+"""
+import csv
+import io
+import json
+
+from sqlalchemy import and_, or_, select
+
+from models import db, User, Group, PurchasedItem
+
+USER_SORTS = {'id': User.id, 'email': User.email, 'name': User.name, 'role': User.role}
+GROUP_SORTS = {'id': Group.id, 'name': Group.name, 'members': Group.member_count}
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def _prefix(column, term: str):
+    # Strings starting with term sort between term and term with its last character bumped
+    if term[-1] == chr(0x10FFFF):
+        return column >= term
+    return and_(column >= term, column < term[:-1] + chr(ord(term[-1]) + 1))
+
+
+def _user_search(q: str):
+    return or_(_prefix(User.email, q), _prefix(User.name, q), User.role == q)
+
+
+def _ordered(stmt, sorts, sort, direction):
+    column = sorts.get(sort, sorts['id'])
+    order = column.desc() if direction == 'desc' else column.asc()
+    # Tie-break on id so pages are stable
+    return stmt.order_by(order, sorts['id'].asc()) if column is not sorts['id'] else stmt.order_by(order)
+
+
+def user_list_query(q: str = '', sort: str = 'id', direction: str = 'asc'):
+    """
+    Build the select for the admin user list.
+
+    Args:
+        q (str): Case-sensitive prefix of the email or name, or an exact role.
+        sort (str): One of ``USER_SORTS``.
+        direction (str): 'asc' or 'desc'.
+
+    Returns:
+        Select: Statement suitable for ``db.paginate``.
+    """
+    stmt = select(User)
+    if q:
+        stmt = stmt.where(_user_search(q))
+    return _ordered(stmt, USER_SORTS, sort, direction)
+
+
+def group_list_query(q: str = '', sort: str = 'name', direction: str = 'asc'):
+    """
+    Build the select for the admin group list.
+
+    Args:
+        q (str): Case-sensitive prefix of the group name.
+        sort (str): One of ``GROUP_SORTS``.
+        direction (str): 'asc' or 'desc'.
+
+    Returns:
+        Select: Statement suitable for ``db.paginate``.
+    """
+    stmt = select(Group)
+    if q:
+        stmt = stmt.where(_prefix(Group.name, q))
+    return _ordered(stmt, GROUP_SORTS, sort, direction)
+
+
+def _stream_rows(stmt):
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    for row in result:
+        yield row._asdict()
+
+
+def user_export_rows(q: str = ''):
+    """Yield every matching user as a dict (no password hashes)."""
+    stmt = select(
+        User.id, User.email, User.name, User.phone, User.role, User.is_active,
+        User.is_blacklisted, User.basket_count, User.purchase_count,
+    ).order_by(User.id)
+    if q:
+        stmt = stmt.where(_user_search(q))
+    return _stream_rows(stmt)
+
+
+def purchase_export_rows():
+    """Yield the full purchase history joined with user email and group name."""
+    stmt = (
+        select(
+            PurchasedItem.id, PurchasedItem.timestamp, PurchasedItem.user_id, User.email.label('user_email'),
+            PurchasedItem.group_id, Group.name.label('group_name'),
+        )
+        .join(User, User.id == PurchasedItem.user_id)
+        .outerjoin(Group, Group.id == PurchasedItem.group_id)
+        .order_by(PurchasedItem.id)
+    )
+    return _stream_rows(stmt)
+
+
+def encode_csv(rows):
+    """Yield CSV text chunks (header first) for an iterable of dicts."""
+    buffer = io.StringIO()
+    writer = None
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row))
+            writer.writeheader()
+        writer.writerow(row)
+        # Flush in ~64KB chunks rather than per row
+        if buffer.tell() > 65536:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_jsonl(rows):
+    """Yield one JSON document per line for an iterable of dicts."""
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
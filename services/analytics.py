@@ -0,0 +1,427 @@
+"""
+Activity analytics: buffered event capture and incremental hourly/daily rollups.
+
+Sources:
+
+    purchase    ``purchased_item`` rows (checkouts), read directly.
+    event       ``activity_event`` rows (basket adds, invite joins, logins), written
+                in batches from a per-process buffer so the request path never
+                waits on an extra INSERT.
+
+The rollup job reads each source in id order from its ``rollup_watermark``, adds
+the counts into ``activity_rollup`` / ``active_user_rollup`` with upserts and
+advances the watermark in the same transaction, so every row is counted exactly
+once. The watermark is advanced with a conditional UPDATE; if two workers race,
+the loser rolls back. Rows written less than ``ANALYTICS_LAG_SECONDS`` ago are left
+for the next run so that ids still being committed by other transactions are not
+skipped. For events that is measured from ``inserted_at``, stamped when the buffer
+is flushed, not from ``created_at``: an event may wait in a buffer for a whole
+``ANALYTICS_ROLLUP_INTERVAL`` before its row is written.
+
+Buffered events not yet flushed are lost if the process dies; the buffer is
+flushed when it reaches ``ANALYTICS_BUFFER_SIZE`` and on every worker run.
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import (
+    db, Group, PurchasedItem, ActivityEvent, ActivityRollup, ActiveUserRollup, RollupWatermark,
+)
+from services.background import BackgroundWorker, register_worker
+
+GRANULARITIES = ('hour', 'day')
+
+# activity_event.kind -> activity_rollup counter column
+EVENT_COUNTERS = {'basket_add': 'basket_adds', 'join': 'joins'}
+
+
+def _bucket(ts: datetime, granularity: str) -> datetime:
+    if granularity == 'hour':
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class EventBuffer:
+    """
+    Thread-safe in-memory buffer of activity events, written with one executemany INSERT.
+
+    Args:
+        max_size (int): Flush from the recording request once this many events are queued.
+    """
+
+    def __init__(self, max_size: int = 500):
+        self.max_size = max_size
+        self._events = []
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, user_id=None, group_id=None, flush: bool = True):
+        """Queue an event; flushes inline when the buffer is full unless ``flush`` is False."""
+        with self._lock:
+            self._events.append({
+                'kind': kind, 'user_id': user_id, 'group_id': group_id, 'created_at': datetime.utcnow(),
+            })
+            full = len(self._events) >= self.max_size
+        if full and flush:
+            self.flush()
+
+    def flush(self) -> int:
+        """
+        Write all queued events in one statement.
+
+        Returns:
+            int: Number of events written.
+        """
+        with self._lock:
+            events, self._events = self._events, []
+        if not events:
+            return 0
+        inserted_at = datetime.utcnow()
+        for event in events:
+            event['inserted_at'] = inserted_at
+        # Use a separate connection so the caller's session transaction is untouched
+        with db.engine.begin() as conn:
+            conn.execute(insert(ActivityEvent), events)
+        return len(events)
+
+
+def record_event(kind: str, user_id=None, group_id=None, flush: bool = True):
+    """
+    Record a basket add, invite join or login for the analytics rollups.
+
+    Args:
+        kind (str): 'basket_add', 'join' or 'login'.
+        user_id (int, optional): Acting user.
+        group_id (int, optional): Group involved.
+        flush (bool): Allow a blocking flush when the buffer is full; async
+            callers pass False and leave it to the rollup worker.
+    """
+    buffer = current_app.extensions.get('analytics_buffer')
+    if buffer is not None:
+        buffer.record(kind, user_id, group_id, flush=flush)
+
+
+def flush_events() -> int:
+    """Flush this process's event buffer (no-op when analytics is not initialised)."""
+    buffer = current_app.extensions.get('analytics_buffer')
+    return buffer.flush() if buffer is not None else 0
+
+
+def _upsert(model, rows, keys, counters=()):
+    """
+    Insert rows, adding ``counters`` onto existing rows with the same ``keys``.
+
+    Uses ``INSERT ... ON CONFLICT`` on SQLite and PostgreSQL, and UPDATE-then-INSERT elsewhere.
+    """
+    if not rows:
+        return
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(model)
+        if counters:
+            stmt = stmt.on_conflict_do_update(
+                index_elements=list(keys),
+                set_={c: getattr(model, c) + getattr(stmt.excluded, c) for c in counters},
+            )
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=list(keys))
+        db.session.execute(stmt, rows)
+        return
+
+    for row in rows:
+        match = and_(*(getattr(model, k) == row[k] for k in keys))
+        if counters:
+            changed = db.session.execute(
+                update(model).where(match).values({c: getattr(model, c) + row[c] for c in counters})
+            ).rowcount
+        else:
+            changed = db.session.execute(select(func.count()).select_from(model).where(match)).scalar()
+        if not changed:
+            db.session.execute(insert(model).values(row))
+
+
+def _fetch_purchases(last_id, limit):
+    return db.session.execute(
+        select(PurchasedItem.id, PurchasedItem.timestamp.label('created_at'),
+               PurchasedItem.timestamp.label('inserted_at'), PurchasedItem.user_id, PurchasedItem.group_id)
+        .where(PurchasedItem.id > last_id)
+        .order_by(PurchasedItem.id)
+        .limit(limit)
+    ).all()
+
+
+def _fetch_events(last_id, limit):
+    return db.session.execute(
+        select(ActivityEvent.id, ActivityEvent.created_at, ActivityEvent.inserted_at, ActivityEvent.user_id,
+               ActivityEvent.group_id, ActivityEvent.kind)
+        .where(ActivityEvent.id > last_id)
+        .order_by(ActivityEvent.id)
+        .limit(limit)
+    ).all()
+
+
+def _counter_for(source, row):
+    if source == 'purchase':
+        return 'checkouts'
+    return EVENT_COUNTERS.get(row.kind)
+
+
+SOURCES = (('purchase', _fetch_purchases), ('event', _fetch_events))
+
+
+def _rollup_source(source, fetch, batch_size, cutoff) -> int:
+    watermark = db.session.get(RollupWatermark, source)
+    last_id = watermark.last_id if watermark else 0
+
+    rows = []
+    for row in fetch(last_id, batch_size):
+        # Stop at the first row too recent to be sure every lower id is committed
+        if row.created_at is None or row.inserted_at > cutoff:
+            break
+        rows.append(row)
+    if not rows:
+        db.session.rollback()
+        return 0
+
+    counts = Counter()
+    active = set()
+    for row in rows:
+        for granularity in GRANULARITIES:
+            bucket = _bucket(row.created_at, granularity)
+            counter = _counter_for(source, row)
+            if counter and row.group_id is not None:
+                counts[(granularity, bucket, row.group_id, counter)] += 1
+            if row.user_id is not None:
+                active.add((granularity, bucket, row.user_id))
+
+    group_rows = {}
+    for (granularity, bucket, group_id, counter), n in counts.items():
+        key = (granularity, bucket, group_id)
+        entry = group_rows.setdefault(key, {
+            'granularity': granularity, 'bucket': bucket, 'group_id': group_id,
+            'basket_adds': 0, 'checkouts': 0, 'joins': 0,
+        })
+        entry[counter] += n
+
+    _upsert(ActivityRollup, list(group_rows.values()), ('granularity', 'bucket', 'group_id'),
+            counters=('basket_adds', 'checkouts', 'joins'))
+    _upsert(ActiveUserRollup,
+            [{'granularity': g, 'bucket': b, 'user_id': u} for g, b, u in active],
+            ('granularity', 'bucket', 'user_id'))
+
+    new_last = rows[-1].id
+    if watermark is None:
+        db.session.add(RollupWatermark(source=source, last_id=new_last))
+    else:
+        advanced = db.session.execute(
+            update(RollupWatermark)
+            .where(RollupWatermark.source == source, RollupWatermark.last_id == last_id)
+            .values(last_id=new_last)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not advanced:
+            # Another worker processed this range first
+            db.session.rollback()
+            return 0
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created the watermark first
+        db.session.rollback()
+        return 0
+    return len(rows)
+
+
+def rollup_once(batch_size: int = None) -> int:
+    """
+    Fold up to ``batch_size`` new rows per source into the rollup tables.
+
+    Args:
+        batch_size (int, optional): Defaults to ``ANALYTICS_BATCH_SIZE``.
+
+    Returns:
+        int: Number of source rows processed (0 when caught up).
+    """
+    config = current_app.config
+    batch_size = batch_size or config.get('ANALYTICS_BATCH_SIZE', 5000)
+    cutoff = datetime.utcnow() - timedelta(seconds=config.get('ANALYTICS_LAG_SECONDS', 5))
+    processed = 0
+    for source, fetch in SOURCES:
+        processed += _rollup_source(source, fetch, batch_size, cutoff)
+    return processed
+
+
+def prune(now: datetime = None) -> int:
+    """
+    Delete processed events and hourly rollups past their retention period.
+
+    Returns:
+        int: Number of rows deleted.
+    """
+    config = current_app.config
+    now = now or datetime.utcnow()
+    deleted = 0
+    watermark = db.session.get(RollupWatermark, 'event')
+    if watermark:
+        event_cutoff = now - timedelta(days=config.get('ANALYTICS_EVENT_RETENTION_DAYS', 30))
+        deleted += db.session.execute(
+            delete(ActivityEvent).where(ActivityEvent.id <= watermark.last_id, ActivityEvent.created_at < event_cutoff)
+        ).rowcount
+    hour_cutoff = _bucket(now - timedelta(days=config.get('ANALYTICS_HOURLY_RETENTION_DAYS', 14)), 'hour')
+    for model in (ActivityRollup, ActiveUserRollup):
+        deleted += db.session.execute(
+            delete(model).where(model.granularity == 'hour', model.bucket < hour_cutoff)
+        ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def _rollup_job():
+    flush_events()
+    processed = rollup_once()
+    if not processed:
+        prune()
+    return processed
+
+
+def _totals(granularity, since):
+    rows = db.session.execute(
+        select(
+            ActivityRollup.bucket,
+            func.sum(ActivityRollup.basket_adds).label('basket_adds'),
+            func.sum(ActivityRollup.checkouts).label('checkouts'),
+            func.sum(ActivityRollup.joins).label('joins'),
+        )
+        .where(ActivityRollup.granularity == granularity, ActivityRollup.bucket >= since)
+        .group_by(ActivityRollup.bucket)
+    ).all()
+    active = dict(db.session.execute(
+        select(ActiveUserRollup.bucket, func.count())
+        .where(ActiveUserRollup.granularity == granularity, ActiveUserRollup.bucket >= since)
+        .group_by(ActiveUserRollup.bucket)
+    ).all())
+    series = {row.bucket: {'basket_adds': row.basket_adds, 'checkouts': row.checkouts, 'joins': row.joins}
+              for row in rows}
+    result = []
+    for bucket in sorted(set(series) | set(active)):
+        entry = series.get(bucket, {'basket_adds': 0, 'checkouts': 0, 'joins': 0})
+        entry['bucket'] = bucket.isoformat()
+        entry['active_users'] = active.get(bucket, 0)
+        entry['conversion'] = _ratio(entry['checkouts'], entry['basket_adds'])
+        result.append(entry)
+    return result
+
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def dashboard(days: int = 30, hours: int = 48, top: int = 10) -> dict:
+    """
+    Read the analytics dashboard from the rollup tables only.
+
+    Args:
+        days (int): Number of daily buckets to return.
+        hours (int): Number of hourly buckets to return.
+        top (int): Number of groups in the top-groups table.
+
+    Returns:
+        dict: ``daily`` and ``hourly`` series, ``top_groups`` and window ``totals``.
+    """
+    now = datetime.utcnow()
+    day_since = _bucket(now, 'day') - timedelta(days=days - 1)
+    hour_since = _bucket(now, 'hour') - timedelta(hours=hours - 1)
+
+    checkouts = func.sum(ActivityRollup.checkouts).label('checkouts')
+    top_groups = db.session.execute(
+        select(
+            ActivityRollup.group_id, Group.name, checkouts,
+            func.sum(ActivityRollup.basket_adds).label('basket_adds'),
+            func.sum(ActivityRollup.joins).label('joins'),
+        )
+        .outerjoin(Group, Group.id == ActivityRollup.group_id)
+        .where(ActivityRollup.granularity == 'day', ActivityRollup.bucket >= day_since)
+        .group_by(ActivityRollup.group_id, Group.name)
+        .order_by(checkouts.desc())
+        .limit(top)
+    ).all()
+
+    daily = _totals('day', day_since)
+    totals = {k: sum(d[k] for d in daily) for k in ('basket_adds', 'checkouts', 'joins')}
+    totals['active_users'] = db.session.execute(
+        select(func.count(func.distinct(ActiveUserRollup.user_id)))
+        .where(ActiveUserRollup.granularity == 'day', ActiveUserRollup.bucket >= day_since)
+    ).scalar()
+    totals['conversion'] = _ratio(totals['checkouts'], totals['basket_adds'])
+
+    return {
+        'days': days,
+        'totals': totals,
+        'daily': daily,
+        'hourly': _totals('hour', hour_since),
+        'top_groups': [
+            {'group_id': r.group_id, 'name': r.name, 'checkouts': r.checkouts, 'basket_adds': r.basket_adds,
+             'joins': r.joins, 'conversion': _ratio(r.checkouts, r.basket_adds)}
+            for r in top_groups
+        ],
+    }
+
+
+analytics_cli = AppGroup('analytics', help='Activity rollup commands.')
+
+
+@analytics_cli.command('rollup')
+def rollup_command():
+    """Process every pending row into the rollup tables and exit."""
+    total = 0
+    while True:
+        processed = rollup_once()
+        if not processed:
+            break
+        total += processed
+    click.echo(f'Rolled up {total} row(s); pruned {prune()}.')
+
+
+@analytics_cli.command('rebuild')
+@click.confirmation_option(prompt='Drop all rollups and recompute from the source tables?')
+def rebuild_command():
+    """Clear the rollups and watermarks, then recompute from scratch."""
+    for model in (ActivityRollup, ActiveUserRollup, RollupWatermark):
+        db.session.execute(delete(model))
+    db.session.commit()
+    total = 0
+    while True:
+        processed = rollup_once()
+        if not processed:
+            break
+        total += processed
+    click.echo(f'Rolled up {total} row(s).')
+
+
+def init_analytics(app) -> EventBuffer:
+    """
+    Create the event buffer, register the rollup worker and ``flask analytics`` commands.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        EventBuffer: The buffer stored in ``app.extensions['analytics_buffer']``.
+    """
+    buffer = EventBuffer(app.config.get('ANALYTICS_BUFFER_SIZE', 500))
+    app.extensions['analytics_buffer'] = buffer
+    app.cli.add_command(analytics_cli)
+    interval = app.config.get('ANALYTICS_ROLLUP_INTERVAL', 60)
+    if interval > 0:
+        register_worker(app, BackgroundWorker(app, _rollup_job, interval=interval, name='analytics-rollup'))
+    return buffer
@@ -0,0 +1,80 @@
+"""
+Async database engine for the ASGI entry point (``asgi.py``).
+
+The async engine points at the same database as Flask-SQLAlchemy, through an
+async driver: ``sqlite://`` becomes ``sqlite+aiosqlite://`` and ``postgresql://``
+becomes ``postgresql+asyncpg://``. Set ``ASYNC_DATABASE_URL`` to override.
+SQLAlchemy's asyncio extension (and ``greenlet``) plus the driver are only
+imported when the engine is first used.
+"""
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+def async_database_url(url: str) -> str:
+    """
+    Map a sync database URL to the equivalent async-driver URL.
+
+    Args:
+        url (str): ``SQLALCHEMY_DATABASE_URI``.
+
+    Returns:
+        str: URL using an async driver.
+
+    Raises:
+        ValueError: If no async driver is known for the URL's backend.
+    """
+    scheme, sep, rest = url.partition('://')
+    backend = scheme.split('+', 1)[0]
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver known for {scheme!r}; set ASYNC_DATABASE_URL.')
+    return f'{ASYNC_DRIVERS[backend]}{sep}{rest}'
+
+
+class AsyncDatabase:
+    """
+    Lazily created :class:`~sqlalchemy.ext.asyncio.AsyncEngine` for one application.
+
+    Args:
+        app (Flask): The application whose database to use.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._engine = None
+
+    @property
+    def url(self) -> str:
+        config = self.app.config
+        if config.get('ASYNC_DATABASE_URL'):
+            return config['ASYNC_DATABASE_URL']
+        with self.app.app_context():
+            # Resolved through Flask-SQLAlchemy so relative SQLite paths land in instance/
+            from models import db
+            return async_database_url(db.engine.url.render_as_string(hide_password=False))
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            self._engine = create_async_engine(self.url, pool_pre_ping=True)
+        return self._engine
+
+    def connect(self):
+        """Return an ``AsyncConnection`` context manager for read queries."""
+        return self.engine.connect()
+
+    def begin(self):
+        """Return an ``AsyncConnection`` context manager that commits on exit."""
+        return self.engine.begin()
+
+    async def dispose(self):
+        """Close every pooled connection."""
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
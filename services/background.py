@@ -0,0 +1,137 @@
+"""
+Daemon-thread workers that run periodic jobs inside an application context.
+
+Workers are registered from ``create_app`` but only started on the first request
+a process serves. CLI commands such as ``flask db upgrade`` therefore never spin
+them up, and pre-forking servers start them in each worker after the fork.
+
+CPU-bound work (password hashing, image rendering) goes to process pools made by
+:func:`make_process_pool` instead, which never forks the server process.
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    """
+    Run ``task()`` repeatedly on one or more daemon threads.
+
+    The task should return a truthy value when it did some work; the worker then
+    runs it again straight away to drain the backlog, otherwise it sleeps for
+    ``interval`` seconds.
+
+    Args:
+        app (Flask): Application whose context the task runs in.
+        task (callable): Zero-argument job to run.
+        interval (float): Seconds to wait after an idle run.
+        name (str): Thread name prefix used in logs.
+        threads (int): Number of threads running the task concurrently.
+    """
+
+    def __init__(self, app, task, interval: float, name: str, threads: int = 1):
+        self.app = app
+        self.task = task
+        self.interval = interval
+        self.name = name
+        self.threads = threads
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        """Start the worker threads (no-op if already running)."""
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._run, name=f'{self.name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = None):
+        """Ask the worker threads to exit and wait for them."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def run_once(self):
+        """Run the task a single time in an application context."""
+        with self.app.app_context():
+            try:
+                return self.task()
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                did_work = self.run_once()
+            except Exception:
+                logger.exception('Background job %s failed', self.name)
+                did_work = False
+            if not did_work:
+                self._stop.wait(self.interval)
+
+
+def start_workers(app):
+    """
+    Start every registered worker of ``app`` once per process.
+
+    Called from the first request, or directly by servers with a startup hook (ASGI lifespan).
+
+    Args:
+        app (Flask): The application.
+    """
+    if app.extensions.get('background_workers_started') or 'background_workers_lock' not in app.extensions:
+        return
+    with app.extensions['background_workers_lock']:
+        if not app.extensions.get('background_workers_started'):
+            for w in app.extensions.get('background_workers', []):
+                w.start()
+            app.extensions['background_workers_started'] = True
+
+
+def register_worker(app, worker: BackgroundWorker):
+    """
+    Register a worker to be started on the first request served by this process.
+
+    Args:
+        app (Flask): The application.
+        worker (BackgroundWorker): Worker to start lazily.
+    """
+    workers = app.extensions.setdefault('background_workers', [])
+    if not workers:
+        app.extensions['background_workers_lock'] = threading.Lock()
+
+        @app.before_request
+        def _start_background_workers():
+            start_workers(app)
+
+    workers.append(worker)
+
+
+def make_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Create a process pool whose processes are not forked from this one.
+
+    The server process runs request threads, background workers, connection pools
+    and the event broker; forking it can copy locks held by other threads into the
+    child. Pool processes are started with ``forkserver`` (``spawn`` where that is
+    not available) and re-import the main module, so scripts that use a pool must
+    keep their code under ``if __name__ == '__main__':``.
+
+    Args:
+        max_workers (int): Number of pool processes.
+
+    Returns:
+        ProcessPoolExecutor: The pool.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=context)
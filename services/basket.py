@@ -0,0 +1,314 @@
+"""
+Basket mutations backed by the per-user counters on :class:`models.User`.
+
+All changes go through :func:`apply_ops`, which applies a batch of add/remove
+operations in one transaction: one read of the user's counters, one DELETE, one
+lookup of the groups being added, one multi-row INSERT and one conditional
+``UPDATE`` of the counters guarded by ``basket_version``. If another request changed the basket in between, the
+UPDATE matches no row and the batch is retried against the new state.
+Duplicates are still rejected by the unique ``(user_id, group_id)`` constraints.
+
+Groups with a ``capacity`` sell a limited number of seats. Adding one to a
+basket holds a seat for ``BASKET_HOLD_MINUTES``: a conditional ``UPDATE`` bumps
+``Group.seats_held`` only while ``seats_held + seats_sold < capacity``, so two
+users can never take the last seat. Removing the item, checking it out or the
+hold expiring gives the seat back. Expired holds are released in batches by a
+background worker (``HOLD_RELEASE_INTERVAL``) or ``flask basket release-holds``;
+the items drop out of their baskets and the owners see it over ``/events``.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Group, BasketItem, PurchasedItem
+from signals import basket_changed
+from services.analytics import record_event
+from services.background import BackgroundWorker, register_worker
+
+MAX_OPS = 100
+MAX_ATTEMPTS = 3
+
+
+class BasketError(Exception):
+    """Raised when a basket change is rejected (duplicate, purchased or over the limit)."""
+
+
+class _Conflict(Exception):
+    """The basket changed while a batch was being applied."""
+
+
+def _coalesce(ops):
+    """Keep the last operation per group, in first-seen order."""
+    latest = {}
+    for op in ops:
+        if not isinstance(op, dict):
+            raise BasketError('Invalid basket operation.')
+        action = op.get('op')
+        if action not in ('add', 'remove'):
+            raise BasketError(f"Unknown basket operation {action!r}.")
+        try:
+            group_id = int(op.get('group_id'))
+        except (TypeError, ValueError):
+            raise BasketError('Invalid group_id.')
+        latest.pop(group_id, None)
+        latest[group_id] = action
+    return list(latest.items())
+
+
+def _take_seat(group_id) -> bool:
+    """Hold one seat of a capacity-limited group; False if it is full."""
+    return db.session.execute(
+        update(Group)
+        .where(Group.id == group_id, Group.seats_held + Group.seats_sold < Group.capacity)
+        # Seat counters are not part of the catalog, so leave its validators alone
+        .values(seats_held=Group.seats_held + 1, updated_at=Group.updated_at)
+        .execution_options(synchronize_session=False)
+    ).rowcount == 1
+
+
+def _release_seats(group_counts):
+    """Give back held seats, ``{group_id: seats}``."""
+    if not group_counts:
+        return
+    groups = Group.__table__
+    db.session.execute(
+        update(groups)
+        .where(groups.c.id == bindparam('b_group_id'))
+        .values(seats_held=groups.c.seats_held - bindparam('b_seats'), updated_at=groups.c.updated_at),
+        [{'b_group_id': gid, 'b_seats': seats} for gid, seats in group_counts.items()],
+    )
+
+
+def _apply(user_id, ops, limit, hold_minutes):
+    session = db.session
+    state = session.execute(
+        select(User.basket_count, User.purchase_count, User.basket_version).where(User.id == user_id)
+    ).first()
+    if state is None:
+        raise BasketError('Unknown user.')
+
+    removes = [gid for gid, action in ops if action == 'remove']
+    removed = 0
+    if removes:
+        # Locked so the hold release worker cannot give the same seats back as well
+        held = session.scalars(
+            select(BasketItem.group_id)
+            .where(BasketItem.user_id == user_id, BasketItem.group_id.in_(removes),
+                   BasketItem.hold_expires_at.isnot(None))
+            .with_for_update()
+        ).all()
+        removed = session.execute(
+            delete(BasketItem)
+            .where(BasketItem.user_id == user_id, BasketItem.group_id.in_(removes))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        _release_seats(Counter(held))
+
+    # One lookup for every group being added: does it exist, is it basketed or purchased?
+    add_ids = [gid for gid, action in ops if action == 'add']
+    lookup = {}
+    if add_ids:
+        lookup = {row.id: row for row in session.execute(
+            select(Group.id, Group.capacity, BasketItem.id.label('basket_id'), PurchasedItem.id.label('purchase_id'))
+            .outerjoin(BasketItem, and_(BasketItem.group_id == Group.id, BasketItem.user_id == user_id))
+            .outerjoin(PurchasedItem, and_(PurchasedItem.group_id == Group.id, PurchasedItem.user_id == user_id))
+            .where(Group.id.in_(add_ids))
+        )}
+
+    results, adds, held = [], [], set()
+    remaining = limit - state.basket_count + removed - state.purchase_count
+    for group_id, action in ops:
+        message = None
+        row = lookup.get(group_id)
+        if action == 'remove':
+            pass
+        elif row is None:
+            message = 'Group not found.'
+        elif row.basket_id is not None:
+            pass  # already there: idempotent
+        elif row.purchase_id is not None:
+            message = 'Group already purchased.'
+        elif remaining <= 0:
+            message = f'Checkout limit {limit} reached.'
+        elif row.capacity is not None and not _take_seat(group_id):
+            message = 'Group is full.'
+        else:
+            adds.append(group_id)
+            remaining -= 1
+            if row.capacity is not None:
+                held.add(group_id)
+        results.append({'group_id': group_id, 'op': action, 'success': message is None, 'message': message})
+
+    if adds:
+        hold_expires_at = datetime.utcnow() + timedelta(minutes=hold_minutes)
+        session.execute(insert(BasketItem), [
+            {'user_id': user_id, 'group_id': gid, 'hold_expires_at': hold_expires_at if gid in held else None}
+            for gid in adds
+        ])
+
+    version = state.basket_version
+    if removed or adds:
+        updated = session.execute(
+            update(User)
+            .where(User.id == user_id, User.basket_version == state.basket_version)
+            .values(
+                basket_count=User.basket_count - removed + len(adds),
+                basket_version=User.basket_version + 1,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            raise _Conflict()
+        version += 1
+
+    basket_ids = list(session.scalars(
+        select(BasketItem.group_id).where(BasketItem.user_id == user_id).order_by(BasketItem.id)
+    ))
+    return {'basket_ids': basket_ids, 'basket_count': len(basket_ids), 'version': version,
+            'results': results, 'added': adds, 'changed': bool(removed or adds)}
+
+
+def apply_ops(user_id: int, ops: list, limit: int) -> dict:
+    """
+    Apply a batch of basket operations in one transaction.
+
+    Operations on the same group are coalesced (the last one wins). Adds that would
+    exceed the limit, or that target purchased, unknown or full groups, are
+    rejected individually; the rest of the batch still applies. Removing a group that is
+    not in the basket, or adding one that already is, succeeds without a change.
+
+    Args:
+        user_id (int): The user.
+        ops (list[dict]): ``[{'op': 'add'|'remove', 'group_id': int}, ...]``.
+        limit (int): Maximum basket plus purchased groups allowed.
+
+    Returns:
+        dict: ``basket_ids``, ``basket_count``, ``version`` and per-group ``results``.
+
+    Raises:
+        BasketError: If the batch is malformed, too large or keeps conflicting.
+    """
+    if len(ops) > MAX_OPS:
+        raise BasketError(f'At most {MAX_OPS} operations per request.')
+    ops = _coalesce(ops)
+    hold_minutes = current_app.config.get('BASKET_HOLD_MINUTES', 10)
+
+    session = db.session
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            state = _apply(user_id, ops, limit, hold_minutes)
+            session.commit()
+            break
+        except (_Conflict, IntegrityError):
+            # A concurrent request changed the basket; retry against the new state
+            session.rollback()
+        except Exception:
+            session.rollback()
+            raise
+    else:
+        raise BasketError('Basket changed concurrently, please retry.')
+
+    if state.pop('changed'):
+        basket_changed.send(current_app._get_current_object(), user_id=user_id)
+    for group_id in state.pop('added'):
+        record_event('basket_add', user_id, group_id)
+    return state
+
+
+def release_expired_holds(batch_size: int = None) -> int:
+    """
+    Drop one batch of basket items whose seat hold has expired and give the seats back.
+
+    Each affected basket's counters and version move as for a regular removal,
+    so a concurrent basket change retries instead of double-counting.
+
+    Args:
+        batch_size (int): Maximum items released, defaults to ``HOLD_RELEASE_BATCH_SIZE``.
+
+    Returns:
+        int: Number of items released; a full batch means more may remain.
+    """
+    batch_size = batch_size or current_app.config.get('HOLD_RELEASE_BATCH_SIZE', 500)
+    session = db.session
+    try:
+        expired = session.execute(
+            select(BasketItem.id, BasketItem.user_id, BasketItem.group_id)
+            .where(BasketItem.hold_expires_at < datetime.utcnow())
+            .order_by(BasketItem.hold_expires_at)
+            .limit(batch_size)
+            # Items locked by a checkout or basket change in progress are left to it
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not expired:
+            session.rollback()
+            return 0
+
+        deleted = session.execute(
+            delete(BasketItem)
+            .where(BasketItem.id.in_([row.id for row in expired]))
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if deleted != len(expired):
+            # Without row locks (SQLite) a checkout may have bought some of these
+            # since they were read; leave the batch to the next pass
+            session.rollback()
+            return 0
+        _release_seats(Counter(row.group_id for row in expired))
+        users = User.__table__
+        per_user = Counter(row.user_id for row in expired)
+        session.execute(
+            update(users)
+            .where(users.c.id == bindparam('b_user_id'))
+            .values(basket_count=users.c.basket_count - bindparam('b_items'),
+                    basket_version=users.c.basket_version + 1),
+            [{'b_user_id': uid, 'b_items': items} for uid, items in per_user.items()],
+        )
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    app = current_app._get_current_object()
+    for user_id in per_user:
+        basket_changed.send(app, user_id=user_id)
+    return len(expired)
+
+
+def _release_job() -> bool:
+    # Keep releasing without sleeping while batches come back full
+    batch_size = current_app.config.get('HOLD_RELEASE_BATCH_SIZE', 500)
+    return release_expired_holds(batch_size) >= batch_size
+
+
+basket_cli = AppGroup('basket', help='Basket hold maintenance commands.')
+
+
+@basket_cli.command('release-holds')
+@click.option('--batch-size', type=int, default=None, help='Items released per transaction.')
+def release_holds_command(batch_size):
+    """Release every expired seat hold."""
+    total = 0
+    while True:
+        released = release_expired_holds(batch_size)
+        total += released
+        if not released:
+            break
+    click.echo(f'Released {total} expired hold(s).')
+
+
+def init_basket(app):
+    """
+    Register the expired-hold release worker and ``flask basket`` commands.
+
+    Args:
+        app (Flask): The application.
+    """
+    app.cli.add_command(basket_cli)
+    interval = app.config.get('HOLD_RELEASE_INTERVAL', 30)
+    if interval > 0:
+        register_worker(app, BackgroundWorker(app, _release_job, interval=interval, name='hold-release'))
@@ -0,0 +1,332 @@
+"""
+Bulk admin operations: ban/unban many users, import groups, recompute member counts.
+
+Every operation is set-based: a single UPDATE, or chunked executemany INSERTs
+committed once per chunk. Callers can pass ``progress(done, total)`` to report how
+far along a long run is; the ``flask bulk`` CLI uses it to drive a progress bar.
+"""
+import csv
+import io
+import json
+import os
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, select, update
+
+from models import db, User, Group, PurchasedItem
+from services.images import get_image_pipeline
+from services.search import normalize_tags
+from services.sessions import revoke_user_sessions
+from signals import users_changed, groups_changed
+
+DEFAULT_CHUNK_SIZE = 1000
+
+GROUP_IMPORT_FIELDS = ('name', 'url', 'description', 'tags', 'picture_filename', 'picture_url', 'member_count', 'capacity')
+
+
+class BulkError(Exception):
+    """Raised when a bulk request cannot be processed at all."""
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def resolve_user_ids(identifiers, chunk_size: int = DEFAULT_CHUNK_SIZE) -> list:
+    """
+    Map a mix of user ids and emails to existing user ids.
+
+    Args:
+        identifiers (Iterable[str | int]): Ids or email addresses.
+        chunk_size (int): Maximum number of values per ``IN`` clause.
+
+    Returns:
+        list[int]: Ids of the users that exist, without duplicates.
+    """
+    ids, emails = set(), set()
+    for identifier in identifiers:
+        value = str(identifier).strip()
+        if not value:
+            continue
+        if value.isdigit():
+            ids.add(int(value))
+        else:
+            emails.add(value.lower())
+
+    found = set()
+    for chunk in _chunks(sorted(ids), chunk_size):
+        found.update(db.session.scalars(select(User.id).where(User.id.in_(chunk))))
+    for chunk in _chunks(sorted(emails), chunk_size):
+        found.update(db.session.scalars(select(User.id).where(func.lower(User.email).in_(chunk))))
+    return sorted(found)
+
+
+def set_users_banned(user_ids, banned: bool = True, chunk_size: int = DEFAULT_CHUNK_SIZE, progress=None) -> int:
+    """
+    Ban or unban users with one UPDATE per chunk of ids.
+
+    Banning sets ``is_blacklisted`` and clears ``is_active`` (see ``User.is_banned``)
+    and revokes the users' login sessions. Admin accounts are never banned.
+    Unbanning only touches blacklisted users, so accounts that are inactive for
+    another reason stay inactive.
+
+    Args:
+        user_ids (list[int]): Users to change.
+        banned (bool): True to ban, False to unban.
+        chunk_size (int): Number of ids per UPDATE/commit.
+        progress (callable, optional): Called with ``(done, total)`` after each chunk.
+
+    Returns:
+        int: Number of rows updated.
+    """
+    user_ids = list(user_ids)
+    app = current_app._get_current_object()
+    changed = done = 0
+    # Admins are never banned; only blacklisted users are unbanned
+    eligible = User.role != 'Admin' if banned else User.is_blacklisted.is_(True)
+    for chunk in _chunks(user_ids, chunk_size):
+        size = len(chunk)
+        chunk = list(db.session.scalars(select(User.id).where(User.id.in_(chunk), eligible)))
+        if chunk:
+            changed += db.session.execute(
+                update(User).where(User.id.in_(chunk), eligible).values(is_active=not banned, is_blacklisted=banned),
+                execution_options={'synchronize_session': False},
+            ).rowcount
+            db.session.commit()
+            if banned:
+                revoke_user_sessions(chunk)
+            users_changed.send(app, user_ids=chunk)
+        done += size
+        if progress:
+            progress(done, len(user_ids))
+    return changed
+
+
+def parse_group_file(stream, filename: str) -> list:
+    """
+    Read group rows from an uploaded or local CSV/JSON file.
+
+    Args:
+        stream (IO[bytes] | IO[str]): Open file.
+        filename (str): Used to pick the format from the extension.
+
+    Returns:
+        list[dict]: Raw rows, one per group.
+    """
+    data = stream.read()
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    if os.path.splitext(filename)[1].lower() == '.json':
+        rows = json.loads(data)
+        if isinstance(rows, dict):
+            rows = rows.get('groups', [])
+        if not isinstance(rows, list):
+            raise BulkError('JSON import must be a list of groups.')
+        return rows
+    return list(csv.DictReader(io.StringIO(data)))
+
+
+def _text(row, field):
+    value = row.get(field)
+    if value is None:
+        return ''
+    if not isinstance(value, (str, int, float)):
+        raise ValueError(f'{field} must be a string')
+    return str(value).strip()
+
+
+def _clean_group_row(row):
+    if not isinstance(row, dict):
+        raise ValueError('row must be an object with name and url')
+    name = _text(row, 'name')
+    url = _text(row, 'url')
+    if not name or not url:
+        raise ValueError('name and url are required')
+    if len(name) > 120 or len(url) > 255:
+        raise ValueError('name or url too long')
+    if not isinstance(row.get('tags'), (str, list, tuple, type(None))):
+        raise ValueError('tags must be a string or a list')
+    tags = normalize_tags(row.get('tags'))
+    if tags and len(tags) > 255:
+        raise ValueError('tags too long')
+    try:
+        member_count = int(row.get('member_count') or 0)
+    except (TypeError, ValueError):
+        raise ValueError('member_count must be an integer')
+    try:
+        capacity = int(row['capacity']) if str(row.get('capacity') or '').strip() else None
+    except (TypeError, ValueError):
+        raise ValueError('capacity must be an integer')
+    if capacity is not None and capacity < 0:
+        raise ValueError('capacity must not be negative')
+    return {
+        'name': name,
+        'url': url,
+        'description': _text(row, 'description') or None,
+        'tags': tags,
+        'picture_filename': _text(row, 'picture_filename') or None,
+        'picture_url': _text(row, 'picture_url') or None,
+        'member_count': member_count,
+        'capacity': capacity,
+    }
+
+
+def import_groups(rows, chunk_size: int = DEFAULT_CHUNK_SIZE, progress=None) -> dict:
+    """
+    Insert groups with one executemany INSERT per chunk.
+
+    Invalid rows are skipped and reported rather than aborting the import. The
+    thumbnails of imported groups are rendered in the background.
+
+    Args:
+        rows (list[dict]): Rows from ``parse_group_file``.
+        chunk_size (int): Number of rows per INSERT/commit.
+        progress (callable, optional): Called with ``(done, total)`` after each chunk.
+
+    Returns:
+        dict: ``{'imported': int, 'errors': [(row_number, message), ...]}``.
+    """
+    valid, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        try:
+            valid.append(_clean_group_row(row))
+        except ValueError as e:
+            errors.append((number, str(e)))
+
+    app = current_app._get_current_object()
+    # insertmanyvalues gives us the new ids in the same round trip where the driver allows it
+    returning = db.engine.dialect.insert_executemany_returning
+    imported = 0
+    for chunk in _chunks(valid, chunk_size):
+        if returning:
+            new_ids = list(db.session.scalars(insert(Group).returning(Group.id), chunk))
+        else:
+            # Ids above the previous maximum; any concurrent inserts caught too are only reindexed
+            last_id = db.session.scalar(select(func.max(Group.id))) or 0
+            db.session.execute(insert(Group), chunk)
+            new_ids = list(db.session.scalars(select(Group.id).where(Group.id > last_id)))
+        db.session.commit()
+        if new_ids:
+            groups_changed.send(app, group_ids=new_ids)
+            # Thumbnails, as for groups created in the admin form
+            pipeline = get_image_pipeline()
+            for group in db.session.scalars(select(Group).where(Group.id.in_(new_ids))):
+                pipeline.schedule(group)
+        imported += len(chunk)
+        if progress:
+            progress(imported, len(valid))
+    return {'imported': imported, 'errors': errors}
+
+
+def recompute_member_counts() -> int:
+    """
+    Reset every ``Group.member_count`` to its number of purchases in one UPDATE.
+
+    Only groups whose stored count is wrong are written.
+
+    Returns:
+        int: Number of groups corrected.
+    """
+    actual = (
+        select(func.count(PurchasedItem.id))
+        .where(PurchasedItem.group_id == Group.id)
+        .scalar_subquery()
+    )
+    stmt = (
+        update(Group)
+        .where(func.coalesce(Group.member_count, -1) != actual)
+        .values(member_count=actual)
+    )
+    if db.engine.dialect.update_returning:
+        group_ids = list(db.session.scalars(stmt.returning(Group.id), execution_options={'synchronize_session': False}))
+        count = len(group_ids)
+    else:
+        count = db.session.execute(stmt, execution_options={'synchronize_session': False}).rowcount
+        group_ids = None
+    db.session.commit()
+    if count:
+        if group_ids is None:
+            group_ids = list(db.session.scalars(select(Group.id)))
+        groups_changed.send(current_app._get_current_object(), group_ids=group_ids)
+    return count
+
+
+bulk_cli = AppGroup('bulk', help='Bulk admin operations.')
+
+
+def _progress_bar(label, total):
+    bar = click.progressbar(length=total, label=label)
+    state = {'done': 0}
+
+    def progress(done, _total):
+        bar.update(done - state['done'])
+        state['done'] = done
+
+    return bar, progress
+
+
+def _read_identifiers(values, file):
+    identifiers = list(values)
+    if file:
+        identifiers.extend(line.strip() for line in file if line.strip())
+    return identifiers
+
+
+@bulk_cli.command('ban')
+@click.argument('users', nargs=-1)
+@click.option('--file', type=click.File('r'), help='File with one user id or email per line.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+def ban_command(users, file, chunk_size):
+    """Ban users given by id or email."""
+    _set_banned_command(users, file, chunk_size, banned=True)
+
+
+@bulk_cli.command('unban')
+@click.argument('users', nargs=-1)
+@click.option('--file', type=click.File('r'), help='File with one user id or email per line.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+def unban_command(users, file, chunk_size):
+    """Unban users given by id or email."""
+    _set_banned_command(users, file, chunk_size, banned=False)
+
+
+def _set_banned_command(users, file, chunk_size, banned):
+    user_ids = resolve_user_ids(_read_identifiers(users, file), chunk_size)
+    if not user_ids:
+        raise click.ClickException('No matching users.')
+    bar, progress = _progress_bar('Banning' if banned else 'Unbanning', len(user_ids))
+    with bar:
+        changed = set_users_banned(user_ids, banned, chunk_size, progress)
+    click.echo(f"{'Banned' if banned else 'Unbanned'} {changed} user(s).")
+
+
+@bulk_cli.command('import-groups')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True)
+def import_groups_command(path, chunk_size):
+    """Import groups from a CSV or JSON file."""
+    with open(path, 'rb') as fh:
+        try:
+            rows = parse_group_file(fh, path)
+        except (BulkError, ValueError) as e:
+            raise click.ClickException(str(e))
+    bar, progress = _progress_bar('Importing', len(rows))
+    with bar:
+        result = import_groups(rows, chunk_size, progress)
+    for number, message in result['errors']:
+        click.echo(f'Row {number}: {message}', err=True)
+    click.echo(f"Imported {result['imported']} group(s), skipped {len(result['errors'])}.")
+
+
+@bulk_cli.command('recount')
+def recount_command():
+    """Recompute every group's member count from purchases."""
+    click.echo(f'Corrected {recompute_member_counts()} group(s).')
+
+
+def init_bulk(app):
+    """Register the ``flask bulk`` commands."""
+    app.cli.add_command(bulk_cli)
@@ -0,0 +1,141 @@
+"""
+Small caching primitives shared by the service layer.
+
+``LRUCache`` is a thread-safe, in-process LRU with a per-entry TTL. Shared
+backends hold JSON-serialisable values that several processes can see;
+``make_shared_backend`` builds one from ``CACHE_BACKEND_URL``:
+
+    memory://            process-local stand-in (tests, single-process dev server)
+    redis://host:port/0  Redis (requires the ``redis`` package)
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with a time-to-live.
+
+    Args:
+        maxsize (int): Maximum number of entries kept.
+        ttl (float): Seconds an entry stays valid, or None for no expiry.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key`` or ``default`` if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        """Store ``value`` under ``key``, evicting the least recently used entry if full."""
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        """Remove the given keys if present."""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class LocalBackend:
+    """Process-local stand-in for a shared cache server."""
+
+    def __init__(self, maxsize: int = 100_000):
+        self._cache = LRUCache(maxsize)
+        self._incr_lock = threading.Lock()
+
+    def get(self, key):
+        raw = self._cache.get(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl: float = None):
+        self._cache.set(key, json.dumps(value), ttl)
+
+    def delete(self, *keys):
+        self._cache.delete(*keys)
+
+    def incr(self, key, ttl: float = None) -> int:
+        """Atomically add one to an integer counter, creating it with ``ttl`` if missing."""
+        with self._incr_lock:
+            value = (self.get(key) or 0) + 1
+            self.set(key, value, ttl)
+        return value
+
+
+class RedisBackend:
+    """Shared cache stored in Redis."""
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return None if raw is None else json.loads(raw)
+
+    def set(self, key, value, ttl: float = None):
+        self._client.set(key, json.dumps(value), ex=int(ttl) if ttl else None)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*keys)
+
+    def incr(self, key, ttl: float = None) -> int:
+        """Atomically add one to an integer counter, (re)setting its expiry to ``ttl``."""
+        pipe = self._client.pipeline()
+        pipe.incr(key)
+        if ttl:
+            pipe.expire(key, int(ttl))
+        return pipe.execute()[0]
+
+
+def make_shared_backend(url: str):
+    """
+    Build a shared cache backend from a URL.
+
+    Args:
+        url (str): Backend URL, or None/empty to disable the shared tier.
+
+    Returns:
+        LocalBackend | RedisBackend | None: The backend, or None when disabled.
+    """
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return LocalBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f'Unsupported CACHE_BACKEND_URL {url!r}')
@@ -0,0 +1,139 @@
+"""
+Keyset-paginated reads of the group catalog.
+
+Pages are ordered by ``(name, id)`` and continue from an opaque cursor instead of
+an OFFSET, so every page is a single range scan on ``ix_group_name_id`` no matter
+how deep into the catalog the client has scrolled.
+"""
+import base64
+import json
+
+from flask import current_app
+from sqlalchemy import and_, or_, select
+
+from models import db, Group
+from services.images import group_image_url
+
+# Only the columns a dashboard card renders
+CARD_COLUMNS = (Group.id, Group.name, Group.picture_filename, Group.image_key, Group.member_count)
+
+
+def encode_cursor(name: str, group_id: int) -> str:
+    """
+    Encode the position of the last row on a page as an opaque cursor.
+
+    Args:
+        name (str): Name of the last group on the page.
+        group_id (int): Id of the last group on the page.
+
+    Returns:
+        str: URL-safe cursor string.
+    """
+    raw = json.dumps([name, group_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a cursor produced by :func:`encode_cursor`.
+
+    Args:
+        cursor (str): Cursor from a previous page.
+
+    Returns:
+        tuple: ``(name, id)`` of the row to continue after.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        name, group_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return str(name), int(group_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as exc:
+        raise ValueError('Invalid catalog cursor.') from exc
+
+
+def catalog_query(after: str = None, limit: int = 24):
+    """
+    Build the select for one page of group cards (one extra row to detect a next page).
+
+    Args:
+        after (str): Cursor returned with the previous page, or None for the first page.
+        limit (int): Maximum number of groups on the page.
+
+    Returns:
+        Select: Statement to run with a sync session or an async connection.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    stmt = select(*CARD_COLUMNS)
+    if after:
+        name, group_id = decode_cursor(after)
+        stmt = stmt.where(or_(
+            Group.name > name,
+            and_(Group.name == name, Group.id > group_id),
+        ))
+    return stmt.order_by(Group.name, Group.id).limit(limit + 1)
+
+
+def split_page(rows, limit: int):
+    """
+    Trim the look-ahead row fetched by :func:`catalog_query`.
+
+    Returns:
+        tuple: ``(rows, next_cursor)`` with next_cursor None on the last page.
+    """
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].name, rows[-1].id)
+    return rows, next_cursor
+
+
+def catalog_page(after: str = None, limit: int = 24):
+    """
+    Fetch one page of group cards.
+
+    Args:
+        after (str): Cursor returned with the previous page, or None for the first page.
+        limit (int): Maximum number of groups to return.
+
+    Returns:
+        tuple: ``(rows, next_cursor)`` where rows expose ``id``, ``name``, ``picture_filename``,
+        ``image_key`` and ``member_count`` and next_cursor is None on the last page.
+    """
+    rows = db.session.execute(catalog_query(after, limit)).all()
+    return split_page(rows, limit)
+
+
+def groups_by_ids(group_ids):
+    """
+    Load card columns for a specific set of groups (e.g. the basket).
+
+    Args:
+        group_ids (list): Group ids to load.
+
+    Returns:
+        list: Rows in the same order as ``group_ids``; unknown ids are skipped.
+    """
+    if not group_ids:
+        return []
+    rows = db.session.query(*CARD_COLUMNS).filter(Group.id.in_(group_ids)).all()
+    by_id = {row.id: row for row in rows}
+    return [by_id[gid] for gid in group_ids if gid in by_id]
+
+
+def serialize_card(row) -> dict:
+    """Convert a card row into the JSON shape used by the catalog API."""
+    image_url = None
+    if row.image_key:
+        image_url = group_image_url(row.image_key, current_app.config['IMAGE_SIZES'][0], 'webp')
+    return {
+        'id': row.id,
+        'name': row.name,
+        'picture_filename': row.picture_filename,
+        'image_url': image_url,
+        'member_count': row.member_count or 0,
+    }
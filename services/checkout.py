@@ -0,0 +1,181 @@
+"""
+Single-transaction checkout of a user's basket.
+
+The whole checkout is a fixed number of statements regardless of basket size:
+lock the user and the basket's groups, bulk-insert purchases and invite tokens,
+bump ``member_count`` and the seat counters in the database, bulk-delete the
+basket rows and move the user's basket/purchase counters.
+
+A held seat (see ``services/basket.py``) turns into a sold one. Items of
+capacity-limited groups without a hold, e.g. basketed before the capacity was
+set, must still find a free seat, or the checkout fails as a whole.
+"""
+import secrets
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, Group, BasketItem, PurchasedItem, InviteToken
+from signals import checkout_completed
+
+
+class CheckoutError(Exception):
+    """Raised when a basket cannot be checked out (empty basket or limit reached)."""
+
+
+MAX_ATTEMPTS = 3
+
+
+class _Conflict(Exception):
+    """The basket changed between being read and being checked out."""
+
+
+def _checkout(user_id, limit, token_ttl_minutes, issue_tokens, before_commit):
+    session = db.session
+    # Row lock on the user serialises concurrent checkouts of the same account on
+    # databases that honour FOR UPDATE; elsewhere basket_version catches them below
+    user = session.execute(
+        select(User.purchase_count, User.basket_version).where(User.id == user_id).with_for_update()
+    ).first()
+    if user is None:
+        raise CheckoutError('Your basket is empty.')
+
+    # Locked so the hold release worker leaves these items alone (PostgreSQL; SQLite
+    # ignores FOR UPDATE and relies on the basket_version check instead)
+    basket = session.execute(
+        select(BasketItem.group_id, BasketItem.hold_expires_at)
+        .where(BasketItem.user_id == user_id)
+        .with_for_update()
+    ).all()
+    basket_ids = [row.group_id for row in basket]
+    if not basket_ids:
+        raise CheckoutError('Your basket is empty.')
+
+    if user.purchase_count + len(basket_ids) > limit:
+        raise CheckoutError('Checkout limit reached.')
+
+    # Lock the groups being joined; groups deleted since they were basketed drop out here
+    group_ids = session.scalars(
+        select(Group.id).where(Group.id.in_(basket_ids)).order_by(Group.id).with_for_update()
+    ).all()
+
+    if group_ids:
+        now = datetime.utcnow()
+        expires = now + timedelta(minutes=token_ttl_minutes)
+        session.execute(insert(PurchasedItem), [
+            {'user_id': user_id, 'group_id': gid, 'timestamp': now} for gid in group_ids
+        ])
+        if issue_tokens:
+            session.execute(insert(InviteToken), [
+                {
+                    'user_id': user_id,
+                    'group_id': gid,
+                    'token': secrets.token_urlsafe(16),
+                    'expires_at': expires,
+                }
+                for gid in group_ids
+            ])
+        held_ids = {row.group_id for row in basket if row.hold_expires_at is not None}
+        held = [gid for gid in group_ids if gid in held_ids]
+        unheld = [gid for gid in group_ids if gid not in held_ids]
+        if held:
+            session.execute(
+                update(Group)
+                .where(Group.id.in_(held))
+                .values(
+                    member_count=func.coalesce(Group.member_count, 0) + 1,
+                    seats_held=Group.seats_held - 1,
+                    seats_sold=Group.seats_sold + 1,
+                )
+                .execution_options(synchronize_session=False)
+            )
+        if unheld:
+            taken = session.execute(
+                update(Group)
+                .where(Group.id.in_(unheld), or_(
+                    Group.capacity.is_(None), Group.seats_held + Group.seats_sold < Group.capacity
+                ))
+                .values(
+                    member_count=func.coalesce(Group.member_count, 0) + 1,
+                    seats_sold=Group.seats_sold + 1,
+                )
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if taken != len(unheld):
+                raise CheckoutError('A group in your basket is full.')
+
+    # Only the items read above: anything added since is left for the next checkout
+    removed = session.execute(
+        delete(BasketItem)
+        .where(BasketItem.user_id == user_id, BasketItem.group_id.in_(basket_ids))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    # Guarded by basket_version: a basket change or hold release committed since the
+    # basket was read matches no row, and the checkout is retried against the new state
+    updated = session.execute(
+        update(User)
+        .where(User.id == user_id, User.basket_version == user.basket_version,
+               User.purchase_count + len(group_ids) <= limit)
+        .values(
+            purchase_count=User.purchase_count + len(group_ids),
+            basket_count=User.basket_count - removed,
+            basket_version=User.basket_version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        raise _Conflict()
+    if before_commit is not None:
+        before_commit(list(group_ids))
+    return list(group_ids)
+
+
+def checkout_basket(user_id: int, limit: int, token_ttl_minutes: int = 15, issue_tokens: bool = True,
+                    before_commit=None) -> list:
+    """
+    Move every basket item of a user into purchases in one transaction.
+
+    The transaction only commits if ``User.basket_version`` is still the one read
+    at its start; otherwise it is rolled back and retried, so an item added or a
+    hold released meanwhile is neither dropped unbought nor counted twice.
+
+    Args:
+        user_id (int): Id of the user checking out.
+        limit (int): Maximum number of groups the user may hold in total.
+        token_ttl_minutes (int): Lifetime of the generated invite tokens.
+        issue_tokens (bool): Store InviteToken rows (False when signed tokens are used).
+        before_commit (callable): Called with the purchased group ids just before the
+            commit; whatever it adds to the session (e.g. an outbox email) commits or
+            rolls back together with the checkout. Called again if the checkout is retried.
+
+    Returns:
+        list: Ids of the groups that were purchased.
+
+    Raises:
+        CheckoutError: If the basket is empty, the limit would be exceeded, a group is
+            full or the basket keeps changing concurrently.
+    """
+    session = db.session
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            group_ids = _checkout(user_id, limit, token_ttl_minutes, issue_tokens, before_commit)
+            session.commit()
+            break
+        except _Conflict:
+            # The basket changed since it was read; retry against the new state
+            session.rollback()
+        except IntegrityError:
+            # A concurrent checkout already purchased one of these groups
+            session.rollback()
+            raise CheckoutError('Group already purchased.')
+        except Exception:
+            session.rollback()
+            raise
+    else:
+        raise CheckoutError('Basket changed concurrently, please retry.')
+
+    checkout_completed.send(current_app._get_current_object(), user_id=user_id, group_ids=group_ids)
+    return group_ids
@@ -0,0 +1,136 @@
+"""
+Engine setup: connection pool sizing, SQLite pragmas and fork safety.
+
+Pool settings come from ``DB_POOL_SIZE``, ``DB_MAX_OVERFLOW``, ``DB_POOL_TIMEOUT``,
+``DB_POOL_RECYCLE`` and ``DB_POOL_PRE_PING``; explicit ``SQLALCHEMY_ENGINE_OPTIONS``
+win. A server running N threads per process needs ``DB_POOL_SIZE`` of at least N
+(plus the background worker threads) to avoid waiting on checkouts.
+
+SQLite connections are switched to WAL journaling (readers no longer block the
+writer) with ``synchronous=NORMAL``, a busy timeout and in-memory temp tables.
+
+The schema is managed by Flask-Migrate only; nothing is created at boot. Alembic
+takes longer to import than the rest of the app, so ``flask db`` is registered
+only when the app is built by the ``flask`` command line, never in server
+processes. ``flask init-db`` creates a fresh database and stamps it as current.
+"""
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from models import db
+
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config) -> dict:
+    """
+    Build ``SQLALCHEMY_ENGINE_OPTIONS`` from the ``DB_POOL_*`` settings.
+
+    Args:
+        config (dict): Application config.
+
+    Returns:
+        dict: Engine keyword arguments.
+    """
+    options = dict(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if _is_memory_sqlite(url):
+        # Flask-SQLAlchemy uses a single shared connection (StaticPool) here
+        return options
+    options.setdefault('pool_size', config.get('DB_POOL_SIZE', 10))
+    options.setdefault('max_overflow', config.get('DB_MAX_OVERFLOW', 10))
+    options.setdefault('pool_timeout', config.get('DB_POOL_TIMEOUT', 10))
+    if url.get_backend_name() != 'sqlite':
+        # A local file never drops idle connections, so only servers need these
+        options.setdefault('pool_pre_ping', config.get('DB_POOL_PRE_PING', True))
+        if config.get('DB_POOL_RECYCLE'):
+            options.setdefault('pool_recycle', config['DB_POOL_RECYCLE'])
+    return options
+
+
+def sqlite_pragmas(config) -> dict:
+    """Return the PRAGMAs applied to every new SQLite connection."""
+    pragmas = {
+        'busy_timeout': config.get('SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'temp_store': 'MEMORY',
+    }
+    if config.get('SQLITE_WAL', True):
+        pragmas['journal_mode'] = 'WAL'
+        pragmas['synchronous'] = 'NORMAL'
+    return pragmas
+
+
+def init_database(app):
+    """
+    Configure the engine from ``DB_POOL_*`` / ``SQLITE_*`` settings and bind ``db`` to the app.
+
+    Args:
+        app (Flask): The application.
+    """
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+
+    pragmas = sqlite_pragmas(app.config)
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+
+def after_fork(app):
+    """
+    Drop state inherited from a preloading parent process.
+
+    Pooled connections were opened by the parent and must not be shared, so the
+    child forgets them without closing the parent's sockets. Process pools are
+    dropped the same way and recreated lazily on first use.
+
+    Args:
+        app (Flask): The preloaded application.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+    for name in ('password_hasher', 'image_pipeline'):
+        service = app.extensions.get(name)
+        if service is not None:
+            service.reset()
+
+
+@click.command('init-db')
+@with_appcontext
+def init_db_command():
+    """Create all tables in an empty database and mark it as migrated to head."""
+    from flask_migrate import stamp
+
+    db.create_all()
+    stamp()
+    click.echo('Database created and stamped at the latest migration.')
+
+
+def init_migrations(app):
+    """
+    Register ``flask init-db`` and, for apps built by the ``flask`` CLI, ``flask db``.
+
+    Args:
+        app (Flask): The application.
+    """
+    app.cli.add_command(init_db_command)
+    if click.get_current_context(silent=True) is None:
+        return
+    from flask_migrate import Migrate
+
+    Migrate(app, db)
@@ -0,0 +1,330 @@
+"""
+Live catalog and basket updates pushed to browsers as server-sent events.
+
+Views never publish directly. The broker subscribes to the signals in
+``signals.py`` and turns each committed change into a small delta:
+
+    groups   {"groups": [{"id": 3, "member_count": 41}], "removed": [7]}   every client
+    basket   {"basket_ids": [4, 9], "version": 12}                          that user only
+
+Deltas are fanned out to the ``/events`` streams of this process. With
+``EVENTS_BACKEND_URL`` they travel through a shared transport first, so
+streams in every worker process receive them:
+
+    unset                in-process only; nothing is published while no stream is open
+    memory://            process-local stand-in for the shared code path
+    redis://host:port/0  Redis pub/sub (requires the ``redis`` package)
+
+Every stream has a bounded queue. A client that falls behind is sent ``reset``
+and disconnected instead of holding up publishers; it reconnects and resyncs.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, User, Group, BasketItem
+from signals import basket_changed, checkout_completed, groups_changed
+
+logger = logging.getLogger(__name__)
+
+GROUPS_CHANNEL = 'groups'
+
+
+def user_channel(user_id: int) -> str:
+    """Channel carrying one user's basket updates."""
+    return f'user:{user_id}'
+
+
+def format_event(event: str, data: str) -> str:
+    """Encode one server-sent event."""
+    return f'event: {event}\ndata: {data}\n\n'
+
+
+class Subscription:
+    """
+    Bounded queue of ``(event, data)`` pairs for one open stream.
+
+    Args:
+        channels (iterable): Channels the stream listens to.
+        maxsize (int): Events buffered before the stream is considered too slow.
+    """
+
+    def __init__(self, channels, maxsize: int = 100):
+        self.channels = frozenset(channels)
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize)
+
+    def push(self, event: str, data: str):
+        """Queue an event without blocking; mark the stream overflowed if it is full."""
+        try:
+            self._queue.put_nowait((event, data))
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout: float):
+        """Return the next ``(event, data)``, or None after ``timeout`` seconds."""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LocalTransport:
+    """Delivers published events straight to this process's subscribers."""
+
+    shared = False
+
+    def __init__(self):
+        self.deliver = None
+
+    def publish(self, channel: str, event: str, data: str):
+        self.deliver(channel, event, data)
+
+
+class QueueTransport:
+    """
+    Process-local stand-in for a shared transport.
+
+    Messages are serialised and handed to a listener thread, as with Redis.
+    """
+
+    shared = True
+
+    def __init__(self):
+        self.deliver = None
+        self._messages = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, event: str, data: str):
+        self._messages.put(json.dumps([channel, event, data]))
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        while True:
+            channel, event, data = json.loads(self._messages.get())
+            self.deliver(channel, event, data)
+
+
+class RedisTransport:
+    """Redis pub/sub; one listener thread per process relays messages to local subscribers."""
+
+    shared = True
+    PREFIX = 'zimbos:events:'
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self.deliver = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def publish(self, channel: str, event: str, data: str):
+        self._client.publish(self.PREFIX + channel, json.dumps([event, data]))
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen, name='events-listener', daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        delay = 1
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.PREFIX + '*')
+                delay = 1
+                for message in pubsub.listen():
+                    event, data = json.loads(message['data'])
+                    self.deliver(message['channel'].decode()[len(self.PREFIX):], event, data)
+            except Exception:
+                logger.exception('Event listener lost its Redis connection; retrying in %ss', delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+def make_transport(url: str):
+    """
+    Build an event transport from ``EVENTS_BACKEND_URL``.
+
+    Args:
+        url (str): Transport URL, or None/empty for in-process delivery only.
+
+    Returns:
+        LocalTransport | QueueTransport | RedisTransport: The transport.
+    """
+    if not url:
+        return LocalTransport()
+    if url.startswith('memory://'):
+        return QueueTransport()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisTransport(url)
+    raise ValueError(f'Unsupported EVENTS_BACKEND_URL: {url!r}')
+
+
+class EventBroker:
+    """
+    Fans published events out to the open streams of this process.
+
+    Args:
+        transport: Where published events go before delivery (see :func:`make_transport`).
+        queue_size (int): Per-stream buffer size.
+    """
+
+    def __init__(self, transport, queue_size: int = 100):
+        self.transport = transport
+        self.transport.deliver = self.deliver
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channels) -> Subscription:
+        """Open a blocking subscription to ``channels``."""
+        return self.add(Subscription(channels, self.queue_size))
+
+    def add(self, subscription):
+        """Register a subscription; the transport's listener starts with the first one."""
+        if self.transport.shared:
+            self.transport.start()
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+    def wants(self, channel: str) -> bool:
+        """False if publishing to ``channel`` could not reach any stream."""
+        return self.transport.shared or channel in self._subscribers
+
+    def publish(self, channel: str, event: str, payload: dict):
+        """Publish a JSON payload to a channel."""
+        if not self.wants(channel):
+            return
+        try:
+            self.transport.publish(channel, event, json.dumps(payload, separators=(',', ':')))
+        except Exception:
+            # Live updates are best effort; never fail the request that caused them
+            logger.exception('Publishing %s to %s failed', event, channel)
+
+    def deliver(self, channel: str, event: str, data: str):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.push(event, data)
+
+    def stream(self, user_id: int, heartbeat: float = 15, max_seconds: float = 300):
+        """
+        Yield the server-sent events for one user's stream.
+
+        The stream ends after ``max_seconds`` (the browser reconnects on its own),
+        so long-lived connections are spread across workers and deploys.
+
+        Args:
+            user_id (int): The logged-in user.
+            heartbeat (float): Seconds between keep-alive comments.
+            max_seconds (float): Lifetime of the stream.
+        """
+        subscription = self.subscribe((GROUPS_CHANNEL, user_channel(user_id)))
+        try:
+            yield 'retry: 3000\n\n'
+            deadline = time.monotonic() + max_seconds
+            while time.monotonic() < deadline:
+                if subscription.overflowed:
+                    yield format_event('reset', '{}')
+                    return
+                item = subscription.get(timeout=heartbeat)
+                yield format_event(*item) if item else ': keep-alive\n\n'
+        finally:
+            self.unsubscribe(subscription)
+
+
+def get_event_broker() -> EventBroker:
+    """Return the event broker of the current application."""
+    return current_app.extensions['event_broker']
+
+
+def publish_group_counts(broker: EventBroker, group_ids):
+    """Publish the current member counts of ``group_ids``; missing ones are reported as removed."""
+    if not group_ids or not broker.wants(GROUPS_CHANNEL):
+        return
+    rows = db.session.execute(
+        select(Group.id, Group.member_count).where(Group.id.in_(list(group_ids)))
+    ).all()
+    found = {row.id for row in rows}
+    broker.publish(GROUPS_CHANNEL, 'groups', {
+        'groups': [{'id': row.id, 'member_count': row.member_count or 0} for row in rows],
+        'removed': [gid for gid in group_ids if gid not in found],
+    })
+
+
+def publish_basket(broker: EventBroker, user_id: int):
+    """Publish a user's basket contents and version."""
+    channel = user_channel(user_id)
+    if not broker.wants(channel):
+        return
+    rows = db.session.execute(
+        select(User.basket_version, BasketItem.group_id)
+        .outerjoin(BasketItem, BasketItem.user_id == User.id)
+        .where(User.id == user_id)
+        .order_by(BasketItem.id)
+    ).all()
+    if not rows:
+        return
+    broker.publish(channel, 'basket', {
+        'basket_ids': [row.group_id for row in rows if row.group_id is not None],
+        'version': rows[0].basket_version,
+    })
+
+
+def init_events(app) -> EventBroker:
+    """
+    Create the application's event broker and publish deltas from change signals.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        EventBroker: The broker stored in ``app.extensions['event_broker']``.
+    """
+    broker = EventBroker(
+        make_transport(app.config.get('EVENTS_BACKEND_URL')),
+        queue_size=app.config.get('EVENTS_QUEUE_SIZE', 100),
+    )
+    app.extensions['event_broker'] = broker
+
+    def on_groups_changed(sender, group_ids=(), **extra):
+        publish_group_counts(broker, group_ids)
+
+    def on_basket_changed(sender, user_id=None, **extra):
+        publish_basket(broker, user_id)
+
+    def on_checkout_completed(sender, user_id=None, group_ids=(), **extra):
+        publish_group_counts(broker, group_ids)
+        publish_basket(broker, user_id)
+
+    # Connected strongly: the handlers are closures that would otherwise be collected
+    groups_changed.connect(on_groups_changed, sender=app, weak=False)
+    basket_changed.connect(on_basket_changed, sender=app, weak=False)
+    checkout_completed.connect(on_checkout_completed, sender=app, weak=False)
+    return broker
@@ -0,0 +1,104 @@
+"""
+Rendered-fragment cache for dashboard group cards.
+
+The user-independent HTML of each card (picture, name, member count) is rendered
+once and cached under ``(group_id, version)``. The dashboard renders only the
+per-user basket button between the cached head and tail.
+
+A group gets a new version on ``groups_changed`` (admin create/edit/delete) and
+``checkout_completed`` (member_count changed), which makes the old entry
+unreachable. Versions come from one counter, so no two groups ever share one.
+Only the ``FRAGMENT_CACHE_SIZE`` most recently changed groups keep their own
+version. Older ones fall back to the version of the last group dropped. That
+version is newer than anything they were rendered under before, so they can
+only miss, never hit a stale card. Versions are per process, so other workers
+can serve a stale card for at most ``FRAGMENT_CACHE_TTL`` seconds.
+"""
+import threading
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+from services.cache import LRUCache
+from signals import groups_changed, checkout_completed
+
+CARD_TEMPLATE = 'main/_group_card.html'
+BUTTON_SLOT = '<!--basket-button-->'
+
+
+class GroupCardCache:
+    """
+    LRU cache of rendered group card fragments.
+
+    Args:
+        app (Flask): Application whose Jinja environment renders the cards.
+        maxsize (int): Maximum number of cached cards.
+        ttl (float): Seconds a rendered card stays valid.
+    """
+
+    def __init__(self, app, maxsize: int = 5000, ttl: float = 300):
+        self.app = app
+        self.maxsize = maxsize
+        self._cache = LRUCache(maxsize, ttl)
+        self._versions = OrderedDict()  # group id -> version, oldest first
+        self._generation = 0
+        self._floor = 0  # Version of groups without an entry
+        self._lock = threading.Lock()
+
+    def render(self, group):
+        """
+        Return the cached ``(head, tail)`` markup of a group's card.
+
+        Args:
+            group: Row or Group exposing ``id``, ``name``, ``picture_filename`` and ``member_count``.
+
+        Returns:
+            tuple: Markup before and after the basket button slot.
+        """
+        key = (group.id, self._versions.get(group.id, self._floor))
+        parts = self._cache.get(key)
+        if parts is None:
+            # Rendered straight from the environment: skips context processors,
+            # which would otherwise run once per card
+            html = self.app.jinja_env.get_template(CARD_TEMPLATE).render(group=group)
+            head, tail = html.split(BUTTON_SLOT, 1)
+            parts = (Markup(head), Markup(tail))
+            self._cache.set(key, parts)
+        return parts
+
+    def invalidate(self, group_ids):
+        """Drop the cached cards of the given groups."""
+        with self._lock:
+            for group_id in group_ids:
+                self._cache.delete((group_id, self._versions.get(group_id, self._floor)))
+                self._generation += 1
+                self._versions[group_id] = self._generation
+                self._versions.move_to_end(group_id)
+            while len(self._versions) > self.maxsize:
+                _, self._floor = self._versions.popitem(last=False)
+
+
+def init_fragment_cache(app) -> GroupCardCache:
+    """
+    Create the card cache, expose it to templates as ``group_card`` and subscribe it to change signals.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        GroupCardCache: The cache stored in ``app.extensions['group_card_cache']``.
+    """
+    cache = GroupCardCache(
+        app,
+        maxsize=app.config.get('FRAGMENT_CACHE_SIZE', 5000),
+        ttl=app.config.get('FRAGMENT_CACHE_TTL', 300),
+    )
+    app.extensions['group_card_cache'] = cache
+    app.jinja_env.globals['group_card'] = cache.render
+
+    def on_groups_changed(sender, group_ids=(), **extra):
+        cache.invalidate(group_ids)
+
+    groups_changed.connect(on_groups_changed, sender=app, weak=False)
+    checkout_completed.connect(on_groups_changed, sender=app, weak=False)
+    return cache
@@ -0,0 +1,127 @@
+"""
+HTTP caching helpers: cheap validators for conditional GETs and versioned,
+immutable static asset URLs.
+
+Validators return ``(etag, last_modified)`` computed from a single aggregate
+query, so the :func:`utililties.decorators.conditional` decorator can answer
+``304 Not Modified`` without running the view or rendering a template.
+
+Every ``url_for('static', filename=...)`` gets a ``v=<content hash>`` argument;
+responses for versioned URLs are served with a one-year ``immutable``
+Cache-Control, while unversioned requests keep Flask's ETag/Last-Modified
+revalidation.
+"""
+import hashlib
+import os
+import threading
+
+from flask import request
+from sqlalchemy import func, select
+
+from models import db, User, Group
+
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+def validator_query(model):
+    """Select returning ``(count, max id, max updated_at)`` of a table."""
+    return select(func.count(model.id), func.max(model.id), func.max(model.updated_at))
+
+
+def validator_from_row(model, row):
+    """Turn a :func:`validator_query` row into ``(data_tag, last_modified)``."""
+    count, last_id, last_modified = row
+    stamp = last_modified.isoformat() if last_modified else ''
+    return f'{model.__tablename__}:{count}:{last_id}:{stamp}', last_modified
+
+
+def _table_validator(model):
+    return validator_from_row(model, db.session.execute(validator_query(model)).one())
+
+
+def catalog_validator():
+    """Validator that changes whenever any group is created, edited, deleted or joined."""
+    return _table_validator(Group)
+
+
+def admin_groups_validator():
+    """
+    Validator for the admin group list, which also shows seat counters.
+
+    Holds and sales leave ``updated_at`` alone so the public catalog stays cached,
+    so their totals are part of the tag. No Last-Modified is returned, since a
+    seat change would not move it.
+    """
+    row = db.session.execute(
+        validator_query(Group).add_columns(func.sum(Group.seats_sold), func.sum(Group.seats_held))
+    ).one()
+    data_tag, _ = validator_from_row(Group, row[:3])
+    return f'{data_tag}:{row[3] or 0}:{row[4] or 0}', None
+
+
+def users_validator():
+    """Validator that changes whenever any user row changes."""
+    return _table_validator(User)
+
+
+class StaticVersioner:
+    """
+    Compute short content hashes for static files, cached per (mtime, size).
+
+    Args:
+        static_folder (str): Absolute path of the application's static folder.
+    """
+
+    def __init__(self, static_folder: str):
+        self.static_folder = static_folder
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def version(self, filename: str):
+        """Return the version string for a static file, or None if it does not exist."""
+        path = os.path.join(self.static_folder, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        cached = self._hashes.get(filename)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        digest = hashlib.md5(usedforsecurity=False)
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(65536), b''):
+                digest.update(chunk)
+        version = digest.hexdigest()[:12]
+        with self._lock:
+            self._hashes[filename] = (stamp, version)
+        return version
+
+
+def init_static_caching(app):
+    """
+    Version static URLs by content and serve versioned assets as immutable.
+
+    Args:
+        app (Flask): The application.
+    """
+    versioner = StaticVersioner(app.static_folder)
+
+    @app.url_defaults
+    def _add_static_version(endpoint, values):
+        if endpoint == 'static' and 'filename' in values and 'v' not in values:
+            version = versioner.version(values['filename'])
+            if version:
+                values['v'] = version
+
+    @app.after_request
+    def _immutable_static(response):
+        if request.endpoint == 'static' and request.args.get('v') and response.status_code in (200, 304):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return response
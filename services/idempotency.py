@@ -0,0 +1,167 @@
+"""
+Idempotency keys for endpoints whose side effects must not repeat on a retry.
+
+Clients send an ``Idempotency-Key`` header (any unique string, e.g. a UUID made
+per user action) and send the same key again when retrying. The first request
+with a key runs normally, and its successful response is stored for
+``IDEMPOTENCY_TTL_SECONDS``. Retries get the stored response back without the
+view running again, so there are no new database writes or emails:
+
+    first request          runs the view, stores a 2xx response
+    retry, same body       stored response, with ``Idempotent-Replayed: true``
+    retry while running    409 with ``Retry-After``
+    same key, other body   422
+
+Keys are scoped to the endpoint and the user. Failed responses are not stored,
+so a retry after an error runs the view again. Responses are kept in an
+in-process LRU. With ``CACHE_BACKEND_URL`` they are also written to the shared
+backend, so a retry that lands on another worker process is answered too.
+Requests without the header and non-POST requests pass straight through.
+"""
+import hashlib
+import threading
+from functools import wraps
+
+from flask import current_app, jsonify, request
+from flask_login import current_user
+
+from services.cache import LRUCache, make_shared_backend
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyStore:
+    """
+    Stored responses and in-flight claims, by scoped idempotency key.
+
+    Args:
+        ttl (float): Seconds a stored response is replayed.
+        maxsize (int): Maximum responses kept in process.
+        shared: Optional shared backend from :func:`services.cache.make_shared_backend`.
+        claim_ttl (float): Seconds after which an abandoned claim lapses (shared backend only).
+    """
+
+    def __init__(self, ttl: float = 600, maxsize: int = 10_000, shared=None, claim_ttl: float = 60):
+        self.ttl = ttl
+        self.claim_ttl = claim_ttl
+        self._local = LRUCache(maxsize, ttl)
+        self._shared = shared
+        self._claims = set()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Return the stored response for ``key``, or None."""
+        value = self._local.get(key)
+        if value is None and self._shared is not None:
+            value = self._shared.get(f'idem:{key}')
+            if value is not None:
+                self._local.set(key, value)
+        return value
+
+    def save(self, key: str, value: dict):
+        """Store a response for ``key``."""
+        self._local.set(key, value)
+        if self._shared is not None:
+            self._shared.set(f'idem:{key}', value, ttl=self.ttl)
+
+    def claim(self, key: str) -> bool:
+        """Mark ``key`` as in flight; False if another request already holds it."""
+        if self._shared is not None:
+            return self._shared.incr(f'idem:{key}:claim', ttl=self.claim_ttl) == 1
+        with self._lock:
+            if key in self._claims:
+                return False
+            self._claims.add(key)
+            return True
+
+    def release(self, key: str):
+        """Drop the in-flight mark of ``key``."""
+        if self._shared is not None:
+            self._shared.delete(f'idem:{key}:claim')
+        else:
+            with self._lock:
+                self._claims.discard(key)
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Return the idempotency store of the current application."""
+    return current_app.extensions['idempotency_store']
+
+
+def _replay(stored: dict):
+    response = current_app.response_class(stored['body'], status=stored['status'], mimetype=stored['mimetype'])
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _replay_or_mismatch(stored: dict, fingerprint: str):
+    if stored['fingerprint'] != fingerprint:
+        return jsonify({'success': False, 'message': f'{HEADER} was already used for a different request.'}), 422
+    return _replay(stored)
+
+
+def idempotent(view):
+    """
+    Replay the stored response when a POST repeats its ``Idempotency-Key``.
+
+    Apply below ``login_required`` so that keys are scoped to the logged-in user.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None or request.method != 'POST':
+            return view(*args, **kwargs)
+        if not key.strip() or len(key) > MAX_KEY_LENGTH:
+            return jsonify({'success': False, 'message': f'Invalid {HEADER} header.'}), 400
+
+        store = get_idempotency_store()
+        owner = current_user.id if current_user.is_authenticated else request.remote_addr
+        scoped = f'{request.endpoint}:{owner}:{key}'
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        stored = store.get(scoped)
+        if stored is not None:
+            return _replay_or_mismatch(stored, fingerprint)
+        if not store.claim(scoped):
+            response = jsonify({'success': False, 'message': 'This request is already being processed.'})
+            response.status_code = 409
+            response.headers['Retry-After'] = '1'
+            return response
+        try:
+            # The first request may have finished between the lookup and the claim
+            stored = store.get(scoped)
+            if stored is not None:
+                return _replay_or_mismatch(stored, fingerprint)
+            response = current_app.make_response(view(*args, **kwargs))
+            if 200 <= response.status_code < 300 and not response.is_streamed:
+                store.save(scoped, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'mimetype': response.mimetype,
+                    'body': response.get_data(as_text=True),
+                })
+            return response
+        finally:
+            store.release(scoped)
+
+    return wrapper
+
+
+def init_idempotency(app) -> IdempotencyStore:
+    """
+    Create the application's idempotency store.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        IdempotencyStore: The store kept in ``app.extensions['idempotency_store']``.
+    """
+    store = IdempotencyStore(
+        ttl=app.config.get('IDEMPOTENCY_TTL_SECONDS', 600),
+        maxsize=app.config.get('IDEMPOTENCY_CACHE_SIZE', 10_000),
+        shared=make_shared_backend(app.config.get('CACHE_BACKEND_URL')),
+    )
+    app.extensions['idempotency_store'] = store
+    return store
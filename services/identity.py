@@ -0,0 +1,147 @@
+"""
+Identity cache for Flask-Login.
+
+Caches the logged-in user's row (without the password hash) and a compact
+summary of their basket and purchased group ids, so a typical authenticated
+request needs no query to rebuild ``current_user`` and render basket state.
+
+Lookups go through an in-process LRU first and then, when ``CACHE_BACKEND_URL``
+is set, a shared backend. Entries are dropped on the ``users_changed``,
+``basket_changed`` and ``checkout_completed`` signals. Other processes' local
+tiers may lag an invalidation by at most ``IDENTITY_CACHE_TTL`` seconds.
+"""
+from flask import current_app
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import db, User, BasketItem, PurchasedItem
+from services.cache import LRUCache, make_shared_backend
+from signals import users_changed, basket_changed, checkout_completed
+
+# Columns cached for the user row; the password hash is never cached
+USER_FIELDS = ('id', 'email', 'name', 'phone', 'is_active', 'is_blacklisted', 'role')
+
+
+class IdentityCache:
+    """
+    Two-tier cache of user rows and basket/purchase summaries.
+
+    Args:
+        maxsize (int): Entries kept in the local LRU.
+        ttl (float): Seconds an entry stays valid in either tier.
+        shared: Optional shared backend from :func:`services.cache.make_shared_backend`.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 60, shared=None):
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = shared
+        self.ttl = ttl
+
+    def _get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def _set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl)
+
+    def invalidate(self, user_id: int, user: bool = True, summary: bool = True):
+        """Drop the cached row and/or summary of a user."""
+        keys = []
+        if user:
+            keys.append(f'identity:user:{user_id}')
+        if summary:
+            keys.append(f'identity:summary:{user_id}')
+        self.local.delete(*keys)
+        if self.shared is not None:
+            self.shared.delete(*keys)
+
+    def load_user(self, user_id: int):
+        """
+        Return the user attached to the current session, from cache when possible.
+
+        Args:
+            user_id (int): Id stored in the Flask-Login session.
+
+        Returns:
+            User | None: The user, or None if it does not exist.
+        """
+        key = f'identity:user:{user_id}'
+        data = self._get(key)
+        if data is None:
+            user = db.session.get(User, user_id)
+            if user is None:
+                return None
+            self._set(key, {field: getattr(user, field) for field in USER_FIELDS})
+            return user
+
+        existing = db.session.identity_map.get(db.session.identity_key(User, user_id))
+        if existing is not None:
+            return existing
+        # Rebuild a persistent instance without a SELECT; attributes that were not
+        # cached (password, relationships) are expired and load lazily on access
+        user = User(**data)
+        make_transient_to_detached(user)
+        db.session.add(user)
+        return user
+
+    def summary(self, user_id: int) -> dict:
+        """
+        Return ``{'basket_ids': [...], 'purchased_ids': [...]}`` for a user.
+
+        Args:
+            user_id (int): The user.
+
+        Returns:
+            dict: Group ids currently in the basket and already purchased.
+        """
+        key = f'identity:summary:{user_id}'
+        data = self._get(key)
+        if data is None:
+            basket_ids = [gid for (gid,) in db.session.query(BasketItem.group_id)
+                          .filter_by(user_id=user_id).order_by(BasketItem.id)]
+            purchased_ids = [gid for (gid,) in db.session.query(PurchasedItem.group_id)
+                             .filter_by(user_id=user_id)]
+            data = {'basket_ids': basket_ids, 'purchased_ids': purchased_ids}
+            self._set(key, data)
+        return data
+
+
+def get_identity_cache() -> IdentityCache:
+    """Return the identity cache of the current application."""
+    return current_app.extensions['identity_cache']
+
+
+def init_identity_cache(app) -> IdentityCache:
+    """
+    Create the application's identity cache and subscribe it to change signals.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        IdentityCache: The cache stored in ``app.extensions['identity_cache']``.
+    """
+    cache = IdentityCache(
+        maxsize=app.config.get('IDENTITY_CACHE_SIZE', 4096),
+        ttl=app.config.get('IDENTITY_CACHE_TTL', 60),
+        shared=make_shared_backend(app.config.get('CACHE_BACKEND_URL')),
+    )
+    app.extensions['identity_cache'] = cache
+
+    def on_users_changed(sender, user_ids=(), **extra):
+        for user_id in user_ids:
+            cache.invalidate(user_id)
+
+    def on_basket_changed(sender, user_id=None, **extra):
+        cache.invalidate(user_id, user=False)
+
+    # Connected strongly: the handlers are closures that would otherwise be collected
+    users_changed.connect(on_users_changed, sender=app, weak=False)
+    basket_changed.connect(on_basket_changed, sender=app, weak=False)
+    checkout_completed.connect(on_basket_changed, sender=app, weak=False)
+    return cache
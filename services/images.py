@@ -0,0 +1,281 @@
+"""
+Group picture pipeline: thumbnails with the group name drawn on, built off-request.
+
+Sources can be a file under ``static/`` (admin uploads land in ``static/uploads``),
+an ``http(s)://`` URL or an ``s3://bucket/key`` URL. When ``S3_STAND_IN_DIR`` is
+set, S3 URLs are read from ``<dir>/<bucket>/<key>`` instead of S3 (boto3 is only
+imported otherwise). Groups without a picture of their own share
+``GROUP_DEFAULT_PICTURE``; the name overlay tells the cards apart.
+
+Rendering runs in a process pool from :func:`services.background.make_process_pool`. Outputs are content-addressed by a hash of the
+source bytes, the name and the pipeline settings, and stored under
+``static/<IMAGE_CACHE_DIR>/<key[:2]>/<key>-<width>.{webp,jpg}``. Identical inputs
+are never rendered twice. Pillow is optional: without it the pipeline is
+disabled and cards fall back to the original picture.
+"""
+import hashlib
+import importlib.util
+import logging
+import os
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import current_app, url_for
+from flask.cli import AppGroup
+
+from models import db, Group
+from services.background import make_process_pool
+from signals import groups_changed
+
+logger = logging.getLogger(__name__)
+
+# Bump to re-render every image after changing the drawing code
+PIPELINE_VERSION = '1'
+
+
+def load_source(source: str, static_folder: str, s3_stand_in_dir: str = None) -> bytes:
+    """
+    Read the raw bytes of a picture source.
+
+    Args:
+        source (str): Static-relative path, http(s) URL or s3:// URL.
+        static_folder (str): Application static folder for relative paths.
+        s3_stand_in_dir (str): Local directory standing in for S3, if any.
+
+    Returns:
+        bytes: The picture file contents.
+    """
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            return response.read()
+    if source.startswith('s3://'):
+        bucket, _, key = source[len('s3://'):].partition('/')
+        if s3_stand_in_dir:
+            with open(os.path.join(s3_stand_in_dir, bucket, key), 'rb') as fh:
+                return fh.read()
+        import boto3
+
+        return boto3.client('s3').get_object(Bucket=bucket, Key=key)['Body'].read()
+    with open(os.path.join(static_folder, source), 'rb') as fh:
+        return fh.read()
+
+
+def image_key(data: bytes, name: str, sizes) -> str:
+    """Content address of a rendered image set."""
+    digest = hashlib.sha256(data)
+    digest.update(f'|{name}|{",".join(map(str, sizes))}|{PIPELINE_VERSION}'.encode())
+    return digest.hexdigest()[:32]
+
+
+def _load_font(font_path, size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype(font_path or 'DejaVuSans-Bold.ttf', size)
+    except OSError:
+        return ImageFont.load_default(size=size)
+
+
+def _draw_name(image, name, font_path=None):
+    from PIL import ImageDraw
+
+    width, height = image.size
+    overlay = image.convert('RGBA')
+    band = ImageDraw.Draw(overlay, 'RGBA')
+
+    # Start at ~1/14 of the width and shrink until the name fits on one line
+    size = max(12, width // 14)
+    while True:
+        font = _load_font(font_path, size)
+        left, top, right, bottom = band.textbbox((0, 0), name, font=font)
+        text_w, text_h = right - left, bottom - top
+        if text_w <= width * 0.92 or size <= 10:
+            break
+        size -= 2
+
+    padding = max(6, size // 2)
+    band_top = height - text_h - 2 * padding
+    band.rectangle((0, band_top, width, height), fill=(0, 0, 0, 150))
+    band.text(((width - text_w) / 2 - left, band_top + padding - top), name, font=font, fill=(255, 255, 255, 255))
+    return overlay.convert('RGB')
+
+
+def render_group_images(source: str, name: str, sizes, output_dir: str, static_folder: str,
+                        s3_stand_in_dir: str = None, font_path: str = None) -> str:
+    """
+    Render WebP and JPEG thumbnails of a picture with the group name overlaid.
+
+    Runs inside the pool's worker processes, so it only takes plain arguments.
+
+    Args:
+        source (str): Picture source (see :func:`load_source`).
+        name (str): Group name drawn onto the picture.
+        sizes (tuple): Output widths in pixels.
+        output_dir (str): Root directory of the content-addressed cache.
+        static_folder (str): Application static folder.
+        s3_stand_in_dir (str): Local directory standing in for S3, if any.
+        font_path (str): TrueType font for the overlay.
+
+    Returns:
+        str: Content key of the rendered set.
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    data = load_source(source, static_folder, s3_stand_in_dir)
+    key = image_key(data, name, sizes)
+    target_dir = os.path.join(output_dir, key[:2])
+    if all(os.path.exists(os.path.join(target_dir, f'{key}-{w}.{ext}'))
+           for w in sizes for ext in ('webp', 'jpg')):
+        return key
+
+    os.makedirs(target_dir, exist_ok=True)
+    with Image.open(BytesIO(data)) as original:
+        original = original.convert('RGB')
+        for width in sizes:
+            image = original.copy()
+            image.thumbnail((width, width * 4))
+            image = _draw_name(image, name, font_path)
+            for ext, fmt, options in (('webp', 'WEBP', {'quality': 80, 'method': 4}),
+                                      ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True})):
+                path = os.path.join(target_dir, f'{key}-{width}.{ext}')
+                tmp_path = f'{path}.{os.getpid()}.tmp'
+                image.save(tmp_path, fmt, **options)
+                os.replace(tmp_path, path)
+    return key
+
+
+def pillow_available() -> bool:
+    """Return True if Pillow is installed (without importing it)."""
+    return importlib.util.find_spec('PIL') is not None
+
+
+class ImagePipeline:
+    """
+    Schedules group image rendering on a process pool and records the results.
+
+    Args:
+        app (Flask): The application.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.sizes = tuple(app.config.get('IMAGE_SIZES', (320, 640)))
+        self.output_dir = os.path.join(app.static_folder, app.config.get('IMAGE_CACHE_DIR', 'cache/images'))
+        self.enabled = pillow_available()
+        self._pool = None
+        if not self.enabled:
+            logger.warning('Pillow is not installed; group thumbnails are disabled.')
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = make_process_pool(self.app.config.get('IMAGE_WORKERS', 2))
+        return self._pool
+
+    def reset(self):
+        """Forget an inherited pool without stopping it (used in forked server workers)."""
+        self._pool = None
+
+    def source_for(self, group):
+        """Return the picture source of a group, falling back to the shared default."""
+        if group.picture_url:
+            return group.picture_url
+        if group.picture_filename:
+            return f'uploads/{group.picture_filename}'
+        default = self.app.config.get('GROUP_DEFAULT_PICTURE')
+        if default and os.path.exists(os.path.join(self.app.static_folder, default)):
+            return default
+        return None
+
+    def _job_args(self, group):
+        return (
+            self.source_for(group), group.name, self.sizes, self.output_dir, self.app.static_folder,
+            self.app.config.get('S3_STAND_IN_DIR'), self.app.config.get('IMAGE_FONT_PATH'),
+        )
+
+    def schedule(self, group):
+        """
+        Render a group's images in the background and store the key when done.
+
+        Args:
+            group (Group): The group whose name or picture changed.
+        """
+        if not self.enabled or self.source_for(group) is None:
+            return None
+        group_id = group.id
+        future = self.pool.submit(render_group_images, *self._job_args(group))
+        future.add_done_callback(lambda f: self._store_result(group_id, f))
+        return future
+
+    def render_now(self, group) -> str:
+        """Render a group's images synchronously (CLI use) and store the key."""
+        if not self.enabled or self.source_for(group) is None:
+            return None
+        group.image_key = render_group_images(*self._job_args(group))
+        return group.image_key
+
+    def _store_result(self, group_id, future):
+        try:
+            key = future.result()
+        except Exception:
+            logger.exception('Rendering images for group %s failed', group_id)
+            return
+        with self.app.app_context():
+            try:
+                updated = Group.query.filter_by(id=group_id).update(
+                    {'image_key': key}, synchronize_session=False)
+                db.session.commit()
+            finally:
+                db.session.remove()
+            if updated:
+                groups_changed.send(self.app, group_ids=[group_id])
+
+
+def group_image_url(image_key: str, width: int, ext: str) -> str:
+    """URL of a rendered image in the content-addressed cache."""
+    cache_dir = current_app.config.get('IMAGE_CACHE_DIR', 'cache/images')
+    return url_for('static', filename=f'{cache_dir}/{image_key[:2]}/{image_key}-{width}.{ext}')
+
+
+def get_image_pipeline() -> ImagePipeline:
+    """Return the image pipeline of the current application."""
+    return current_app.extensions['image_pipeline']
+
+
+images_cli = AppGroup('images', help='Group picture pipeline commands.')
+
+
+@images_cli.command('rebuild')
+def rebuild_command():
+    """Render thumbnails for every group synchronously."""
+    pipeline = get_image_pipeline()
+    if not pipeline.enabled:
+        raise click.ClickException('Pillow is not installed.')
+    done = 0
+    for group in Group.query.yield_per(100):
+        try:
+            if pipeline.render_now(group):
+                done += 1
+        except Exception as e:
+            click.echo(f'Group {group.id}: {e}', err=True)
+    db.session.commit()
+    click.echo(f'Rendered images for {done} group(s).')
+
+
+def init_images(app) -> ImagePipeline:
+    """
+    Create the image pipeline, the ``group_image_url`` template helper and CLI commands.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        ImagePipeline: The pipeline stored in ``app.extensions['image_pipeline']``.
+    """
+    pipeline = ImagePipeline(app)
+    app.extensions['image_pipeline'] = pipeline
+    app.jinja_env.globals['group_image_url'] = group_image_url
+    app.cli.add_command(images_cli)
+    return pipeline
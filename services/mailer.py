@@ -0,0 +1,360 @@
+"""
+Database-backed email outbox with pluggable delivery transports.
+
+Requests only insert an :class:`models.OutboundEmail` row; a pool of background
+workers claims due messages in batches, hands them to the configured transport
+and reschedules failures with exponential backoff until they are marked dead.
+
+Transports (``MAIL_TRANSPORT``):
+    file      Write ``.eml`` files into ``MAIL_FILE_DIR`` (local stand-in, the default
+              when no provider key is configured).
+    smtp      Deliver through ``SMTP_HOST``.
+    sendgrid  SendGrid Web API (``SENDGRID_API_KEY``).
+    mailgun   Mailgun API (``MAILGUN_API_KEY``/``MAILGUN_DOMAIN``).
+"""
+import logging
+import os
+import random
+import smtplib
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import click
+from flask import current_app, render_template
+from flask.cli import AppGroup
+
+from models import db, OutboundEmail
+from services.background import BackgroundWorker, register_worker
+
+logger = logging.getLogger(__name__)
+
+
+class MailTransport:
+    """Base class for delivery transports."""
+
+    def send(self, message: OutboundEmail, sender: str):
+        """Deliver one message, raising on failure."""
+        raise NotImplementedError
+
+    def send_batch(self, messages, sender: str) -> list:
+        """
+        Deliver a batch of messages.
+
+        Returns:
+            list: One entry per message, None on success or the raised exception.
+        """
+        results = []
+        for message in messages:
+            try:
+                self.send(message, sender)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def _build_mime(message: OutboundEmail, sender: str) -> EmailMessage:
+    mime = EmailMessage()
+    mime['From'] = sender
+    mime['To'] = message.to_email
+    mime['Subject'] = message.subject
+    mime.set_content(message.text_body or '')
+    if message.html_body:
+        mime.add_alternative(message.html_body, subtype='html')
+    return mime
+
+
+class FileTransport(MailTransport):
+    """Write each message as an ``.eml`` file; stands in for a real provider locally."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def send(self, message, sender):
+        path = os.path.join(self.directory, f'{message.id}-{uuid.uuid4().hex[:8]}.eml')
+        with open(path, 'wb') as fh:
+            fh.write(bytes(_build_mime(message, sender)))
+
+
+class SMTPTransport(MailTransport):
+    """Deliver over SMTP, reusing one connection per batch."""
+
+    def __init__(self, host, port=25, username=None, password=None, use_tls=False, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            conn.starttls()
+        if self.username:
+            conn.login(self.username, self.password)
+        return conn
+
+    def send(self, message, sender):
+        self.send_batch([message], sender)
+
+    def send_batch(self, messages, sender):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            return [e] * len(messages)
+        results = []
+        with conn:
+            for message in messages:
+                try:
+                    conn.send_message(_build_mime(message, sender))
+                    results.append(None)
+                except Exception as e:
+                    results.append(e)
+        return results
+
+
+class SendGridTransport(MailTransport):
+    """Deliver through the SendGrid Web API."""
+
+    def __init__(self, api_key, data_residency=None):
+        from sendgrid import SendGridAPIClient
+
+        self.client = SendGridAPIClient(api_key)
+        if data_residency:
+            self.client.set_sendgrid_data_residency(data_residency)
+
+    def send(self, message, sender):
+        from sendgrid.helpers.mail import Mail
+
+        mail = Mail(
+            from_email=sender,
+            to_emails=[message.to_email],
+            subject=message.subject,
+            plain_text_content=message.text_body,
+            html_content=message.html_body,
+        )
+        response = self.client.send(mail)
+        if response.status_code >= 400:
+            raise RuntimeError(f'SendGrid returned {response.status_code}: {response.body}')
+
+
+class MailgunTransport(MailTransport):
+    """Deliver through the Mailgun messages API."""
+
+    def __init__(self, api_key, domain):
+        from mailgun.client import Client
+
+        self.client = Client(auth=('api', api_key))
+        self.domain = domain
+
+    def send(self, message, sender):
+        data = {
+            'from': sender,
+            'to': [message.to_email],
+            'subject': message.subject,
+            'text': message.text_body,
+            'html': message.html_body,
+        }
+        response = self.client.messages.create(data=data, domain=self.domain)
+        if response.status_code >= 400:
+            raise RuntimeError(f'Mailgun returned {response.status_code}: {response.text}')
+
+
+def _make_transport(app) -> MailTransport:
+    name = app.config.get('MAIL_TRANSPORT', 'file')
+    if name == 'file':
+        directory = app.config.get('MAIL_FILE_DIR', 'outbox')
+        return FileTransport(os.path.join(app.instance_path, directory))
+    if name == 'smtp':
+        return SMTPTransport(
+            app.config['SMTP_HOST'],
+            app.config.get('SMTP_PORT', 25),
+            app.config.get('SMTP_USERNAME'),
+            app.config.get('SMTP_PASSWORD'),
+            app.config.get('SMTP_USE_TLS', False),
+            app.config.get('MAIL_SEND_TIMEOUT', 30),
+        )
+    if name == 'sendgrid':
+        return SendGridTransport(app.config.get('SENDGRID_API_KEY'), app.config.get('SENDGRID_DATA_RESIDENCY'))
+    if name == 'mailgun':
+        return MailgunTransport(app.config.get('MAILGUN_API_KEY'), app.config.get('MAILGUN_DOMAIN'))
+    raise ValueError(f'Unknown MAIL_TRANSPORT {name!r}')
+
+
+def get_transport(app=None) -> MailTransport:
+    """Return the application's transport, creating it on first use."""
+    app = app or current_app._get_current_object()
+    transport = app.extensions.get('mail_transport')
+    if transport is None:
+        transport = app.extensions['mail_transport'] = _make_transport(app)
+    return transport
+
+
+def enqueue_email(to_email: str, subject: str, text_body: str, html_body: str = None) -> OutboundEmail:
+    """
+    Add a message to the outbox. The caller commits the session.
+
+    Args:
+        to_email (str): Recipient address.
+        subject (str): Subject line.
+        text_body (str): Plain-text body.
+        html_body (str): Optional HTML body.
+
+    Returns:
+        OutboundEmail: The pending outbox row.
+    """
+    message = OutboundEmail(to_email=to_email, subject=subject, text_body=text_body, html_body=html_body)
+    db.session.add(message)
+    return message
+
+
+def render_invite_email(user, links) -> dict:
+    """
+    Render the invite-links email for a user.
+
+    Args:
+        user: Object with ``email`` and ``name``.
+        links (list): Link dicts from ``services.tokens.active_invite_links``.
+
+    Returns:
+        dict: Keyword arguments for :func:`enqueue_email`.
+    """
+    return {
+        'to_email': user.email,
+        'subject': 'Your Zimbos Group Invite Links',
+        'text_body': render_template('emails/invite.txt', user=user, links=links),
+        'html_body': render_template('emails/invite.html', user=user, links=links),
+    }
+
+
+def _retry_delay(attempts: int, base: float, cap: float) -> timedelta:
+    # Exponential backoff with +/-20% jitter so failed batches don't retry in lockstep
+    delay = min(base * (2 ** (attempts - 1)), cap)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def process_outbox() -> int:
+    """
+    Claim one batch of due messages, deliver them and record the outcome.
+
+    Messages stuck in 'sending' (e.g. a worker died mid-batch) become claimable
+    again once their lease expires. The lease is at least long enough for every
+    message of a batch to hit ``MAIL_SEND_TIMEOUT``, so a slow batch is not
+    claimed and sent a second time while it is still being delivered.
+
+    Returns:
+        int: Number of messages processed.
+    """
+    config = current_app.config
+    batch_size = config.get('MAIL_BATCH_SIZE', 20)
+    # Built before claiming so a misconfigured transport leaves the messages pending
+    transport = get_transport()
+    now = datetime.utcnow()
+    claim = uuid.uuid4().hex
+
+    due = (
+        db.session.query(OutboundEmail.id)
+        .filter(OutboundEmail.status.in_(('pending', 'sending')), OutboundEmail.next_attempt_at <= now)
+        .order_by(OutboundEmail.next_attempt_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    ids = [row.id for row in due]
+    if not ids:
+        db.session.rollback()
+        return 0
+
+    # The conditional update is the actual claim: a concurrent worker that selected
+    # the same rows finds next_attempt_at already moved into the future
+    lease_seconds = max(config.get('MAIL_LEASE_SECONDS') or 0, batch_size * config.get('MAIL_SEND_TIMEOUT', 30) + 60)
+    lease = now + timedelta(seconds=lease_seconds)
+    db.session.query(OutboundEmail).filter(
+        OutboundEmail.id.in_(ids),
+        OutboundEmail.status.in_(('pending', 'sending')),
+        OutboundEmail.next_attempt_at <= now,
+    ).update({'status': 'sending', 'claimed_by': claim, 'next_attempt_at': lease}, synchronize_session=False)
+    db.session.commit()
+
+    messages = OutboundEmail.query.filter_by(claimed_by=claim, status='sending').all()
+    if not messages:
+        return 0
+
+    try:
+        results = transport.send_batch(messages, config.get('MAIL_DEFAULT_SENDER'))
+    except Exception as e:
+        # Count it against the claimed messages so they back off and eventually die
+        logger.exception('Mail transport failed for a batch of %s message(s)', len(messages))
+        results = [e] * len(messages)
+
+    max_attempts = config.get('MAIL_MAX_ATTEMPTS', 6)
+    base = config.get('MAIL_RETRY_BASE_SECONDS', 30)
+    cap = config.get('MAIL_RETRY_MAX_SECONDS', 3600)
+    finished = datetime.utcnow()
+    for message, error in zip(messages, results):
+        message.attempts += 1
+        message.claimed_by = None
+        if error is None:
+            message.status = 'sent'
+            message.sent_at = finished
+            message.last_error = None
+        elif message.attempts >= max_attempts:
+            message.status = 'dead'
+            message.last_error = str(error)[:500]
+            logger.error('Email %s to %s is dead after %s attempts: %s',
+                         message.id, message.to_email, message.attempts, error)
+        else:
+            message.status = 'pending'
+            message.next_attempt_at = finished + _retry_delay(message.attempts, base, cap)
+            message.last_error = str(error)[:500]
+            logger.warning('Email %s to %s failed (attempt %s): %s',
+                           message.id, message.to_email, message.attempts, error)
+    db.session.commit()
+    return len(messages)
+
+
+mail_cli = AppGroup('mail', help='Outbox maintenance commands.')
+
+
+@mail_cli.command('drain')
+def drain_command():
+    """Deliver every due message in the outbox and exit."""
+    total = 0
+    while True:
+        processed = process_outbox()
+        if not processed:
+            break
+        total += processed
+    click.echo(f'Processed {total} message(s).')
+
+
+@mail_cli.command('retry-dead')
+def retry_dead_command():
+    """Move dead messages back to pending so they are retried."""
+    count = OutboundEmail.query.filter_by(status='dead').update(
+        {'status': 'pending', 'attempts': 0, 'next_attempt_at': datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    click.echo(f'Requeued {count} message(s).')
+
+
+def init_mailer(app):
+    """
+    Register the outbox worker pool and CLI commands on the application.
+
+    Args:
+        app (Flask): The application.
+    """
+    app.cli.add_command(mail_cli)
+    threads = app.config.get('MAIL_WORKER_THREADS', 2)
+    if threads > 0:
+        register_worker(app, BackgroundWorker(
+            app,
+            process_outbox,
+            interval=app.config.get('MAIL_POLL_INTERVAL', 2),
+            name='mail-outbox',
+            threads=threads,
+        ))
@@ -0,0 +1,278 @@
+"""
+Per-endpoint request instrumentation.
+
+Records request latency histograms, request counts by status, and the number and
+duration of SQL statements each request executes (via SQLAlchemy engine events).
+A request that runs the same statement ``METRICS_N_PLUS_ONE_THRESHOLD`` times or
+more is flagged as a likely N+1 pattern and logged.
+
+Metrics are kept per process and exposed at ``/admin/metrics`` as JSON or, with
+``?format=prometheus``, in the Prometheus text exposition format. They include
+how long the process took to import the app and run each ``create_app`` step
+(see :class:`StartupTimer`).
+"""
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+from models import db
+
+logger = logging.getLogger(__name__)
+
+# Latency bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram with running sum and count."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket that contains it."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else float('inf')
+        return float('inf')
+
+
+class EndpointStats:
+    """Aggregated metrics of a single endpoint."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses = Counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.max_queries = 0
+        self.n_plus_one = 0
+        self.n_plus_one_example = None
+
+
+class StartupTimer:
+    """
+    Time the steps of application startup.
+
+    Each :meth:`mark` records the time since the previous mark under a name.
+
+    Args:
+        import_seconds (float): Time spent importing the application modules, if measured.
+    """
+
+    def __init__(self, import_seconds: float = None):
+        self.phases = {}
+        if import_seconds is not None:
+            self.phases['import'] = import_seconds
+        self._started = self._last = time.perf_counter()
+
+    def mark(self, phase: str):
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+
+    @property
+    def total(self) -> float:
+        return self.phases.get('import', 0.0) + self._last - self._started
+
+    def report(self, app):
+        """Log the timings and attach them to the app's metrics registry."""
+        timings = {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()}
+        slowest = sorted(timings.items(), key=lambda item: item[1], reverse=True)[:3]
+        logger.info('App started in %.0f ms (slowest: %s)', self.total * 1000,
+                    ', '.join(f'{phase} {ms:.0f} ms' for phase, ms in slowest))
+        registry = app.extensions.get('metrics')
+        if registry is not None:
+            registry.startup_ms = {'total': round(self.total * 1000, 1), 'phases': timings}
+
+
+class MetricsRegistry:
+    """Thread-safe store of :class:`EndpointStats` keyed by endpoint name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(EndpointStats)
+        self.started_at = time.time()
+        self.startup_ms = None
+
+    def record(self, endpoint, status, seconds, queries, sql_seconds, repeated=None):
+        with self._lock:
+            stats = self._endpoints[endpoint]
+            stats.latency.observe(seconds)
+            stats.statuses[status] += 1
+            stats.sql_queries += queries
+            stats.sql_seconds += sql_seconds
+            stats.max_queries = max(stats.max_queries, queries)
+            if repeated:
+                stats.n_plus_one += 1
+                stats.n_plus_one_example = repeated
+
+    def snapshot(self) -> dict:
+        """Return a JSON-serialisable view of every endpoint's metrics."""
+        with self._lock:
+            endpoints = {}
+            for name, stats in sorted(self._endpoints.items()):
+                requests = stats.latency.count
+                endpoints[name] = {
+                    'requests': requests,
+                    'statuses': dict(stats.statuses),
+                    'latency_ms': {
+                        'avg': round(stats.latency.sum / requests * 1000, 2) if requests else 0,
+                        'p50': stats.latency.quantile(0.50) * 1000,
+                        'p95': stats.latency.quantile(0.95) * 1000,
+                        'p99': stats.latency.quantile(0.99) * 1000,
+                    },
+                    'sql': {
+                        'queries': stats.sql_queries,
+                        'queries_per_request': round(stats.sql_queries / requests, 2) if requests else 0,
+                        'max_queries': stats.max_queries,
+                        'seconds': round(stats.sql_seconds, 4),
+                    },
+                    'n_plus_one': {'requests': stats.n_plus_one, 'example': stats.n_plus_one_example},
+                }
+            return {
+                'uptime_seconds': round(time.time() - self.started_at, 1),
+                'startup_ms': self.startup_ms,
+                'endpoints': endpoints,
+            }
+
+    def prometheus(self, prefix: str = 'zimbos') -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = [
+            f'# HELP {prefix}_request_duration_seconds Request latency by endpoint.',
+            f'# TYPE {prefix}_request_duration_seconds histogram',
+        ]
+        with self._lock:
+            items = sorted(self._endpoints.items())
+            for name, stats in items:
+                cumulative = 0
+                for bound, n in zip(stats.latency.buckets + ('+Inf',), stats.latency.counts):
+                    cumulative += n
+                    lines.append(f'{prefix}_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_request_duration_seconds_sum{{endpoint="{name}"}} {stats.latency.sum:.6f}')
+                lines.append(f'{prefix}_request_duration_seconds_count{{endpoint="{name}"}} {stats.latency.count}')
+
+            lines += [f'# HELP {prefix}_requests_total Requests by endpoint and status.',
+                      f'# TYPE {prefix}_requests_total counter']
+            for name, stats in items:
+                for status, n in sorted(stats.statuses.items()):
+                    lines.append(f'{prefix}_requests_total{{endpoint="{name}",status="{status}"}} {n}')
+
+            lines += [f'# HELP {prefix}_sql_queries_total SQL statements executed by endpoint.',
+                      f'# TYPE {prefix}_sql_queries_total counter']
+            lines += [f'{prefix}_sql_queries_total{{endpoint="{name}"}} {stats.sql_queries}' for name, stats in items]
+
+            lines += [f'# HELP {prefix}_sql_duration_seconds_total Time spent in SQL by endpoint.',
+                      f'# TYPE {prefix}_sql_duration_seconds_total counter']
+            lines += [f'{prefix}_sql_duration_seconds_total{{endpoint="{name}"}} {stats.sql_seconds:.6f}' for name, stats in items]
+
+            lines += [f'# HELP {prefix}_n_plus_one_requests_total Requests flagged with a repeated statement.',
+                      f'# TYPE {prefix}_n_plus_one_requests_total counter']
+            lines += [f'{prefix}_n_plus_one_requests_total{{endpoint="{name}"}} {stats.n_plus_one}' for name, stats in items]
+
+        if self.startup_ms:
+            lines += [f'# HELP {prefix}_startup_seconds Time spent in each startup phase of this process.',
+                      f'# TYPE {prefix}_startup_seconds gauge']
+            lines += [f'{prefix}_startup_seconds{{phase="{phase}"}} {ms / 1000:.4f}'
+                      for phase, ms in self.startup_ms['phases'].items()]
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics() -> MetricsRegistry:
+    """Return the metrics registry of the current application."""
+    return current_app.extensions['metrics']
+
+
+def init_metrics(app) -> MetricsRegistry:
+    """
+    Install request timing hooks and SQL engine listeners on the application.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        MetricsRegistry: The registry stored in ``app.extensions['metrics']``.
+    """
+    registry = MetricsRegistry()
+    app.extensions['metrics'] = registry
+    if not app.config.get('METRICS_ENABLED', True):
+        return registry
+
+    threshold = app.config.get('METRICS_N_PLUS_ONE_THRESHOLD', 5)
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['metrics_query_start'].pop()
+        if not has_request_context() or 'metrics_start' not in g:
+            return
+        g.metrics_queries += 1
+        g.metrics_sql_seconds += time.perf_counter() - started
+        g.metrics_statements[statement] += 1
+
+    @event.listens_for(engine, 'handle_error')
+    def _handle_error(context):
+        # A failed statement never reaches after_cursor_execute; drop its start time
+        conn = context.connection
+        if conn is not None and context.statement is not None and conn.info.get('metrics_query_start'):
+            conn.info['metrics_query_start'].pop()
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_sql_seconds = 0.0
+        g.metrics_statements = Counter()
+
+    @app.after_request
+    def _remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    # A teardown hook also runs when the view raised and no response went through after_request
+    @app.teardown_request
+    def _record_request(exc):
+        if 'metrics_start' not in g:
+            return
+        elapsed = time.perf_counter() - g.metrics_start
+        endpoint = request.endpoint or 'unmatched'
+
+        repeated = None
+        if g.metrics_statements:
+            statement, times = g.metrics_statements.most_common(1)[0]
+            if times >= threshold:
+                repeated = f'{times}x {statement[:200]}'
+                logger.warning('Possible N+1 in %s: %s', endpoint, repeated)
+
+        status = 500 if exc is not None else g.get('metrics_status', 500)
+        registry.record(endpoint, status, elapsed, g.metrics_queries, g.metrics_sql_seconds, repeated)
+
+    return registry
@@ -0,0 +1,144 @@
+"""
+Password hashing off the request thread.
+
+Hashing and verification run in a small process pool, so a burst of logins or
+registrations uses at most ``PASSWORD_HASH_WORKERS`` cores and request threads
+stay free for everything else. At most ``PASSWORD_HASH_MAX_PENDING`` jobs may be
+queued or running per process; beyond that :class:`HasherBusy` (a 503 with
+``Retry-After``) is raised instead of queueing without bound.
+
+``PASSWORD_HASH_METHOD`` is any werkzeug method string, full or short
+('scrypt:32768:8:1', 'scrypt', 'pbkdf2:sha256:600000', 'pbkdf2', ...). Stored hashes
+made with other parameters are reported by :meth:`PasswordHasher.needs_rehash`
+and upgraded at the next login. With ``PASSWORD_HASH_WORKERS = 0`` hashing runs
+inline.
+
+The pool comes from :func:`services.background.make_process_pool`, so it is not
+forked from the multi-threaded server process.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import current_app
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from services.background import make_process_pool
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HasherBusy(ServiceUnavailable):
+    """Raised when the hashing queue is full or a job timed out; rendered as 503."""
+
+    description = 'The server is busy. Please try again in a moment.'
+
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored_hash: str, password: str) -> bool:
+    return check_password_hash(stored_hash, password)
+
+
+class PasswordHasher:
+    """
+    Bounded process pool for password hashing.
+
+    Args:
+        method (str): werkzeug hash method string for new hashes.
+        workers (int): Pool processes; 0 hashes inline in the calling thread.
+        max_pending (int): Maximum jobs queued or running at once.
+        timeout (float): Seconds to wait for a result before giving up.
+    """
+
+    def __init__(self, method: str = DEFAULT_METHOD, workers: int = 2, max_pending: int = 16, timeout: float = 10):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self.max_pending = max(max_pending, 1)
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._method_prefix = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Created lazily so forked server workers each get their own pool
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = make_process_pool(self.workers)
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy(retry_after=1)
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        # The slot is held until the job finishes, even if we stop waiting for it
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HasherBusy(retry_after=1)
+
+    def hash(self, password: str) -> str:
+        """Hash a plaintext password with the configured method."""
+        return self._run(_hash, password, self.method)
+
+    def verify(self, stored_hash: str, password: str) -> bool:
+        """Check a plaintext password against a stored hash."""
+        return self._run(_verify, stored_hash, password)
+
+    def needs_rehash(self, stored_hash: str) -> bool:
+        """Return True if ``stored_hash`` was made with a different method or cost."""
+        if self._method_prefix is None:
+            # werkzeug fills in the defaults of a short method string ('scrypt' ->
+            # 'scrypt:32768:8:1'), so compare against the prefix it actually writes
+            self._method_prefix = _hash('', self.method).split('$', 1)[0]
+        return stored_hash.split('$', 1)[0] != self._method_prefix
+
+    def shutdown(self):
+        """Stop the pool (used by tests and forked servers)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def reset(self):
+        """Forget an inherited pool without stopping it (the parent process still owns it)."""
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+
+
+def get_password_hasher():
+    """Return the application's hasher, or None outside an initialised app."""
+    if not current_app:
+        return None
+    return current_app.extensions.get('password_hasher')
+
+
+def init_passwords(app) -> PasswordHasher:
+    """
+    Create the application's password hasher from ``PASSWORD_HASH_*`` settings.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        PasswordHasher: The hasher stored in ``app.extensions['password_hasher']``.
+    """
+    hasher = PasswordHasher(
+        method=app.config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        workers=app.config.get('PASSWORD_HASH_WORKERS', 2),
+        max_pending=app.config.get('PASSWORD_HASH_MAX_PENDING', 16),
+        timeout=app.config.get('PASSWORD_HASH_TIMEOUT', 10),
+    )
+    app.extensions['password_hasher'] = hasher
+    return hasher
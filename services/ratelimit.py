@@ -0,0 +1,228 @@
+"""
+Request rate limiting per endpoint or blueprint, keyed by client IP or user.
+
+Rules come from ``RATELIMITS``, a dict mapping an endpoint ('auth.login') or a
+blueprint ('admin') to one or more specs of the form ``"[METHOD ]<count>/<period>[@key]"``:
+
+    '10/minute@ip'      at most 10 requests a minute per client IP
+    '60/minute@user'    per logged-in user; anonymous clients are keyed by IP
+    'POST 10/minute@ip' only POSTs count, so loading the form costs nothing
+    ['5/second', '100/hour']   every listed limit must pass
+
+An endpoint rule replaces its blueprint's rule; ``None`` exempts an endpoint.
+The key defaults to ``user``. Client IPs come from ``request.remote_addr``; behind
+a reverse proxy set ``PROXY_FIX_X_FOR`` so it is the client's and not the proxy's.
+
+Two storages are available (``RATELIMIT_STORAGE_URL``):
+
+    unset       per-process token bucket (GCRA: one timestamp per key, no counters)
+    memory://   shared-backend code path with a process-local stand-in
+    redis://…   sliding-window counters in Redis, shared by every worker process
+
+Rejected requests get ``429 Too Many Requests`` with a ``Retry-After`` header.
+Endpoints without a rule cost one dict lookup per request.
+"""
+import math
+import re
+import threading
+import time
+
+from flask import current_app, jsonify, request
+from flask_login import current_user
+from werkzeug.exceptions import TooManyRequests
+
+from services.cache import LRUCache, make_shared_backend
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+_SPEC = re.compile(r'^\s*(?:([A-Z]+)\s+)?(\d+)\s*/\s*(\d*)\s*(second|minute|hour|day)s?\s*(?:@\s*(ip|user))?\s*$')
+
+
+class Limit:
+    """
+    One parsed rate limit.
+
+    Args:
+        count (int): Requests allowed per ``period``.
+        period (float): Window length in seconds.
+        key (str): 'ip' or 'user'.
+        method (str): Only requests with this HTTP method count; None for all.
+    """
+
+    def __init__(self, count: int, period: float, key: str = 'user', method: str = None):
+        self.count = count
+        self.period = period
+        self.key = key
+        self.method = method
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Limit':
+        """Parse ``"POST 10/minute@ip"``-style specs; ``"10/5minutes"`` is also accepted."""
+        match = _SPEC.match(spec)
+        if not match:
+            raise ValueError(f'Invalid rate limit {spec!r}')
+        method, count, multiplier, unit, key = match.groups()
+        return cls(int(count), PERIODS[unit] * int(multiplier or 1), key or 'user', method)
+
+    @property
+    def bucket(self) -> str:
+        """Storage key prefix: limits differing in any part never share a bucket."""
+        return f'{self.method or "*"}:{self.count}/{self.period}@{self.key}'
+
+    def __repr__(self):
+        return f'<Limit {self.method + " " if self.method else ""}{self.count}/{self.period}s@{self.key}>'
+
+
+class MemoryStorage:
+    """
+    Per-process token buckets using GCRA: each key stores only the time the bucket is next full.
+
+    Args:
+        maxsize (int): Maximum number of tracked keys (least recently used are dropped).
+    """
+
+    def __init__(self, maxsize: int = 100_000):
+        self._tats = LRUCache(maxsize)
+        self._lock = threading.Lock()
+
+    def hit(self, key: str, limit: Limit, now: float = None) -> float:
+        """
+        Take one token from the bucket for ``key``.
+
+        Returns:
+            float: 0 if allowed, otherwise seconds until a token is available.
+        """
+        now = time.monotonic() if now is None else now
+        interval = limit.period / limit.count
+        with self._lock:
+            tat = max(self._tats.get(key, now), now)
+            allowed_at = tat + interval - limit.period
+            if now < allowed_at:
+                return allowed_at - now
+            self._tats.set(key, tat + interval, ttl=limit.period)
+        return 0.0
+
+
+class SharedStorage:
+    """
+    Sliding-window counters in a shared cache backend (see ``services.cache``).
+
+    The current window's count plus the previous window's count, weighted by how
+    much of it still overlaps the sliding window, approximates a true sliding log
+    with two counters per key.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def hit(self, key: str, limit: Limit, now: float = None) -> float:
+        """
+        Count one request for ``key``.
+
+        Returns:
+            float: 0 if allowed, otherwise seconds until the estimate drops under the limit.
+        """
+        now = time.time() if now is None else now
+        window = int(now // limit.period)
+        elapsed = now - window * limit.period
+        current = self.backend.incr(f'rl:{key}:{window}', ttl=limit.period * 2)
+        previous = self.backend.get(f'rl:{key}:{window - 1}') or 0
+        weight = (limit.period - elapsed) / limit.period
+        if previous * weight + current <= limit.count:
+            return 0.0
+        if current > limit.count or not previous:
+            return limit.period - elapsed
+        # Time until enough of the previous window has slid out
+        excess = previous * weight + current - limit.count
+        return min(excess * limit.period / previous, limit.period - elapsed)
+
+
+class RateLimiter:
+    """
+    Resolves the limits of each endpoint once and checks them in ``before_request``.
+
+    Args:
+        rules (dict): ``RATELIMITS`` mapping.
+        storage (MemoryStorage | SharedStorage): Where hits are counted.
+    """
+
+    def __init__(self, rules: dict, storage):
+        self.rules = {name: self._parse(specs) for name, specs in (rules or {}).items()}
+        self.storage = storage
+        self._resolved = {}
+
+    @staticmethod
+    def _parse(specs):
+        if specs is None:
+            return ()
+        if isinstance(specs, str):
+            specs = [specs]
+        return tuple(Limit.parse(spec) for spec in specs)
+
+    def limits_for(self, endpoint: str) -> tuple:
+        """Return the limits that apply to ``endpoint`` (memoised)."""
+        limits = self._resolved.get(endpoint)
+        if limits is None:
+            if endpoint in self.rules:
+                limits = self.rules[endpoint]
+            else:
+                limits = self.rules.get(endpoint.rpartition('.')[0], ()) if '.' in endpoint else ()
+            self._resolved[endpoint] = limits
+        return limits
+
+    def check(self):
+        """``before_request`` hook: raise 429 if any limit of this endpoint is exhausted."""
+        endpoint = request.endpoint
+        if not endpoint:
+            return
+        limits = self.limits_for(endpoint)
+        if not limits:
+            return
+        retry_after = 0.0
+        for limit in limits:
+            if limit.method and limit.method != request.method:
+                continue
+            key = f'{endpoint}:{limit.bucket}:{_client_key(limit.key)}'
+            retry_after = max(retry_after, self.storage.hit(key, limit))
+        if retry_after:
+            raise TooManyRequests(retry_after=max(1, math.ceil(retry_after)))
+
+
+def _client_key(kind: str) -> str:
+    if kind == 'user' and current_user.is_authenticated:
+        return f'u{current_user.id}'
+    return f'ip{request.remote_addr}'
+
+
+def _too_many_requests(e):
+    message = 'Too many requests. Please try again shortly.'
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        response = jsonify({'success': False, 'message': message})
+    else:
+        response = current_app.response_class(message, mimetype='text/plain')
+    response.status_code = 429
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def init_ratelimit(app):
+    """
+    Install the rate limiter configured by ``RATELIMITS``.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        RateLimiter | None: The limiter stored in ``app.extensions['ratelimiter']``,
+        or None when ``RATELIMIT_ENABLED`` is off.
+    """
+    if not app.config.get('RATELIMIT_ENABLED', True):
+        return None
+    backend = make_shared_backend(app.config.get('RATELIMIT_STORAGE_URL'))
+    storage = SharedStorage(backend) if backend is not None else MemoryStorage()
+    limiter = RateLimiter(app.config.get('RATELIMITS', {}), storage)
+    app.extensions['ratelimiter'] = limiter
+    app.before_request(limiter.check)
+    app.register_error_handler(429, _too_many_requests)
+    return limiter
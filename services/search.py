@@ -0,0 +1,277 @@
+"""
+Group search over name, description and tags.
+
+On SQLite, the ``group_search`` FTS5 table indexes every group (its rowid is
+the group id), with prefix indexes for typeahead. Results are ranked by BM25:
+name matches count most, then tags, then description. Ranking costs time per
+match, so queries matching more than ``SEARCH_RANK_LIMIT`` groups (typically the
+first letter or two of a typeahead) return name matches in index order instead;
+the next keystroke narrows them. The index is updated on
+``groups_changed``, so admin edits, imports and deletions show up straight
+away. ``flask search reindex`` rebuilds it from scratch.
+
+Other databases, and SQLite builds without FTS5, use :class:`LikeSearch`. It
+needs no index but scans the table. ``SEARCH_ENGINE`` can force 'fts5' or
+'like'. The default, 'auto', uses FTS5 when the table exists.
+
+A query is split into words and every word must match. The last word is
+treated as a prefix unless the query ends with a space, so "book cl" finds
+"Book Club".
+"""
+import logging
+import re
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DDL, and_, bindparam, column, event, func, or_, select, table, text
+
+from models import db, Group
+from services.catalog import CARD_COLUMNS, groups_by_ids
+from signals import groups_changed
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r'\w+')
+
+FTS_TABLE = 'group_search'
+REINDEX_BATCH_SIZE = 5000
+
+# Keep the statements in step with the migration that adds the table
+FTS_CREATE = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5('
+    "name, description, tags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+# Column weights for bm25(): name, description, tags
+FTS_RANK = f'bm25({FTS_TABLE}, 10.0, 1.0, 4.0)'
+
+
+def normalize_tags(value) -> str:
+    """
+    Normalise a comma-separated tag list: "Music, Study  group" becomes "music,study group".
+
+    Args:
+        value (str | list): Tags as typed, or a list of tags (JSON imports).
+
+    Returns:
+        str | None: The stored form, or None if no tags remain.
+    """
+    if isinstance(value, (list, tuple)):
+        value = ','.join(str(tag) for tag in value)
+    tags = []
+    for tag in (value or '').split(','):
+        tag = ' '.join(_WORD.findall(tag.lower()))
+        if tag and tag not in tags:
+            tags.append(tag)
+    return ','.join(tags) or None
+
+
+def _words(value):
+    return _WORD.findall((value or '').lower())
+
+
+def _has_tag(tag: str):
+    """Match groups carrying exactly ``tag`` (normalised), not a part of one."""
+    return ("," + func.coalesce(Group.tags, '') + ",").like(f'%,{tag},%')
+
+
+class FtsSearch:
+    """
+    Search the ``group_search`` FTS5 table (SQLite only).
+
+    Args:
+        rank_limit (int): Largest match set that is ranked by BM25.
+    """
+
+    name = 'fts5'
+    _table = table(FTS_TABLE, column('rowid'))
+
+    def __init__(self, rank_limit: int = 1000):
+        self.rank_limit = rank_limit
+
+    @staticmethod
+    def match_expression(q: str, tag: str = None, name_only: bool = False) -> str:
+        """Build the FTS5 MATCH string for a user query and an optional tag."""
+        terms = [f'"{word}"' for word in _words(q)]
+        if terms and not q[-1].isspace():
+            terms[-1] += '*'
+        if terms and name_only:
+            terms = [f'name : ({" AND ".join(terms)})']
+        tag_words = _words(tag)
+        if tag_words:
+            terms.append(f'tags : "{" ".join(tag_words)}"')
+        return ' AND '.join(terms)
+
+    def _rowids(self, match: str, tag: str, limit: int, ranked: bool = False) -> list:
+        stmt = select(self._table.c.rowid).where(text(f'{FTS_TABLE} MATCH :match'))
+        if tag:
+            # The phrase in the MATCH also finds parts of tags and runs across
+            # neighbouring ones ("study" + "group"); keep only whole tags
+            stmt = stmt.join(Group, Group.id == self._table.c.rowid).where(_has_tag(tag))
+        if ranked:
+            stmt = stmt.order_by(text(FTS_RANK))
+        return list(db.session.scalars(stmt.limit(limit), {'match': match}))
+
+    def search(self, q: str, tag: str = None, limit: int = 20) -> list:
+        match = self.match_expression(q, tag)
+        if not match:
+            return []
+        tag = ' '.join(_words(tag))
+        # Walking the matches is cheap; scoring every one of them is not
+        if len(self._rowids(match, tag, self.rank_limit + 1)) <= self.rank_limit:
+            ids = self._rowids(match, tag, limit, ranked=True)
+        else:
+            ids = self._rowids(self.match_expression(q, tag, name_only=True), tag, limit)
+            if len(ids) < limit:
+                seen = set(ids)
+                ids += [gid for gid in self._rowids(match, tag, limit + len(ids)) if gid not in seen][:limit - len(ids)]
+        return groups_by_ids(ids)
+
+    def update(self, connection, group_ids):
+        """Re-index the given groups; ids that no longer exist are dropped."""
+        ids = bindparam('ids', list(group_ids), expanding=True)
+        connection.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid IN :ids').bindparams(ids))
+        connection.execute(text(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, description, tags) '
+            "SELECT id, name, coalesce(description, ''), coalesce(tags, '') "
+            'FROM "group" WHERE id IN :ids'
+        ).bindparams(ids))
+
+    def rebuild(self, connection, batch_size: int = REINDEX_BATCH_SIZE, progress=None) -> int:
+        """Empty the index and refill it in id-ordered batches."""
+        connection.execute(text(FTS_CREATE))
+        connection.execute(text(f'DELETE FROM {FTS_TABLE}'))
+        total, last_id = 0, 0
+        while True:
+            ids = list(connection.scalars(
+                select(Group.id).where(Group.id > last_id).order_by(Group.id).limit(batch_size)
+            ))
+            if not ids:
+                break
+            self.update(connection, ids)
+            total += len(ids)
+            last_id = ids[-1]
+            if progress:
+                progress(len(ids))
+        connection.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')"))
+        return total
+
+
+class LikeSearch:
+    """Index-free fallback using LIKE; fine for small catalogs and any database."""
+
+    name = 'like'
+
+    def search(self, q: str, tag: str = None, limit: int = 20) -> list:
+        words = _words(q)
+        tag = ' '.join(_words(tag))
+        if not words and not tag:
+            return []
+        conditions = []
+        for word in words:
+            pattern = f'%{word}%'
+            conditions.append(or_(
+                Group.name.ilike(pattern),
+                Group.description.ilike(pattern),
+                Group.tags.ilike(pattern),
+            ))
+        if tag:
+            conditions.append(_has_tag(tag))
+        stmt = select(*CARD_COLUMNS).where(and_(*conditions)).order_by(Group.name, Group.id).limit(limit)
+        return db.session.execute(stmt).all()
+
+    def update(self, connection, group_ids):
+        pass
+
+    def rebuild(self, connection, batch_size: int = REINDEX_BATCH_SIZE, progress=None) -> int:
+        return 0
+
+
+def _fts_table_exists(connection) -> bool:
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first() is not None
+
+
+def get_search_engine():
+    """
+    Return the search engine for the current application, choosing it on first use.
+
+    Returns:
+        FtsSearch | LikeSearch: The engine.
+    """
+    engine = current_app.extensions.get('search_engine')
+    if engine is None:
+        setting = current_app.config.get('SEARCH_ENGINE', 'auto')
+        engine = LikeSearch()
+        if setting == 'fts5' or (setting == 'auto' and db.engine.dialect.name == 'sqlite'):
+            with db.engine.connect() as connection:
+                if setting == 'fts5' or _fts_table_exists(connection):
+                    engine = FtsSearch(current_app.config.get('SEARCH_RANK_LIMIT', 1000))
+        current_app.extensions['search_engine'] = engine
+    return engine
+
+
+def search_groups(q: str, tag: str = None, limit: int = 20) -> list:
+    """
+    Find groups by words in their name, description or tags.
+
+    Args:
+        q (str): Query text; the last word is a prefix unless followed by a space.
+        tag (str): Only return groups carrying this tag.
+        limit (int): Maximum number of results.
+
+    Returns:
+        list: Card rows (``id``, ``name``, ``picture_filename``, ``image_key``,
+        ``member_count``), best match first.
+    """
+    return get_search_engine().search(q or '', tag, limit)
+
+
+def index_groups(group_ids):
+    """Bring the index entries of ``group_ids`` up to date, in their own transaction."""
+    if not group_ids:
+        return
+    engine = get_search_engine()
+    try:
+        with db.engine.begin() as connection:
+            engine.update(connection, group_ids)
+    except Exception:
+        # The groups are saved either way; `flask search reindex` repairs the index
+        logger.exception('Updating the search index for groups %s failed', list(group_ids)[:10])
+
+
+search_cli = AppGroup('search', help='Group search index.')
+
+
+@search_cli.command('reindex')
+def reindex_command():
+    """Rebuild the group search index from the group table."""
+    if db.engine.dialect.name != 'sqlite':
+        click.echo('No search index on this database; searches use LIKE.')
+        return
+    total = db.session.scalar(select(func.count(Group.id)))
+    with click.progressbar(length=total, label='Indexing groups') as bar:
+        with db.engine.begin() as connection:
+            indexed = FtsSearch().rebuild(connection, progress=bar.update)
+    current_app.extensions.pop('search_engine', None)
+    click.echo(f'Indexed {indexed} group(s).')
+
+
+# Databases created with create_all (tests, `flask init-db`) get the index too
+event.listen(Group.__table__, 'after_create', DDL(FTS_CREATE).execute_if(dialect='sqlite'))
+
+
+def init_search(app):
+    """
+    Keep the search index in step with group changes and register ``flask search``.
+
+    Args:
+        app (Flask): The application.
+    """
+    def on_groups_changed(sender, group_ids=(), **extra):
+        index_groups(group_ids)
+
+    # Connected strongly: the handler is a closure that would otherwise be collected
+    groups_changed.connect(on_groups_changed, sender=app, weak=False)
+    app.cli.add_command(search_cli)
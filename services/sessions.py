@@ -0,0 +1,330 @@
+"""
+Server-side login sessions that can be revoked.
+
+Plain Flask-Login keeps the user id in the signed session cookie, so a session
+lasts as long as its cookie: neither a ban nor a logout elsewhere can end it.
+With ``SESSION_STORE = 'database'`` (the default), every login creates a
+compact ``user_session`` row holding the id, user and expiry. Flask-Login then
+stores that random id instead of the user id, in both the session cookie and
+the remember cookie. Each request resolves the id through an in-process LRU,
+then the shared backend (``CACHE_BACKEND_URL``), and only then the table, so an
+active session costs no query. Revocation deletes the rows and their cache
+entries:
+
+    logout                      the current session
+    ban (admin, bulk, CLI)      every session of the banned users, in bulk
+
+Other processes may serve a revoked session from their local LRU for up to
+``SESSION_CACHE_TTL`` seconds. Banned users are also refused by
+:func:`load_session_user` through ``User.is_banned`` on the cached identity.
+Expired rows are deleted by a background sweeper (``SESSION_SWEEP_INTERVAL``)
+or by ``flask sessions sweep``.
+
+``SESSION_STORE = 'cookie'`` keeps the plain Flask-Login behaviour.
+"""
+import secrets
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from flask_login import login_user, user_logged_out
+from sqlalchemy import delete, insert, not_, select
+
+from models import db, User, UserSession
+from services.background import BackgroundWorker, register_worker
+from services.cache import LRUCache, make_shared_backend
+from services.identity import get_identity_cache
+
+# 24 URL-safe characters
+SESSION_ID_BYTES = 18
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _timestamp(value: datetime) -> float:
+    return (value - _EPOCH).total_seconds()
+
+
+class SessionStore:
+    """
+    ``user_session`` rows behind a local LRU and an optional shared tier.
+
+    Cached entries are ``[user_id, expires_at]`` (epoch seconds); ids that do not
+    exist are cached locally as ``[None, 0]`` so stale cookies stay cheap.
+
+    Args:
+        maxsize (int): Entries kept in the local LRU.
+        ttl (float): Seconds an entry stays in the local LRU.
+        shared: Optional shared backend from :func:`services.cache.make_shared_backend`.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 30, shared=None):
+        self.local = LRUCache(maxsize, ttl)
+        self.shared = shared
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f'session:{session_id}'
+
+    def _remember(self, session_id: str, user_id: int, expires_at: datetime):
+        entry = [user_id, _timestamp(expires_at)]
+        self.local.set(self._key(session_id), entry)
+        if self.shared is not None:
+            self.shared.set(self._key(session_id), entry, ttl=max(entry[1] - time.time(), 1))
+
+    def _forget(self, session_ids):
+        keys = [self._key(session_id) for session_id in session_ids]
+        if not keys:
+            return
+        self.local.delete(*keys)
+        if self.shared is not None:
+            self.shared.delete(*keys)
+
+    def create(self, user_id: int, lifetime: timedelta) -> str:
+        """
+        Start a session for a user.
+
+        Args:
+            user_id (int): The user logging in.
+            lifetime (timedelta): How long the session lasts.
+
+        Returns:
+            str: The new session id.
+        """
+        session_id = secrets.token_urlsafe(SESSION_ID_BYTES)
+        expires_at = datetime.utcnow() + lifetime
+        db.session.execute(insert(UserSession).values(id=session_id, user_id=user_id, expires_at=expires_at))
+        db.session.commit()
+        self._remember(session_id, user_id, expires_at)
+        return session_id
+
+    def user_id(self, session_id: str):
+        """
+        Resolve a session id.
+
+        Args:
+            session_id (str): Id from the session or remember cookie.
+
+        Returns:
+            int | None: The session's user, or None if it is unknown, revoked or expired.
+        """
+        key = self._key(session_id)
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.set(key, entry)
+        if entry is None:
+            row = db.session.execute(
+                select(UserSession.user_id, UserSession.expires_at).where(UserSession.id == session_id)
+            ).first()
+            if row is None:
+                entry = [None, 0]
+                self.local.set(key, entry)
+            else:
+                self._remember(session_id, row.user_id, row.expires_at)
+                entry = [row.user_id, _timestamp(row.expires_at)]
+        user_id, expires_at = entry
+        if user_id is None or expires_at <= time.time():
+            return None
+        return user_id
+
+    def revoke(self, session_id: str):
+        """End one session."""
+        db.session.execute(
+            delete(UserSession).where(UserSession.id == session_id).execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        self._forget([session_id])
+
+    def revoke_users(self, user_ids) -> int:
+        """
+        End every session of the given users with one DELETE.
+
+        Args:
+            user_ids (list[int]): Users whose sessions to end.
+
+        Returns:
+            int: Number of sessions revoked.
+        """
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        session_ids = list(db.session.scalars(select(UserSession.id).where(UserSession.user_id.in_(user_ids))))
+        if session_ids:
+            db.session.execute(
+                delete(UserSession)
+                .where(UserSession.user_id.in_(user_ids))
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        self._forget(session_ids)
+        return len(session_ids)
+
+
+def get_session_store():
+    """Return the session store of the current application, or None with ``SESSION_STORE = 'cookie'``."""
+    return current_app.extensions.get('session_store')
+
+
+def _lifetime(remember: bool) -> timedelta:
+    config = current_app.config
+    if not remember:
+        return timedelta(hours=config.get('SESSION_LIFETIME_HOURS', 24))
+    duration = config.get('REMEMBER_COOKIE_DURATION', timedelta(days=365))
+    return duration if isinstance(duration, timedelta) else timedelta(seconds=duration)
+
+
+def start_session(user, remember: bool = False) -> bool:
+    """
+    Log a user in, creating a server-side session when the store is enabled.
+
+    Use instead of ``flask_login.login_user``.
+
+    Args:
+        user (User): The authenticated user.
+        remember (bool): Also set the remember-me cookie.
+
+    Returns:
+        bool: The result of ``login_user``.
+    """
+    store = get_session_store()
+    if store is not None:
+        user.session_id = store.create(user.id, _lifetime(remember))
+    return login_user(user, remember=remember)
+
+
+def load_session_user(session_id: str):
+    """
+    Flask-Login user loader: the active, unbanned user of a session.
+
+    Args:
+        session_id (str): Value stored by Flask-Login (a session id, or a user id
+            with ``SESSION_STORE = 'cookie'``).
+
+    Returns:
+        User | None: The user, or None to treat the request as anonymous.
+    """
+    store = get_session_store()
+    if store is not None:
+        user_id = store.user_id(session_id)
+    else:
+        user_id = int(session_id) if session_id.isdigit() else None
+    if user_id is None:
+        return None
+    user = get_identity_cache().load_user(user_id)
+    if user is None or user.is_banned:
+        return None
+    if store is not None:
+        user.session_id = session_id
+    return user
+
+
+def session_user_query(session_id: str):
+    """
+    SELECT of ``User.id``, ``email`` and ``name`` for an unbanned session user (ASGI handlers).
+
+    Args:
+        session_id (str): Value stored by Flask-Login.
+
+    Returns:
+        Select | None: The statement, or None if ``session_id`` cannot be valid.
+    """
+    stmt = select(User.id, User.email, User.name).where(not_(User.is_banned))
+    if get_session_store() is not None:
+        return (
+            stmt.join(UserSession, UserSession.user_id == User.id)
+            .where(UserSession.id == session_id, UserSession.expires_at > datetime.utcnow())
+        )
+    if not session_id.isdigit():
+        return None
+    return stmt.where(User.id == int(session_id))
+
+
+def revoke_user_sessions(user_ids) -> int:
+    """End every session of the given users; a no-op with ``SESSION_STORE = 'cookie'``."""
+    store = get_session_store()
+    return store.revoke_users(user_ids) if store is not None else 0
+
+
+def sweep_expired_sessions(batch_size: int = None) -> int:
+    """
+    Delete one batch of expired sessions.
+
+    Args:
+        batch_size (int): Maximum rows deleted, defaults to ``SESSION_SWEEP_BATCH_SIZE``.
+
+    Returns:
+        int: Number of sessions deleted; a full batch means more may remain.
+    """
+    batch_size = batch_size or current_app.config.get('SESSION_SWEEP_BATCH_SIZE', 1000)
+    expired_ids = (
+        select(UserSession.id)
+        .where(UserSession.expires_at < datetime.utcnow())
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    deleted = db.session.execute(
+        delete(UserSession)
+        .where(UserSession.id.in_(expired_ids))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def _sweep_job() -> bool:
+    # Keep sweeping without sleeping while batches come back full
+    batch_size = current_app.config.get('SESSION_SWEEP_BATCH_SIZE', 1000)
+    return sweep_expired_sessions(batch_size) >= batch_size
+
+
+sessions_cli = AppGroup('sessions', help='Login session maintenance commands.')
+
+
+@sessions_cli.command('sweep')
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+def sweep_command(batch_size):
+    """Delete every expired login session."""
+    total = 0
+    while True:
+        deleted = sweep_expired_sessions(batch_size)
+        total += deleted
+        if not deleted:
+            break
+    click.echo(f'Deleted {total} expired session(s).')
+
+
+def init_sessions(app, login_manager):
+    """
+    Set up the session store, the Flask-Login user loader and the expired-session sweeper.
+
+    Args:
+        app (Flask): The application.
+        login_manager (LoginManager): The application's login manager.
+    """
+    login_manager.user_loader(load_session_user)
+    app.cli.add_command(sessions_cli)
+    if app.config.get('SESSION_STORE', 'database') != 'database':
+        return
+
+    store = SessionStore(
+        maxsize=app.config.get('SESSION_CACHE_SIZE', 10_000),
+        ttl=app.config.get('SESSION_CACHE_TTL', 30),
+        shared=make_shared_backend(app.config.get('CACHE_BACKEND_URL')),
+    )
+    app.extensions['session_store'] = store
+
+    def on_logged_out(sender, user=None, **extra):
+        session_id = getattr(user, 'session_id', None)
+        if session_id:
+            store.revoke(session_id)
+
+    # Connected strongly: the handler is a closure that would otherwise be collected
+    user_logged_out.connect(on_logged_out, sender=app, weak=False)
+
+    interval = app.config.get('SESSION_SWEEP_INTERVAL', 3600)
+    if interval > 0:
+        register_worker(app, BackgroundWorker(app, _sweep_job, interval=interval, name='session-sweeper'))
@@ -0,0 +1,271 @@
+"""
+Invite token issuing, redemption and expiry sweeping.
+
+Two token formats can be issued (``INVITE_TOKEN_MODE``):
+
+    db      Random token stored in ``invite_token``; redeemed with one indexed
+            query that joins the group URL.
+    signed  HMAC-signed, timestamped payload carrying only the user and group
+            ids. The payload is readable by anyone holding the link, so it never
+            contains the group URL; that is looked up at redemption through an
+            in-process id -> URL cache (one primary-key query on a miss, dropped
+            on ``groups_changed``). Signed tokens cannot be revoked before they
+            expire, so keep ``INVITE_TOKEN_TTL_MINUTES`` short.
+
+Both formats are always accepted by :func:`resolve_invite`; DB tokens never
+contain a '.', signed ones always do.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app, url_for
+from flask.cli import AppGroup
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy import delete, select
+import click
+
+from models import db, Group, InviteToken, PurchasedItem
+from services.background import BackgroundWorker, register_worker
+from services.cache import LRUCache
+from signals import groups_changed
+
+
+class InviteExpired(Exception):
+    """Raised when an invite token is valid but past its expiry."""
+
+
+# What a redeemed invite grants: the group URL, plus who it was issued to for analytics
+Invite = namedtuple('Invite', 'url user_id group_id')
+
+
+def _serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='group-invite')
+
+
+def _ttl_seconds() -> int:
+    return current_app.config.get('INVITE_TOKEN_TTL_MINUTES', 15) * 60
+
+
+def signed_tokens_enabled() -> bool:
+    """Return True when new invites are issued as stateless signed tokens."""
+    return current_app.config.get('INVITE_TOKEN_MODE', 'db') == 'signed'
+
+
+def issue_signed_token(user_id: int, group_id: int) -> str:
+    """
+    Create a stateless invite token for a group.
+
+    The signed timestamp bounds its lifetime; the group URL is not included.
+
+    Args:
+        user_id (int): The invited user.
+        group_id (int): The group being joined.
+
+    Returns:
+        str: URL-safe signed token.
+    """
+    return _serializer().dumps({'uid': user_id, 'g': group_id})
+
+
+def group_url_query(group_id: int):
+    """Select the URL of one group by primary key."""
+    return select(Group.url).where(Group.id == group_id)
+
+
+def with_group_url(invite, url):
+    """
+    Complete a signed :class:`Invite` with its group URL and remember the URL.
+
+    Returns:
+        Invite | None: The invite, or None if the group no longer exists.
+    """
+    if url is None:
+        return None
+    cache = current_app.extensions.get('group_url_cache')
+    if cache is not None:
+        cache.set(invite.group_id, url)
+    return invite._replace(url=url)
+
+
+def decode_signed_invite(token: str):
+    """
+    Verify a signed invite token without touching the database.
+
+    Args:
+        token (str): Token containing a '.'.
+
+    Returns:
+        Invite | None: The invite, or None if the signature is invalid. Its ``url``
+        is None unless cached; complete it with :func:`with_group_url`.
+
+    Raises:
+        InviteExpired: If the signature is valid but the token is too old.
+    """
+    try:
+        payload = _serializer().loads(token, max_age=_ttl_seconds())
+    except SignatureExpired:
+        raise InviteExpired()
+    except BadSignature:
+        return None
+    group_id = payload.get('g')
+    cache = current_app.extensions.get('group_url_cache')
+    return Invite(cache.get(group_id) if cache is not None else None, payload.get('uid'), group_id)
+
+
+def invite_query(token: str):
+    """Select the expiry, owner and group URL of a stored invite token."""
+    return (
+        select(InviteToken.expires_at, InviteToken.user_id, InviteToken.group_id, Group.url)
+        .join(Group, Group.id == InviteToken.group_id)
+        .where(InviteToken.token == token)
+    )
+
+
+def invite_from_row(row):
+    """
+    Turn an :func:`invite_query` row into an :class:`Invite`.
+
+    Raises:
+        InviteExpired: If the token has expired.
+    """
+    if row is None:
+        return None
+    if row.expires_at < datetime.utcnow():
+        raise InviteExpired()
+    return Invite(row.url, row.user_id, row.group_id)
+
+
+def resolve_invite(token: str):
+    """
+    Resolve an invite token to the group URL it grants access to.
+
+    Args:
+        token (str): Token from the invite link.
+
+    Returns:
+        Invite | None: The group URL with its user and group, or None if the token
+        is unknown or forged.
+
+    Raises:
+        InviteExpired: If the token exists but has expired.
+    """
+    if '.' in token:
+        invite = decode_signed_invite(token)
+        if invite is None or invite.url is not None:
+            return invite
+        return with_group_url(invite, db.session.scalar(group_url_query(invite.group_id)))
+    return invite_from_row(db.session.execute(invite_query(token)).first())
+
+
+def invite_links_query(user_id: int):
+    """
+    Select the rows behind a user's currently valid invite links.
+
+    Signed links are derived from recent purchases, DB links from unexpired tokens.
+    """
+    now = datetime.utcnow()
+    if signed_tokens_enabled():
+        since = now - timedelta(seconds=_ttl_seconds())
+        return (
+            select(Group.id, Group.name)
+            .join(PurchasedItem, PurchasedItem.group_id == Group.id)
+            .where(PurchasedItem.user_id == user_id, PurchasedItem.timestamp > since)
+        )
+    return (
+        select(InviteToken.token, Group.id, Group.name)
+        .join(Group, Group.id == InviteToken.group_id)
+        .where(InviteToken.user_id == user_id, InviteToken.expires_at > now)
+    )
+
+
+def build_invite_links(user_id: int, rows) -> list:
+    """Turn :func:`invite_links_query` rows into link dicts (needs a request context for URLs)."""
+    links = []
+    for row in rows:
+        token = row.token if 'token' in row._fields else issue_signed_token(user_id, row.id)
+        links.append({'id': row.id, 'name': row.name, 'url': url_for('main.join_group', token=token, _external=True)})
+    return links
+
+
+def active_invite_links(user_id: int) -> list:
+    """
+    Build the user's currently valid invite links.
+
+    Args:
+        user_id (int): The user.
+
+    Returns:
+        list: Dicts with ``id``, ``name`` and ``url`` for each group.
+    """
+    return build_invite_links(user_id, db.session.execute(invite_links_query(user_id)).all())
+
+
+def sweep_expired_tokens(batch_size: int = None) -> int:
+    """
+    Delete one batch of expired invite tokens.
+
+    Args:
+        batch_size (int): Maximum rows deleted, defaults to ``TOKEN_SWEEP_BATCH_SIZE``.
+
+    Returns:
+        int: Number of tokens deleted; a full batch means more may remain.
+    """
+    batch_size = batch_size or current_app.config.get('TOKEN_SWEEP_BATCH_SIZE', 1000)
+    expired_ids = (
+        select(InviteToken.id)
+        .where(InviteToken.expires_at < datetime.utcnow())
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    deleted = db.session.execute(
+        delete(InviteToken)
+        .where(InviteToken.id.in_(expired_ids))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return deleted
+
+
+def _sweep_job() -> bool:
+    # Keep sweeping without sleeping while batches come back full
+    batch_size = current_app.config.get('TOKEN_SWEEP_BATCH_SIZE', 1000)
+    return sweep_expired_tokens(batch_size) >= batch_size
+
+
+tokens_cli = AppGroup('tokens', help='Invite token maintenance commands.')
+
+
+@tokens_cli.command('sweep')
+@click.option('--batch-size', type=int, default=None, help='Rows deleted per transaction.')
+def sweep_command(batch_size):
+    """Delete every expired invite token."""
+    total = 0
+    while True:
+        deleted = sweep_expired_tokens(batch_size)
+        total += deleted
+        if not deleted:
+            break
+    click.echo(f'Deleted {total} expired invite token(s).')
+
+
+def init_tokens(app):
+    """
+    Register the expired-token sweeper, ``flask tokens`` commands and the group URL cache.
+
+    Args:
+        app (Flask): The application.
+    """
+    app.cli.add_command(tokens_cli)
+
+    url_cache = LRUCache(app.config.get('GROUP_URL_CACHE_SIZE', 10_000), ttl=app.config.get('GROUP_URL_CACHE_TTL', 300))
+    app.extensions['group_url_cache'] = url_cache
+
+    def on_groups_changed(sender, group_ids=(), **extra):
+        url_cache.delete(*group_ids)
+
+    # Connected strongly: the handler is a closure that would otherwise be collected
+    groups_changed.connect(on_groups_changed, sender=app, weak=False)
+
+    interval = app.config.get('TOKEN_SWEEP_INTERVAL', 300)
+    if interval > 0:
+        register_worker(app, BackgroundWorker(app, _sweep_job, interval=interval, name='token-sweeper'))
@@ -0,0 +1,21 @@
+"""
+Application signals emitted after data changes have been committed.
+
+Caches and other derived state subscribe to these instead of being called
+directly from every view that changes users, baskets or groups.
+"""
+from blinker import Namespace
+
+_signals = Namespace()
+
+# sender=app, user_ids=[...]: account fields (role, ban status, profile) changed
+users_changed = _signals.signal('users-changed')
+
+# sender=app, user_id=int: the user's basket contents changed
+basket_changed = _signals.signal('basket-changed')
+
+# sender=app, user_id=int, group_ids=[...]: the user checked out these groups
+checkout_completed = _signals.signal('checkout-completed')
+
+# sender=app, group_ids=[...]: groups were created, edited or deleted by an admin
+groups_changed = _signals.signal('groups-changed')
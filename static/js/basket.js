@@ -0,0 +1,160 @@
+// Basket updates: applied to the page immediately, sent to the server in coalesced batches.
+//
+// Clicks only change local state and queue an op; ops are flushed to the batch
+// endpoint (data-basket-url on this script tag) once clicks pause for FLUSH_DELAY ms,
+// with at most one request in flight. Repeated clicks on the same group collapse into
+// one op. Each response carries the full server basket, which is reconciled with any
+// ops queued meanwhile. Basket changes made elsewhere (another tab, checkout) arrive
+// from live.js as 'basket:server' events; the basket version orders both sources.
+(() => {
+  const basketUrl = document.currentScript.dataset.basketUrl;
+  const FLUSH_DELAY = 250;
+
+  document.addEventListener('DOMContentLoaded', () => {
+    const csrfInput = document.querySelector('#csrf-form input[name="csrf_token"]');
+    if (!csrfInput || !basketUrl) return;
+    const csrfToken = csrfInput.value;
+
+    const pending = new Map();  // group id -> 'add' | 'remove', not yet sent
+    const names = new Map();
+    let serverIds = new Set(rowIds());
+    let serverVersion = 0;
+    let inFlight = null;
+    let timer = null;
+
+    function rowIds() {
+      return [...document.querySelectorAll('#basket-list li[data-id], #checkout-list li[data-id]')]
+        .map(li => Number(li.dataset.id));
+    }
+
+    function setButtons(gid, inBasket) {
+      document.querySelectorAll(`.basket-btn[data-id='${gid}']`).forEach(btn => {
+        if (btn.dataset.purchased) return;
+        btn.disabled = inBasket;
+        btn.textContent = inBasket ? 'Added to Cart' : 'Add to Cart';
+      });
+    }
+
+    function addRow(gid) {
+      const list = document.getElementById('basket-list');
+      if (!list || list.querySelector(`li[data-id='${gid}']`)) return;
+      const li = document.createElement('li');
+      li.className = 'list-group-item d-flex justify-content-between align-items-center';
+      li.dataset.id = gid;
+      const btn = document.querySelector(`.basket-btn[data-id='${gid}']`);
+      li.append(names.get(gid) || (btn && btn.dataset.name) || `Group ${gid}`, ' ');
+      const remove = document.createElement('button');
+      remove.type = 'button';
+      remove.className = 'btn btn-sm btn-outline-danger remove-btn';
+      remove.dataset.id = gid;
+      remove.textContent = 'Remove';
+      li.appendChild(remove);
+      list.appendChild(li);
+    }
+
+    function removeRow(gid) {
+      document.querySelectorAll(`#basket-list li[data-id='${gid}'], #checkout-list li[data-id='${gid}']`)
+        .forEach(li => li.remove());
+    }
+
+    function render(ids) {
+      const shown = new Set(rowIds());
+      shown.forEach(gid => { if (!ids.has(gid)) { removeRow(gid); setButtons(gid, false); } });
+      ids.forEach(gid => { if (!shown.has(gid)) addRow(gid); setButtons(gid, true); });
+
+      const count = ids.size;
+      ['basket-count', 'total-count'].forEach(id => {
+        const el = document.getElementById(id);
+        if (el) el.textContent = count;
+      });
+      const confirmBtn = document.getElementById('confirm-btn');
+      if (confirmBtn) confirmBtn.disabled = count === 0;
+    }
+
+    function setServerState(data) {
+      if (!data.basket_ids || data.version < serverVersion) return;
+      serverVersion = data.version;
+      serverIds = new Set(data.basket_ids);
+    }
+
+    // Server state plus everything queued or in flight
+    function desiredIds() {
+      const ids = new Set(serverIds);
+      [inFlight, pending].forEach(ops => ops && ops.forEach((op, gid) => {
+        if (op === 'add') ids.add(gid); else ids.delete(gid);
+      }));
+      return ids;
+    }
+
+    function queue(gid, op) {
+      pending.set(gid, op);
+      render(desiredIds());
+      if (!timer) timer = setTimeout(flush, FLUSH_DELAY);
+    }
+
+    function flush() {
+      clearTimeout(timer);
+      timer = null;
+      if (inFlight || !pending.size) return inFlight ? inFlight.done : Promise.resolve();
+
+      inFlight = new Map(pending);
+      pending.clear();
+      const ops = [...inFlight].map(([group_id, op]) => ({ op, group_id }));
+      inFlight.done = fetch(basketUrl, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+        credentials: 'same-origin',
+        body: JSON.stringify({ ops })
+      })
+        .then(res => res.json())
+        .then(data => {
+          setServerState(data);
+          if (!data.success) alert(data.message);
+        })
+        .catch(err => console.error('Basket update failed:', err))
+        .finally(() => {
+          // Anything the server did not confirm falls back to its last known state
+          inFlight = null;
+          render(desiredIds());
+          if (pending.size) return flush();
+        });
+      return inFlight.done;
+    }
+
+    document.addEventListener('click', evt => {
+      const add = evt.target.closest('.basket-btn');
+      if (add && !add.disabled) {
+        const gid = Number(add.dataset.id);
+        names.set(gid, add.dataset.name);
+        return queue(gid, 'add');
+      }
+      const remove = evt.target.closest('.remove-btn');
+      if (remove) return queue(Number(remove.dataset.id), 'remove');
+
+      // Let queued changes land before leaving for a page rendered from the server
+      const link = evt.target.closest('#checkout-btn, #confirm-btn');
+      if (link && (pending.size || inFlight)) {
+        evt.preventDefault();
+        evt.stopImmediatePropagation();
+        flush().then(() => link.click());
+      }
+    }, true);
+
+    document.addEventListener('basket:server', evt => {
+      setServerState(evt.detail);
+      render(desiredIds());
+    });
+
+    window.addEventListener('pagehide', () => {
+      if (!pending.size) return;
+      const ops = [...pending].map(([group_id, op]) => ({ op, group_id }));
+      fetch(basketUrl, {
+        method: 'POST',
+        keepalive: true,
+        headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken },
+        credentials: 'same-origin',
+        body: JSON.stringify({ ops })
+      });
+    });
+  });
+})();
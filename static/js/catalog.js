@@ -0,0 +1,151 @@
+// Loads further pages of the group catalog on demand (keyset pagination), and
+// swaps in search results while the search box has at least two characters.
+document.addEventListener('DOMContentLoaded', () => {
+  const container = document.getElementById('groups-container');
+  const loadMoreBtn = document.getElementById('load-more-btn');
+  if (!container || !loadMoreBtn) return;
+
+  const catalogUrl = container.dataset.catalogUrl;
+  const searchUrl = container.dataset.searchUrl;
+  const searchInput = document.getElementById('group-search');
+  const searchEmpty = document.getElementById('group-search-empty');
+  const uploadsUrl = container.dataset.uploadsUrl;
+  let nextCursor = container.dataset.nextCursor;
+  let loading = false;
+
+  function inBasket(gid) {
+    return document.querySelector(`#basket-list li[data-id='${gid}']`) !== null;
+  }
+
+  function buildCard(group) {
+    const purchasedIds = JSON.parse(container.dataset.purchasedIds || '[]');
+    const purchased = purchasedIds.includes(group.id);
+    const basketed = inBasket(group.id);
+
+    const col = document.createElement('div');
+    col.className = 'col-lg-6 col-xl-4 mb-4 group-card';
+    col.id = `group-${group.id}`;
+
+    const card = document.createElement('div');
+    card.className = 'card h-100';
+    if (group.image_url || group.picture_filename) {
+      const img = document.createElement('img');
+      img.className = 'card-img-top';
+      img.loading = 'lazy';
+      img.alt = group.name;
+      img.src = group.image_url || uploadsUrl + encodeURIComponent(group.picture_filename);
+      card.appendChild(img);
+    }
+
+    const body = document.createElement('div');
+    body.className = 'card-body d-flex flex-column';
+    const title = document.createElement('h5');
+    title.className = 'card-title';
+    title.textContent = group.name;
+    const members = document.createElement('p');
+    members.className = 'card-text flex-grow-1';
+    const count = document.createElement('span');
+    count.className = 'member-count';
+    count.textContent = group.member_count;
+    members.append('Members: ', count);
+
+    const btn = document.createElement('button');
+    btn.type = 'button';
+    btn.className = 'btn btn-primary basket-btn mt-auto';
+    btn.dataset.id = group.id;
+    btn.dataset.name = group.name;
+    if (purchased) btn.dataset.purchased = '1';
+    btn.disabled = purchased || basketed;
+    btn.textContent = purchased ? 'Already Joined' : (basketed ? 'Added to Cart' : 'Add to Cart');
+
+    body.append(title, members, btn);
+    card.appendChild(body);
+    col.appendChild(card);
+    return col;
+  }
+
+  function loadMore() {
+    if (loading || !nextCursor || catalogCards) return;
+    loading = true;
+    loadMoreBtn.disabled = true;
+
+    const url = `${catalogUrl}?after=${encodeURIComponent(nextCursor)}`;
+    fetch(url, { credentials: 'same-origin' })
+      .then(res => res.json())
+      .then(data => {
+        if (!data.success) return alert(data.message);
+        data.groups.forEach(group => container.appendChild(buildCard(group)));
+        nextCursor = data.next_cursor;
+        loadMoreBtn.hidden = !nextCursor;
+      })
+      .catch(err => console.error('Catalog error:', err))
+      .finally(() => {
+        loading = false;
+        loadMoreBtn.disabled = false;
+      });
+  }
+
+  loadMoreBtn.addEventListener('click', loadMore);
+
+  // Catalog cards set aside while search results are shown
+  let catalogCards = null;
+  let searchTimer = null;
+  let searchSeq = 0;
+
+  function showCatalog() {
+    if (!catalogCards) return;
+    container.replaceChildren(catalogCards);
+    catalogCards = null;
+    searchEmpty.hidden = true;
+    loadMoreBtn.hidden = !nextCursor;
+    // The basket may have changed while these cards were detached
+    container.querySelectorAll('.basket-btn:not([data-purchased])').forEach(btn => {
+      const basketed = inBasket(btn.dataset.id);
+      btn.disabled = basketed;
+      btn.textContent = basketed ? 'Added to Cart' : 'Add to Cart';
+    });
+  }
+
+  function showResults(groups) {
+    if (!catalogCards) {
+      catalogCards = document.createDocumentFragment();
+      catalogCards.append(...container.children);
+    }
+    container.replaceChildren(...groups.map(buildCard));
+    searchEmpty.hidden = groups.length > 0;
+    loadMoreBtn.hidden = true;
+  }
+
+  function search(q) {
+    const seq = ++searchSeq;
+    fetch(`${searchUrl}?q=${encodeURIComponent(q)}`, { credentials: 'same-origin' })
+      .then(res => res.json())
+      .then(data => {
+        // Ignore answers to queries the user has already typed past
+        if (seq !== searchSeq || !searchInput.value.trim()) return;
+        if (!data.success) return alert(data.message);
+        showResults(data.groups);
+      })
+      .catch(err => console.error('Search error:', err));
+  }
+
+  if (searchInput && searchUrl) {
+    searchInput.addEventListener('input', () => {
+      clearTimeout(searchTimer);
+      const q = searchInput.value;
+      if (q.trim().length < 2) {
+        searchSeq++;
+        showCatalog();
+        return;
+      }
+      searchTimer = setTimeout(() => search(q), 200);
+    });
+  }
+
+  // Fetch the next page automatically once the button scrolls into view
+  if ('IntersectionObserver' in window) {
+    new IntersectionObserver(entries => {
+      if (entries.some(entry => entry.isIntersecting)) loadMore();
+    }, { rootMargin: '400px' }).observe(loadMoreBtn);
+  }
+});
@@ -1,51 +1,72 @@
-document.getElementById('confirm-btn').addEventListener('click', evt => {
-  evt.preventDefault();
+// Checkout confirmation: one POST to /checkout that also queues the links email.
+//
+// Every click gets an Idempotency-Key that is reused while retrying, so a retry
+// after a network error or a 409 (first attempt still running) gets the stored
+// result instead of checking out or emailing twice.
+document.addEventListener('DOMContentLoaded', () => {
+  const container = document.getElementById('checkout-container');
+  const confirmBtn = document.getElementById('confirm-btn');
+  const csrfInput = document.querySelector('#csrf-form input[name="csrf_token"]');
+  if (!container || !confirmBtn || !csrfInput) return;
 
-  // Step 1: Confirm Checkout
-  fetch(checkoutUrl, {
-    method: 'POST',
-    headers: {
-      'Content-Type': 'application/json',
-      'X-CSRFToken': csrfToken
-    },
-    credentials: 'same-origin',
-    body: JSON.stringify({ csrf_token: csrfToken })
-  })
-  .then(res => res.json())
-  .then(data => {
-    if (!data.success) {
-      alert(data.message);
-      return;
-    }
+  const checkoutUrl = container.dataset.checkoutUrl;
+  const dashboardUrl = container.dataset.dashboardUrl;
+  const csrfToken = csrfInput.value;
+  const MAX_ATTEMPTS = 4;
 
-    // Step 2: Send Email
-    fetch('/send_group_links', {
+  function newKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+  }
+
+  function post(key, attempt = 1) {
+    return fetch(checkoutUrl, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
-        'X-CSRFToken': csrfToken
+        'X-CSRFToken': csrfToken,
+        'Idempotency-Key': key
       },
       credentials: 'same-origin',
-      body: JSON.stringify({ csrf_token: csrfToken })
+      body: JSON.stringify({ send_links: true })
     })
-    .then(res => res.json())
-    .then(emailData => {
-      if (emailData.success) {
-        alert("✅ Checkout complete! Group links sent to your email.");
-        window.location.href = dashboardUrl;
-      } else {
-        alert("⚠️ Checkout complete, but email failed: " + emailData.message);
+    .then(res => {
+      if ((res.status === 409 || res.status >= 500) && attempt < MAX_ATTEMPTS) {
+        return retry(key, attempt, Number(res.headers.get('Retry-After')) || 0);
       }
-    })
-    .catch(err => {
-      console.error("Error sending email:", err);
-      alert("⚠️ Checkout complete, but failed to send email.");
-      window.location.href = dashboardUrl;
+      return res.json();
+    }, err => {
+      if (attempt < MAX_ATTEMPTS) return retry(key, attempt, 0);
+      throw err;
     });
+  }
 
-  })
-  .catch(err => {
-    console.error('Checkout error:', err);
-    alert("❌ Checkout failed. Please try again.");
+  function retry(key, attempt, seconds) {
+    const delay = Math.max(seconds * 1000, 500 * 2 ** (attempt - 1));
+    return new Promise(resolve => setTimeout(resolve, delay)).then(() => post(key, attempt + 1));
+  }
+
+  confirmBtn.addEventListener('click', evt => {
+    evt.preventDefault();
+    if (confirmBtn.disabled) return;
+    confirmBtn.disabled = true;
+
+    post(newKey())
+      .then(data => {
+        if (!data.success) {
+          alert(data.message);
+          confirmBtn.disabled = false;
+          return;
+        }
+        alert(data.queued
+          ? '✅ Checkout complete! Group links sent to your email.'
+          : '✅ Checkout complete! Your group links are on the dashboard.');
+        window.location.href = dashboardUrl;
+      })
+      .catch(err => {
+        console.error('Checkout error:', err);
+        alert('❌ Checkout failed. Please try again.');
+        confirmBtn.disabled = false;
+      });
   });
 });
@@ -0,0 +1,37 @@
+// Live updates: applies member-count and basket deltas pushed over /events
+// (data-events-url on this script tag) instead of reloading the page.
+//
+// Basket updates are re-dispatched as a 'basket:server' event for basket.js.
+(() => {
+  const eventsUrl = document.currentScript.dataset.eventsUrl;
+  if (!eventsUrl || !window.EventSource) return;
+
+  function connect() {
+    const source = new EventSource(eventsUrl);
+
+    source.addEventListener('groups', evt => {
+      const data = JSON.parse(evt.data);
+      data.groups.forEach(group => {
+        document.querySelectorAll(`#group-${group.id} .member-count`).forEach(el => {
+          el.textContent = group.member_count;
+        });
+      });
+      (data.removed || []).forEach(gid => {
+        const card = document.getElementById(`group-${gid}`);
+        if (card) card.remove();
+      });
+    });
+
+    source.addEventListener('basket', evt => {
+      document.dispatchEvent(new CustomEvent('basket:server', { detail: JSON.parse(evt.data) }));
+    });
+
+    // The server dropped us for falling behind: start a fresh stream
+    source.addEventListener('reset', () => {
+      source.close();
+      setTimeout(connect, 1000);
+    });
+  }
+
+  document.addEventListener('DOMContentLoaded', connect);
+})();
@@ -0,0 +1,83 @@
+"""Checkout racing a concurrent basket change (SQLite ignores FOR UPDATE)."""
+import threading
+
+import pytest
+from sqlalchemy import event, select
+
+from app import create_app
+from models import db, User, Group, BasketItem, PurchasedItem
+from services.basket import apply_ops
+from services.checkout import checkout_basket
+
+LIMIT = 10
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'MAIL_WORKER_THREADS': 0,
+        'PASSWORD_HASH_WORKERS': 0,
+        'TOKEN_SWEEP_INTERVAL': 0,
+        'HOLD_RELEASE_INTERVAL': 0,
+        'SESSION_SWEEP_INTERVAL': 0,
+        'ANALYTICS_ROLLUP_INTERVAL': 0,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(email='bob@example.org', password='x', name='Bob', is_active=True))
+        db.session.add_all([
+            Group(name='Open', url='https://chat.example/1', member_count=0),
+            Group(name='Limited', url='https://chat.example/2', member_count=0, capacity=5),
+        ])
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def _add_concurrently(app, user_id, group_id):
+    # A separate thread gets its own scoped session, i.e. another connection
+    def run():
+        with app.app_context():
+            apply_ops(user_id, [{'op': 'add', 'group_id': group_id}], LIMIT)
+            db.session.remove()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+def test_basket_add_between_read_and_commit_is_not_lost(app):
+    with app.app_context():
+        user_id = db.session.scalar(select(User.id))
+        open_id, limited_id = db.session.scalars(select(Group.id).order_by(Group.id)).all()
+        apply_ops(user_id, [{'op': 'add', 'group_id': open_id}], LIMIT)
+
+        injected = []
+
+        # Fires after the basket has been read, before the checkout writes anything
+        @event.listens_for(db.session, 'do_orm_execute')
+        def add_after_basket_read(state):
+            if not injected and 'FROM "group"' in str(state.statement):
+                injected.append(True)
+                _add_concurrently(app, user_id, limited_id)
+
+        purchased = checkout_basket(user_id, LIMIT)
+        event.remove(db.session, 'do_orm_execute', add_after_basket_read)
+
+        assert injected
+        # The item added mid-checkout is either bought or still in the basket, never dropped
+        bought = set(db.session.scalars(select(PurchasedItem.group_id).where(PurchasedItem.user_id == user_id)))
+        basket = set(db.session.scalars(select(BasketItem.group_id).where(BasketItem.user_id == user_id)))
+        assert set(purchased) == bought
+        assert bought | basket == {open_id, limited_id}
+        assert not bought & basket
+
+        user = db.session.get(User, user_id)
+        assert user.basket_count == len(basket)
+        assert user.purchase_count == len(bought)
+        limited = db.session.get(Group, limited_id)
+        assert limited.seats_held + limited.seats_sold == 1
+        assert limited.seats_sold == (1 if limited_id in bought else 0)
@@ -3,6 +3,7 @@ from flask import g, request, redirect, url_for, abort
 from functools import wraps
 from flask_login import login_required, current_user
 from flask import flash, redirect, url_for,make_response
+import hashlib
 
 def admin_required(f):
     @wraps(f)
@@ -43,3 +44,57 @@ def nocache(view):
         return response
     return no_cache
 
+
+def conditional_etag(data_tag, user_key=''):
+    """
+    ETag for a validator value, covering the full request path and the user.
+    param data_tag: validator string for the underlying data
+    param user_key: id of the current user, or '' for anonymous requests
+    """
+    return hashlib.sha1(f'{data_tag}|{request.full_path}|{user_key}'.encode()).hexdigest()
+
+
+def is_not_modified(etag, last_modified):
+    """True if the request's If-None-Match / If-Modified-Since match the current validators."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    return bool(last_modified and request.if_modified_since
+                and last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None))
+
+
+def set_validators(response, etag, last_modified):
+    """Attach the ETag/Last-Modified and revalidation headers to a 200 or 304 response."""
+    if response.status_code in (200, 304):
+        response.set_etag(etag, weak=True)
+        if last_modified:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+    return response
+
+
+def conditional(validator):
+    """
+    Decorator answering conditional GETs from a cheap validator before the view runs.
+    param validator: callable returning (etag, last_modified) for the underlying data
+
+    The ETag also covers the full request path and the current user, so paginated
+    and per-user variants of a page are validated separately.
+    """
+    def decorator(view):
+        @wraps(view)
+        def conditional_view(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+
+            data_tag, last_modified = validator()
+            user_key = str(current_user.id) if current_user.is_authenticated else ''
+            etag = conditional_etag(data_tag, user_key)
+
+            if is_not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            return set_validators(response, etag, last_modified)
+        return conditional_view
+    return decorator
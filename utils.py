@@ -1,8 +1,13 @@
 """
 Utility functions for password hashing and verification.
+
+Inside an application the work is delegated to the bounded process pool in
+``services.passwords``; without an app context it runs inline.
 """
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from services.passwords import DEFAULT_METHOD, get_password_hasher
+
 def hash_password(password: str) -> str:
     """
     Hash a plaintext password for storing in the database.
@@ -12,8 +17,14 @@ def hash_password(password: str) -> str:
 
     Returns:
         str: The hashed password.
+
+    Raises:
+        HasherBusy: If the hashing queue is full.
     """
-    return generate_password_hash(password)
+    hasher = get_password_hasher()
+    if hasher is None:
+        return generate_password_hash(password, method=DEFAULT_METHOD)
+    return hasher.hash(password)
 
 def verify_password(stored_hash: str, password: str) -> bool:
     """
@@ -25,5 +36,26 @@ def verify_password(stored_hash: str, password: str) -> bool:
 
     Returns:
         bool: True if the password matches, False otherwise.
+
+    Raises:
+        HasherBusy: If the hashing queue is full.
+    """
+    hasher = get_password_hasher()
+    if hasher is None:
+        return check_password_hash(stored_hash, password)
+    return hasher.verify(stored_hash, password)
+
+def needs_rehash(stored_hash: str) -> bool:
+    """
+    Check whether a stored hash uses outdated parameters.
+
+    Args:
+        stored_hash (str): The stored password hash.
+
+    Returns:
+        bool: True if the hash should be replaced at the next successful login.
     """
-    return check_password_hash(stored_hash, password)
+    hasher = get_password_hasher()
+    if hasher is None:
+        return stored_hash.split('$', 1)[0] != DEFAULT_METHOD
+    return hasher.needs_rehash(stored_hash)
@@ -1,19 +1,77 @@
 from . import admin_bp
-from flask import render_template, redirect, url_for, flash, request, current_app, abort
+from flask import (
+    render_template, redirect, url_for, flash, request, current_app, abort, jsonify, Response,
+    stream_with_context,
+)
 from flask_login import login_required, current_user
 from models import db, User, Group
 from forms import GroupForm, CSRFProtectForm  # import CheckoutLimitForm when ready
-from utililties.decorators import roles_required
+from utililties.decorators import roles_required, conditional
+from signals import groups_changed
+from services.metrics import get_metrics
+from services.analytics import dashboard as analytics_dashboard
+from services.http_cache import users_validator, admin_groups_validator
+from services.images import get_image_pipeline
+from services.search import normalize_tags
+from services.bulk import (
+    BulkError, resolve_user_ids, set_users_banned, parse_group_file, import_groups, recompute_member_counts,
+)
+from services.admin_lists import (
+    user_list_query, group_list_query, user_export_rows, purchase_export_rows, encode_csv, encode_jsonl,
+)
+from werkzeug.utils import secure_filename
+import hashlib
+import os
 
 
 # -- User Management --
 @admin_bp.route('/users')
 @roles_required('Admin')
 @login_required
+@conditional(users_validator)
 def manage_users():
     # user = current_user  # placeholder for future role checks
-    users = User.query.all()
-    return render_template('users.html', users=users)
+    listing = _list_args('id')
+    pagination = db.paginate(
+        user_list_query(listing['q'], listing['sort'], listing['dir']),
+        page=listing['page'], per_page=current_app.config['ADMIN_PAGE_SIZE'], error_out=False,
+    )
+    return render_template('users.html', users=pagination.items, pagination=pagination, listing=listing)
+
+
+def _list_args(default_sort):
+    """Read the search/sort/page query arguments shared by the admin lists."""
+    return {
+        'q': request.args.get('q', '').strip(),
+        'sort': request.args.get('sort', default_sort),
+        'dir': 'desc' if request.args.get('dir') == 'desc' else 'asc',
+        'page': max(request.args.get('page', 1, type=int), 1),
+    }
+
+
+def _export_response(rows, basename):
+    """Stream rows as CSV (default) or JSONL depending on ``?format=``."""
+    if request.args.get('format') == 'jsonl':
+        body, mimetype, ext = encode_jsonl(rows), 'application/x-ndjson', 'jsonl'
+    else:
+        body, mimetype, ext = encode_csv(rows), 'text/csv', 'csv'
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={basename}.{ext}'
+    return response
+
+
+@admin_bp.route('/users/export')
+@roles_required('Admin')
+@login_required
+def export_users():
+    return _export_response(user_export_rows(request.args.get('q', '').strip()), 'users')
+
+
+@admin_bp.route('/purchases/export')
+@roles_required('Admin')
+@login_required
+def export_purchases():
+    return _export_response(purchase_export_rows(), 'purchases')
 
 @admin_bp.route('/users/ban/<int:user_id>')
 @roles_required('Admin')
@@ -21,20 +79,93 @@ def manage_users():
 def ban_user(user_id):
     # user = current_user
     target = User.query.get_or_404(user_id)
-    target.is_active = False
-    db.session.commit()
-    flash(f'User {target.name} is now banned.', 'warning')
+    if target.role == 'Admin':
+        flash('Admins cannot be banned.', 'danger')
+    elif target.is_blacklisted:
+        flash(f'User {target.name} is already banned.', 'info')
+    elif not set_users_banned([target.id]):
+        flash('User not found.', 'danger')
+    else:
+        flash(f'User {target.name} is now banned.', 'warning')
     return redirect(url_for('admin.manage_users'))
 
 
+@admin_bp.route('/users/bulk', methods=['POST'])
+@roles_required('Admin')
+@login_required
+def bulk_users():
+    """
+    Ban or unban many users at once.
+
+    Accepts a form (``action`` plus repeated or newline-separated ``users``) or a
+    JSON body ``{"action": "ban"|"unban", "users": [id or email, ...]}``.
+    """
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        action, identifiers = payload.get('action'), payload.get('users') or []
+    else:
+        action = request.form.get('action')
+        identifiers = [part for value in request.form.getlist('users') for part in value.replace(',', '\n').splitlines()]
+    if action not in ('ban', 'unban'):
+        abort(400)
+    changed = set_users_banned(resolve_user_ids(identifiers), banned=action == 'ban')
+    if request.is_json:
+        return jsonify({'success': True, 'updated': changed})
+    flash(f"{'Banned' if action == 'ban' else 'Unbanned'} {changed} user(s).", 'warning')
+    return redirect(request.referrer or url_for('admin.manage_users'))
+
+def _save_upload(file_storage):
+    """Store an uploaded picture under static/uploads with a content-hash prefix."""
+    data = file_storage.read()
+    name = secure_filename(file_storage.filename) or 'picture'
+    filename = f"{hashlib.sha256(data).hexdigest()[:12]}-{name}"
+    upload_dir = os.path.join(current_app.static_folder, 'uploads')
+    os.makedirs(upload_dir, exist_ok=True)
+    with open(os.path.join(upload_dir, filename), 'wb') as fh:
+        fh.write(data)
+    return filename
+
+
 # -- Group Management (CRUD) --
 @admin_bp.route('/groups')
 @roles_required('Admin')
 @login_required
+@conditional(admin_groups_validator)
 def list_groups():
     # user = current_user
-    groups = Group.query.all()
-    return render_template('groups.html', groups=groups)
+    listing = _list_args('name')
+    pagination = db.paginate(
+        group_list_query(listing['q'], listing['sort'], listing['dir']),
+        page=listing['page'], per_page=current_app.config['ADMIN_PAGE_SIZE'], error_out=False,
+    )
+    return render_template('groups.html', groups=pagination.items, pagination=pagination, listing=listing)
+
+@admin_bp.route('/groups/import', methods=['POST'])
+@roles_required('Admin')
+@login_required
+def import_groups_view():
+    """Import groups from an uploaded CSV or JSON file."""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Choose a CSV or JSON file to import.', 'danger')
+        return redirect(url_for('admin.list_groups'))
+    try:
+        result = import_groups(parse_group_file(upload.stream, upload.filename))
+    except (BulkError, ValueError) as e:
+        flash(f'Import failed: {e}', 'danger')
+        return redirect(url_for('admin.list_groups'))
+    flash(f"Imported {result['imported']} group(s), skipped {len(result['errors'])}.", 'success')
+    for number, message in result['errors'][:10]:
+        flash(f'Row {number}: {message}', 'warning')
+    return redirect(url_for('admin.list_groups'))
+
+@admin_bp.route('/groups/recount', methods=['POST'])
+@roles_required('Admin')
+@login_required
+def recount_groups():
+    """Recompute every group's member count from purchases."""
+    flash(f'Corrected {recompute_member_counts()} group count(s).', 'success')
+    return redirect(url_for('admin.list_groups'))
 
 @admin_bp.route('/groups/create', methods=['GET', 'POST'])
 @roles_required('Admin')
@@ -47,11 +178,16 @@ def create_group():
             name=form.name.data,
             url=form.url.data,
             description=form.description.data,
-            picture_filename=form.picture_filename.data,
-            member_count=form.member_count.data or 0
+            tags=normalize_tags(form.tags.data),
+            picture_filename=_save_upload(form.picture.data) if form.picture.data else form.picture_filename.data,
+            picture_url=form.picture_url.data or None,
+            member_count=form.member_count.data or 0,
+            capacity=form.capacity.data,
         )
         db.session.add(group)
         db.session.commit()
+        get_image_pipeline().schedule(group)
+        groups_changed.send(current_app._get_current_object(), group_ids=[group.id])
         flash('Group created.', 'success')
         return redirect(url_for('admin.list_groups'))
     return render_template('group_form.html', form=form, action='Create')
@@ -67,9 +203,14 @@ def edit_group(group_id):
         group.name = form.name.data
         group.url = form.url.data
         group.description = form.description.data
-        group.picture_filename = form.picture_filename.data
+        group.tags = normalize_tags(form.tags.data)
+        group.picture_filename = _save_upload(form.picture.data) if form.picture.data else form.picture_filename.data
+        group.picture_url = form.picture_url.data or None
         group.member_count = form.member_count.data or group.member_count
+        group.capacity = form.capacity.data
         db.session.commit()
+        get_image_pipeline().schedule(group)
+        groups_changed.send(current_app._get_current_object(), group_ids=[group.id])
         flash('Group updated.', 'success')
         return redirect(url_for('admin.list_groups'))
     return render_template('group_form.html', form=form, action='Edit')
@@ -86,6 +227,7 @@ def delete_group(group_id):
     group = Group.query.get_or_404(group_id)
     db.session.delete(group)
     db.session.commit()
+    groups_changed.send(current_app._get_current_object(), group_ids=[group_id])
     flash('Group deleted.', 'danger')
     return redirect(url_for('admin.list_groups'))
 
@@ -114,3 +256,33 @@ def configure_checkout_limit():
 
     flash('Checkout limit configuration placeholder.', 'info')
     return redirect(url_for('admin.list_groups'))
+
+
+# -- Instrumentation --
+@admin_bp.route('/metrics')
+@roles_required('Admin')
+@login_required
+def metrics():
+    """
+    Per-endpoint latency, SQL and N+1 metrics of this process.
+    Pass ?format=prometheus for the Prometheus text format.
+    """
+    registry = get_metrics()
+    if request.args.get('format') == 'prometheus':
+        return Response(registry.prometheus(), mimetype='text/plain; version=0.0.4')
+    return jsonify(registry.snapshot())
+
+
+@admin_bp.route('/analytics')
+@roles_required('Admin')
+@login_required
+def analytics():
+    """
+    Activity dashboard read from the hourly/daily rollup tables.
+    Pass ?format=json for the raw data and ?days=N to change the window.
+    """
+    days = min(max(request.args.get('days', 30, type=int), 1), 365)
+    data = analytics_dashboard(days=days)
+    if request.args.get('format') == 'json':
+        return jsonify(data)
+    return render_template('analytics.html', data=data)
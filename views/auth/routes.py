@@ -1,9 +1,11 @@
 from flask import  render_template, redirect, url_for, flash
-from flask_login import login_user, logout_user, login_required, current_user
+from flask_login import logout_user, login_required, current_user
 from models import db, User
 from forms import RegistrationForm, LoginForm
 from . import auth_bp
-from utils import hash_password, verify_password
+from utils import hash_password, verify_password, needs_rehash
+from services.analytics import record_event
+from services.sessions import start_session
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
@@ -51,11 +53,17 @@ def login():
         user = User.query.filter_by(email=form.email.data).first()
 
         if user and verify_password(user.password, form.password.data):
-            if user.is_blacklisted:
+            if user.is_banned:
                 flash('Your account has been banned.', 'danger')
                 return redirect(url_for('auth.login'))
 
-            login_user(user, remember=form.remember.data)
+            # Upgrade hashes made with older PASSWORD_HASH_METHOD parameters
+            if needs_rehash(user.password):
+                user.password = hash_password(form.password.data)
+                db.session.commit()
+
+            start_session(user, remember=form.remember.data)
+            record_event('login', user.id)
             flash('Logged in successfully', 'success')
 
             if user.role == 'Admin':
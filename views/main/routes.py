@@ -1,15 +1,20 @@
 from . import main_bp
-from flask import render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask import render_template, redirect, url_for, flash, request, jsonify, current_app, abort
 from flask_login import login_required, current_user
-from flask_wtf import FlaskForm
-from models import db, Group, BasketItem, PurchasedItem, InviteToken
+from models import db
 from forms import CSRFProtectForm
-from datetime import datetime, timedelta
-import secrets
-import requests
-import os
-from sendgrid import SendGridAPIClient
-from sendgrid.helpers.mail import Mail
+from services.catalog import catalog_page, groups_by_ids, serialize_card
+from services.checkout import checkout_basket, CheckoutError
+from services.mailer import enqueue_email, render_invite_email
+from services.identity import get_identity_cache
+from services.basket import apply_ops, BasketError
+from services.http_cache import catalog_validator
+from utililties.decorators import conditional
+from services.tokens import resolve_invite, active_invite_links, signed_tokens_enabled, InviteExpired
+from services.analytics import record_event
+from services.events import get_event_broker
+from services.search import search_groups
+from services.idempotency import idempotent
 
 
 
@@ -23,173 +28,201 @@ def index():
 @login_required
 def dashboard():
     """
-    Render dashboard with all groups, current basket IDs, and CSRF form.
+    Render dashboard with the first catalog page, current basket IDs, and CSRF form.
+    Further pages are fetched on demand from ``main.group_catalog``.
     """
     form = CSRFProtectForm()
-    groups = Group.query.all()
-    basket_ids = [item.group_id for item in current_user.basket_items]
-    print(f"⭐ Basket IDs: {basket_ids}")
-    print(f"⭐current_user basket items:  {current_user.basket_items}  Groups:{groups}")
-    return render_template('main/dashboard.html', groups=groups, basket_ids=basket_ids, form=form)
+    page_size = current_app.config.get('CATALOG_PAGE_SIZE', 24)
+    groups, next_cursor = catalog_page(limit=page_size)
+    summary = get_identity_cache().summary(current_user.id)
+    basket_ids = summary['basket_ids']
+    purchased_ids = summary['purchased_ids']
+    basket_groups = groups_by_ids(basket_ids)
+    return render_template(
+        'main/dashboard.html',
+        groups=groups,
+        next_cursor=next_cursor,
+        basket_ids=basket_ids,
+        basket_groups=basket_groups,
+        purchased_ids=purchased_ids,
+        form=form,
+    )
 
 
-@main_bp.route('/add_to_basket', methods=['POST'])
+@main_bp.route('/groups', methods=['GET'])
 @login_required
-def add_to_basket():
-    """AJAX endpoint to add a group to basket."""
-    form = CSRFProtectForm()
-    if not form.validate_on_submit():
-        return jsonify({'success': False, 'message': 'Invalid CSRF token.'}), 400
+@conditional(catalog_validator)
+def group_catalog():
+    """JSON endpoint returning one keyset-paginated page of group cards."""
+    page_size = current_app.config.get('CATALOG_PAGE_SIZE', 24)
+    max_size = current_app.config.get('CATALOG_MAX_PAGE_SIZE', 100)
+    limit = min(max(request.args.get('limit', page_size, type=int), 1), max_size)
+    try:
+        rows, next_cursor = catalog_page(after=request.args.get('after'), limit=limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({
+        'success': True,
+        'groups': [serialize_card(row) for row in rows],
+        'next_cursor': next_cursor,
+    }), 200
 
-    user = current_user
-    group_id = request.json.get('group_id') or request.form.get('group_id')
-    if not group_id:
-        return jsonify({'success': False, 'message': 'No group_id provided.'}), 400
-    group_id = int(group_id)
 
-    # Check if already purchased
-    already_purchased = any(item.group_id == group_id for item in current_user.purchased_items)
-    if already_purchased:
-        return jsonify({'success': False, 'message': 'Group already purchased.'}), 400
+@main_bp.route('/groups/search', methods=['GET'])
+@login_required
+def group_search():
+    """JSON typeahead search over group names, descriptions and tags (``?q=`` and/or ``?tag=``)."""
+    max_size = current_app.config.get('SEARCH_MAX_RESULTS', 50)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), max_size)
+    rows = search_groups(request.args.get('q', ''), tag=request.args.get('tag'), limit=limit)
+    return jsonify({'success': True, 'groups': [serialize_card(row) for row in rows]}), 200
+
+
+@main_bp.route('/events')
+@login_required
+def events():
+    """
+    Server-sent event stream of member-count and basket updates for the current user.
+
+    Answers 204 (which stops ``EventSource`` from reconnecting) unless ``EVENTS_ENABLED``.
+    """
+    if not current_app.config.get('EVENTS_ENABLED', False):
+        return '', 204
+    stream = get_event_broker().stream(
+        current_user.id,
+        heartbeat=current_app.config.get('EVENTS_HEARTBEAT_SECONDS', 15),
+        max_seconds=current_app.config.get('EVENTS_MAX_STREAM_SECONDS', 300),
+    )
+    response = current_app.response_class(stream, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
 
-    # Enforce checkout limit
-    checkout_limit = current_app.config.get('GROUP_CHECKOUT_LIMIT', 3)
-    purchased_count = len(current_user.purchased_items)
-    basket_count = len(current_user.basket_items)+1  # +1 for the new item being added
 
-    if purchased_count + basket_count > checkout_limit:
-        return jsonify({'success': False, 'message': f'Checkout limit {checkout_limit} reached.'}), 400
+@main_bp.route('/basket', methods=['POST'])
+@login_required
+def basket():
+    """
+    AJAX endpoint applying a batch of basket operations in one transaction.
 
-    # Prevent duplicates in basket
-    existing = BasketItem.query.filter_by(user_id=user.id, group_id=group_id).first()
-    if existing:
-        return jsonify({'success': False, 'message': 'Already in basket.'}), 400
+    Body: ``{"ops": [{"op": "add"|"remove", "group_id": 1}, ...]}``. Responds with
+    the full basket (``basket_ids``, ``basket_count``, ``version``) and per-group
+    ``results`` so the client can reconcile its optimistic state.
+    """
+    form = CSRFProtectForm()
+    if not form.validate_on_submit():
+        return jsonify({'success': False, 'message': 'Invalid CSRF token.'}), 400
 
-    # Add to basket
-    item = BasketItem(user_id=user.id, group_id=group_id)
-    db.session.add(item)
-    db.session.commit()
+    ops = (request.get_json(silent=True) or {}).get('ops')
+    if not isinstance(ops, list):
+        return jsonify({'success': False, 'message': 'No ops provided.'}), 400
+    return _basket_response(ops)
 
 
-    in_basket = current_user.basket_items
-    return jsonify({'success': True, 'basket_count': basket_count}), 200
+def _basket_response(ops, rejected_status=200):
+    """Apply ``ops`` for the current user and build the JSON basket state."""
+    try:
+        state = apply_ops(current_user.id, ops, current_app.config.get('GROUP_CHECKOUT_LIMIT', 3))
+    except BasketError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    failed = [r['message'] for r in state['results'] if not r['success']]
+    state['success'] = not failed
+    if failed:
+        state['message'] = failed[0]
+    return jsonify(state), rejected_status if failed else 200
 
 
-@main_bp.route('/remove_from_basket', methods=['POST'])
-@login_required
-def remove_from_basket():
-    """AJAX endpoint to remove a group from basket."""
+def _single_op(action):
     form = CSRFProtectForm()
     if not form.validate_on_submit():
         return jsonify({'success': False, 'message': 'Invalid CSRF token.'}), 400
-
-    user = current_user
-    group_id = request.json.get('group_id') or request.form.get('group_id')
+    group_id = (request.get_json(silent=True) or {}).get('group_id') or request.form.get('group_id')
     if not group_id:
         return jsonify({'success': False, 'message': 'No group_id provided.'}), 400
-    group_id = int(group_id)
+    return _basket_response([{'op': action, 'group_id': group_id}], rejected_status=400)
 
-    item = BasketItem.query.filter_by(user_id=user.id, group_id=group_id).first()
-    if item:
-        db.session.delete(item)
-        db.session.commit()
 
-    new_basket_ids = [i.group_id for i in current_user.basket_items]
-    return jsonify({'success': True, 'basket_count': len(new_basket_ids), 'basket_ids': new_basket_ids}), 200
+@main_bp.route('/add_to_basket', methods=['POST'])
+@login_required
+def add_to_basket():
+    """AJAX endpoint to add a group to basket (single-operation form of ``/basket``)."""
+    return _single_op('add')
+
+
+@main_bp.route('/remove_from_basket', methods=['POST'])
+@login_required
+def remove_from_basket():
+    """AJAX endpoint to remove a group from basket (single-operation form of ``/basket``)."""
+    return _single_op('remove')
+
+
+# The checkout page removes items through the same code path
+main_bp.add_url_rule('/remove_from_checkout', 'remove_from_checkout', remove_from_basket, methods=['POST'])
 
 
 @main_bp.route('/checkout', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def checkout():
-    """Render checkout summary or finalize purchase via AJAX."""
-    user = current_user
-    basket_items = current_user.basket_items
+    """
+    Render checkout summary or finalize purchase via AJAX.
 
+    A POST with ``{"send_links": true}`` also queues the invite-links email, so
+    the checkout page needs a single round trip. Send an ``Idempotency-Key``
+    header to make retries safe.
+    """
     form = CSRFProtectForm()
-    if form.validate_on_submit():
+    limit = current_app.config.get('GROUP_CHECKOUT_LIMIT', 3)
+
+    if request.method == 'POST':
         if not form.validate_on_submit():
             return jsonify({'success': False, 'message': 'Invalid CSRF token.'}), 400
 
-        limit = current_app.config.get('GROUP_CHECKOUT_LIMIT', 3)
-
-        if len(user.purchased_items) + len(basket_items) > limit:
-            return jsonify({'success': False, 'message': 'Checkout limit reached.'}), 400
-
-        purchased_ids = []
-        for item in list(basket_items):
-            db.session.add(PurchasedItem(user_id=user.id, group_id=item.group_id))
-            group = Group.query.get(item.group_id)
-            if group:
-                group.member_count += 1
-            token_str = secrets.token_urlsafe(16)
-            expires = datetime.utcnow() + timedelta(minutes=15)
-            db.session.add(
-                InviteToken(
-                    user_id=user.id,
-                    group_id=item.group_id,
-                    token=token_str,
-                    expires_at=expires,
-                )
+        body = {'success': True}
+
+        def queue_links_email(group_ids):
+            # Inside the checkout transaction, so a purchase never commits without its email
+            body['links'] = links = _generate_group_links()
+            if links:
+                enqueue_email(**render_invite_email(current_user, links))
+                body['queued'] = True
+
+        send_links = (request.get_json(silent=True) or {}).get('send_links')
+        try:
+            body['purchased_ids'] = checkout_basket(
+                current_user.id,
+                limit,
+                token_ttl_minutes=current_app.config.get('INVITE_TOKEN_TTL_MINUTES', 15),
+                issue_tokens=not signed_tokens_enabled(),
+                before_commit=queue_links_email if send_links else None,
             )
-            db.session.delete(item)
-            purchased_ids.append(item.group_id)
-        db.session.commit()
-
-        links = _generate_group_links()
+        except CheckoutError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
 
-        return jsonify({'success': True, 'purchased_ids': purchased_ids, 'links': links}), 200
+        if 'links' not in body:
+            body['links'] = _generate_group_links()
+        return jsonify(body), 200
 
-    groups = [Group.query.get(item.group_id) for item in basket_items]
-    limit = current_app.config.get('GROUP_CHECKOUT_LIMIT', 3)
+    basket_ids = get_identity_cache().summary(current_user.id)['basket_ids']
+    groups = groups_by_ids(basket_ids)
 
     return render_template(
         'main/checkout.html',
         groups=groups,
-        basket_count=len(basket_items),
+        basket_count=len(basket_ids),
         limit=limit,
         form=form,
     )
 
-@main_bp.route('/remove_from_checkout', methods=['POST'])
-@login_required
-def remove_from_checkout():
-    """AJAX endpoint to remove a group while on the checkout page."""
-    form = CSRFProtectForm()
-    if not form.validate_on_submit():
-        return jsonify({'success': False, 'message': 'Invalid CSRF token.'}), 400
-
-    user = current_user
-    group_id = request.json.get('group_id') or request.form.get('group_id')
-    if not group_id:
-        return jsonify({'success': False, 'message': 'No group_id provided.'}), 400
-    group_id = int(group_id)
-
-    item = BasketItem.query.filter_by(user_id=user.id, group_id=group_id).first()
-    if item:
-        db.session.delete(item)
-        db.session.commit()
-
-    new_basket_ids = [i.group_id for i in current_user.basket_items]
-    return jsonify({'success': True, 'basket_count': len(new_basket_ids), 'basket_ids': new_basket_ids}), 200
-
-
 def _generate_group_links():
     """Helper to build purchased group link data."""
-    tokens = InviteToken.query.filter(
-        InviteToken.user_id == current_user.id,
-        InviteToken.expires_at > datetime.utcnow(),
-    ).all()
-    links = []
-    for t in tokens:
-        if t.group:
-            invite_url = url_for('main.join_group', token=t.token, _external=True)
-            links.append({'id': t.group.id, 'name': t.group.name, 'url': invite_url})
-    return links
+    return active_invite_links(current_user.id)
 
 @main_bp.route('/send_group_links', methods=['POST'])
 @login_required
+@idempotent
 def send_group_links():
-    print("Sending group links via email...")
+    """Queue the user's active invite links for email delivery and return immediately."""
     form = CSRFProtectForm()
     if not form.validate_on_submit():
         return jsonify({'success': False, 'message': 'Invalid CSRF token.'}), 400
@@ -198,38 +231,21 @@ def send_group_links():
     if not links:
         return jsonify({'success': False, 'message': 'No active invites to send.'}), 400
 
-    # Render both text and HTML
-    text_body = render_template('emails/invite.txt', user=current_user, links=links)
-    html_body = render_template('emails/invite.html', user=current_user, links=links)
-
-    message = Mail(
-        from_email="Zimbos Portal <no-reply@zimbos.org>",
-        to_emails= [current_user.email],
-        subject=  "Your Zimbos Group Invite Links",
-        html_content= html_body)
-
-    try:
-        sg = SendGridAPIClient(os.environ.get('SENDGRID_API_KEY'))
-        sg.set_sendgrid_data_residency("eu")
-        response = sg.send(message)
-        print(response.status_code)
-        print(response.body)
-        print(response.headers)
-    except Exception as e:
-        current_app.logger.error("SendGrid error: %s", str(e))
-
-
-
+    enqueue_email(**render_invite_email(current_user, links))
+    db.session.commit()
 
-    return jsonify({'success': True}), 200
+    return jsonify({'success': True, 'queued': True}), 200
 
 
 @main_bp.route('/join/<token>')
 def join_group(token):
     """Redirect to the real group URL if token is valid. """
-    invite = InviteToken.query.filter_by(token=token).first_or_404()
-    if invite.expires_at < datetime.utcnow():
+    try:
+        invite = resolve_invite(token)
+    except InviteExpired:
         flash('Invite link has expired.', 'danger')
         return redirect(url_for('main.dashboard'))
-    group = Group.query.get_or_404(invite.group_id)
-    return redirect(group.url)
+    if invite is None:
+        abort(404)
+    record_event('join', invite.user_id, invite.group_id)
+    return redirect(invite.url)
@@ -0,0 +1,11 @@
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is built at import time so a preloading server creates it once in the
+master process and forks workers that share it copy-on-write.
+"""
+from app import create_app
+
+app = create_app()